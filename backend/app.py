@@ -1,19 +1,25 @@
 from flask import Blueprint, Flask, request, jsonify
 from flask_socketio import SocketIO, emit
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta, datetime, timezone
 import os
-import boto3
 import base64
 from flask_cors import CORS
 from utils.classifier import classify_litter
 from utils.helper import *
-from models.detect import detect_litter_from_base64
+from models.detect import Model, load_model
 from utils.ps_helper import load_litter_points
-from collections import Counter
+from utils.db import db, pool_stats
+from utils import session_history, rollups, litter_map, daily_challenge, profile_pictures, profiling, route_chunks
+from utils import detection_events
+from utils.session_store import serialize_route
+from utils.response_cache import cached_json, invalidate_user, SHARED
+from utils.write_behind import CounterAggregator, install_shutdown_hooks
+from utils.structured_log import dropped_records, get_logger
+from utils.model_registry import ModelRegistry
+from bson import ObjectId
 import json
 import uuid
 
@@ -25,26 +31,96 @@ CORS(app)
 # load env variables
 load_dotenv()
 
-# initialize MongoDB connection
-uri = os.getenv("MONGO_URI")
-client = MongoClient(uri)
-db = client["PlogGo"]
+# JSON event logs, written to stdout by a background thread (LOG_* env variables)
+log = get_logger("app")
+
+# MongoDB connection (utils.db) is created lazily, once per worker process
 
 # set up JWT
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 app.config["DEBUG"] = True
 jwt = JWTManager(app)
 
+# sampled cProfile/tracemalloc capture of requests (PROFILE_* env variables)
+profiling.init_flask(app)
+
 # set up boto3 client for S3
-s3 = boto3.client('s3',
-    region_name=os.getenv("AWS_S3_REGION"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+s3 = profile_pictures.make_s3_client()
 bucket_name = os.getenv("AWS_S3_BUCKET_NAME")
 region_name = os.getenv("AWS_S3_REGION")
 
+MODEL_PATH = "./models/best.onnx"  # served when there is no model registry manifest
+LABELS_PATH = "./models/litter_classes.txt"  # Change to the actual labels path
+
+# Define the point system for each litter type
+POINT_SYSTEM = {
+    "Aluminium foil": 2,
+    "Bottle cap": 3,
+    "Bottle": 5,
+    "Broken glass": 4,
+    "Can": 4,
+    "Carton": 3,
+    "Cigarette": 6,
+    "Cup": 3,
+    "Lid": 2,
+    "Other litter": 1,
+    "Other plastic": 4,
+    "Paper": 2,
+    "Plastic bag - wrapper": 5,
+    "Plastic container": 5,
+    "Pop tab": 2,
+    "Straw": 4,
+    "Styrofoam piece": 5,
+    "Unlabeled litter": 1
+}
+
+# versioned models of MODEL_REGISTRY_DIR, hot-swapped when its manifest changes;
+# without a manifest the model at MODEL_PATH is served as version "legacy"
+model_registry = ModelRegistry(
+    load=load_model,
+    fallback=lambda: Model("legacy", MODEL_PATH, LABELS_PATH, POINT_SYSTEM).warm_up(),
+)
+
+# optional write-behind batching of the user counter increments ($inc on total_*)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+user_counters = CounterAggregator(
+    lambda: db.user,
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.25")),
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500")),
+    # cached responses are refreshed again once the buffered totals are written
+    on_flush=lambda user_ids: [invalidate_user(user_id) for user_id in user_ids],
+)
+if WRITE_BEHIND_ENABLED:
+    install_shutdown_hooks(user_counters)
+
+# every detected object (class, confidence, box, model version, location), buffered into per-user-hour buckets
+DETECTION_EVENTS_ENABLED = os.getenv("DETECTION_EVENTS_ENABLED", "true").lower() == "true"
+detection_log = detection_events.DetectionEventBuffer(lambda: db.detection_events)
+if DETECTION_EVENTS_ENABLED:
+    install_shutdown_hooks(detection_log)
+
+def increment_user(user_id, inc):
+    """Apply `$inc` counters to a user, through the write-behind buffer if enabled."""
+    if WRITE_BEHIND_ENABLED:
+        user_counters.increment(user_id, inc)
+    else:
+        db.user.update_one({'user_id': user_id}, {'$inc': inc})
+
 sessions = {}
+_indexes_ready = False
+
+@app.before_request
+def ensure_indexes():
+    """Create the collection indexes once per process, before the first request."""
+    global _indexes_ready
+    if not _indexes_ready:
+        session_history.ensure_indexes(db)
+        rollups.ensure_indexes(db)
+        litter_map.ensure_indexes(db)
+        route_chunks.ensure_indexes(db)
+        profile_pictures.ensure_indexes(db)
+        detection_events.ensure_indexes(db)
+        _indexes_ready = True
             
 def validate_jwt(token):
     """Manually validate a JWT token."""
@@ -67,7 +143,7 @@ def get_current_user():
         return None
     jid = get_jwt()['jti']
 
-    print("JID:", jid)
+    log.debug("token_check", jti=jid)
     if db.token_blacklist.find_one({'jti': jid}) is not None and db.token_blacklist.find_one({'jti': jid}) == jid:
         return None
     return db.user.find_one({'user_id': user_id})
@@ -76,6 +152,31 @@ def get_current_user():
 ### all the routes will expect a JSON body ###
 ### all the routes will return a JSON response ###
 
+# Connection pool utilization of this worker process
+@app.route('/health/db', methods=['GET'])
+def db_pool_health():
+    return jsonify(pool_stats()), 200
+
+# Coalescing statistics of the write-behind user counters
+@app.route('/health/write-behind', methods=['GET'])
+def write_behind_health():
+    return jsonify(enabled=WRITE_BEHIND_ENABLED, **user_counters.stats()), 200
+
+# Buffered detection events of this worker process
+@app.route('/health/detection-events', methods=['GET'])
+def detection_events_health():
+    return jsonify(enabled=DETECTION_EVENTS_ENABLED, **detection_log.stats()), 200
+
+# Model versions served by this worker process, rollout and swap counters
+@app.route('/health/model', methods=['GET'])
+def model_health():
+    return jsonify(model_registry.stats()), 200
+
+# Log records this worker process dropped because its log queue was full
+@app.route('/health/logging', methods=['GET'])
+def logging_health():
+    return jsonify(dropped_records=dropped_records()), 200
+
 # Authentication
 # login route
 @api.route('/login', methods=['POST'])
@@ -89,12 +190,12 @@ def login():
     if not email or not password:
         return jsonify(message="Missing email or password"), 400
     # check if the username and password match
-    print(db)
     user = db.user.find_one({'email': email})
-    print(user)
     if not user:
+        log.info("login_failed", reason="unknown_email")
         return jsonify(message="Invalid email or password"), 401
     elif user and not check_password_hash(user.get('password', ''), password):
+        log.info("login_failed", reason="wrong_password", user_id=user.get("user_id"))
         return jsonify(message="Invalid email or password"), 401
     else:
         # create JWT token - use user_id as identity instead of email
@@ -162,12 +263,12 @@ def register():
     email = data.get('email')
     password = data.get('password')
     if not email or not password:
-        print("Missing email or password")
+        log.info("register_failed", reason="missing_fields")
         return jsonify(message="Missing email or password"), 400
 
     # check if the username already exists
     if db.user.find_one({'email': email}):
-        print("Email already exists")
+        log.info("register_failed", reason="email_exists")
         return jsonify(message="Email already exists"), 400
 
     # hash the password
@@ -217,12 +318,13 @@ def update_user():
         key = f"profile_pics/{user_id}.jpg"
         s3.put_object(Bucket=bucket_name, Key=key, Body=image_data, ContentType='image/jpeg')
 
-        s3_url = f"https://{bucket_name}.s3.{region_name}.amazonaws.com/{key}"
+        s3_url = profile_pictures.public_url(key, bucket_name, region_name)
         update_fields["pfp"] = s3_url
     if "description" in data:
         update_fields["description"] = data["description"]
     if update_fields:
         db.user.update_one({'user_id': user_id}, {"$set": update_fields})
+        invalidate_user(user_id)
     
     user.update(update_fields)  
     
@@ -234,21 +336,49 @@ def update_user():
     }), 200
         
 
+# Get a presigned form to upload a profile picture directly to S3
+@api.route('/user/pfp/upload', methods=['POST'])
+@jwt_required()
+def create_pfp_upload():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = profile_pictures.create_upload(
+            s3, bucket_name, user_id, data.get('content_type', 'image/jpeg')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(upload), 200
+
+# Confirm an uploaded profile picture, thumbnails are generated by pfp_worker.py
+@api.route('/user/pfp', methods=['POST'])
+@jwt_required()
+def confirm_pfp_upload():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    try:
+        profile_pictures.enqueue_thumbnail_job(db, user_id, data.get('key'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'message': 'Profile picture is being processed'}), 202
+
 # Get user information (Profile)
 @api.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    user = get_current_user()
-    if user:
-        return jsonify({
-            "name": user.get("name"),
-            "email": user.get("email"),
-            "pfp": user.get("pfp"),
-            "description": user.get("description"),
-            "streak": user.get("streak"),
-            "badges": [{"title":badge.title, "icon":badge.icon} for badge in user.get("badges")]
-        }), 200
-    return jsonify({"error": "User not found"}), 404
+    def build():
+        user = get_current_user()
+        if user:
+            return {
+                "name": user.get("name"),
+                "email": user.get("email"),
+                "pfp": user.get("pfp"),
+                "description": user.get("description"),
+                "streak": rollups.current_streak(user),
+                "badges": [{"title":badge.title, "icon":badge.icon} for badge in user.get("badges", [])]
+            }, 200
+        return {"error": "User not found"}, 404
+    return cached_json((get_jwt_identity(), 'profile'), build)
 
 @api.route('/badge', methods=['GET'])
 @jwt_required()
@@ -266,20 +396,22 @@ def get_badge():
 @jwt_required()
 def get_leaderboard():
     metric = request.args.get('metric', 'total_points')
-    count = int(request.args.get('count', '10'))
     try:
-        count = int(count)  # Convert to int safely
+        count = int(request.args.get('count', '10'))  # Convert to int safely
     except ValueError:
         return jsonify({"error": "Invalid count parameter"}), 400
-    users = db.user.find().sort(metric, -1).limit(count)
-    leaderboard = []
-    for user in users:
-        leaderboard.append({
-            "user_id": user['user_id'],
-            metric: user.get(metric, 0),
-            "name": user.get('name', '2lazy2setaname')
-        })
-    return jsonify({'metric': metric, 'leaderboard': leaderboard}), 200
+
+    def build():
+        users = db.user.find({}, {'user_id': 1, 'name': 1, metric: 1}).sort(metric, -1).limit(count)
+        leaderboard = []
+        for user in users:
+            leaderboard.append({
+                "user_id": user['user_id'],
+                metric: user.get(metric, 0),
+                "name": user.get('name', '2lazy2setaname')
+            })
+        return {'metric': metric, 'leaderboard': leaderboard}, 200
+    return cached_json((SHARED, 'leaderboard', metric, count), build)
     
 
 # Fetching user data from db, user needs to be authenticated
@@ -293,22 +425,46 @@ def get_user_data():
 @jwt_required()
 def get_metrics():
     user_id = get_jwt_identity()
-    user = db.user.find_one({'user_id': user_id})
-    print("User:", user)
-    return jsonify({'time':user.get("total_time"), 
-                    'distance':user.get("total_distance"),
-                    'steps':user.get("total_steps"),
-                    'calories':int(user.get("total_steps")*0.04),
-                    'curr_streak':user.get("streak"),
-                    'points':user.get("total_points",0),
-                    'litter':user.get("total_litters",0)}), 200 
-
-# Get current daily challenge (pick randomly 1 challenge from challenges db)
+
+    def build():
+        user = db.user.find_one({'user_id': user_id})
+        return {'time':user.get("total_time"), 
+                'distance':user.get("total_distance"),
+                'steps':user.get("total_steps"),
+                'calories':int(user.get("total_steps")*0.04),
+                'curr_streak':rollups.current_streak(user),
+                'points':user.get("total_points",0),
+                'litter':user.get("total_litters",0)}, 200
+    return cached_json((user_id, 'metrics'), build)
+
+# Get the user's activity per day or week between two dates (YYYY-MM-DD)
+@api.route('/metrics/history', methods=['GET'])
+@jwt_required()
+def get_metrics_history():
+    user_id = get_jwt_identity()
+    granularity = request.args.get('granularity', 'day')
+    try:
+        start, end = rollups.parse_range(request.args.get('from'), request.args.get('to'), granularity)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    series = rollups.fetch_series(db, user_id, start, end, granularity)
+    return jsonify({'granularity': granularity, 'series': series}), 200
+
+# Get current daily challenge (chosen once per UTC day from challenges db)
 @api.route('/daily-challenge', methods=['GET'])
 def get_daily_challenge():
-    challenge = db.challenges.aggregate([{"$sample": {"size": 1}}])
+    challenge = daily_challenge.get_daily_challenge(db)
     return jsonify({'challenge': challenge}), 200 
 
+# Get the user's progress towards today's challenge
+@api.route('/daily-challenge/progress', methods=['GET'])
+@jwt_required()
+def get_daily_challenge_progress():
+    user_id = get_jwt_identity()
+    challenge = daily_challenge.get_daily_challenge(db)
+    daily = db.user_daily_stats.find_one({'_id': f"{user_id}:{daily_challenge.utc_day()}"})
+    return jsonify({'challenge': challenge, 'progress': daily_challenge.progress(challenge, daily)}), 200
+
 # Store the litter data in the database
 @api.route('/store-litter', methods=['POST'])
 def store_litter():
@@ -321,7 +477,7 @@ def store_litter():
         return jsonify({"points":points, "litters":results})
 
     except Exception as e:
-        print(e)
+        log.exception("store_litter_failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -334,60 +490,91 @@ def detect_litter():
         data = request.json  # Expect JSON input
         if 'image' not in data:
             return jsonify({'error': 'Missing image field'}), 400
+        try:
+            location = litter_map.parse_location(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         base64_string = data['image']
-        model_path = "./models/best.onnx"  # Change this to your actual model path
-        labels_path = "./models/litter_classes.txt"  # Change to the actual labels path
-
-        # Run detection
-        detections = detect_litter_from_base64(base64_string, model_path, labels_path)
-
-        # Define the point system for each litter type
-        point_sys = {
-            "Aluminium foil": 2,
-            "Bottle cap": 3,
-            "Bottle": 5,
-            "Broken glass": 4,
-            "Can": 4,
-            "Carton": 3,
-            "Cigarette": 6,
-            "Cup": 3,
-            "Lid": 2,
-            "Other litter": 1,
-            "Other plastic": 4,
-            "Paper": 2,
-            "Plastic bag - wrapper": 5,
-            "Plastic container": 5,
-            "Pop tab": 2,
-            "Straw": 4,
-            "Styrofoam piece": 5,
-            "Unlabeled litter": 1
-        }
 
-        # Count detected litter
-        litter_counts = Counter(detections)
+        # Run detection with the model version this user is routed to, and count detected litter
+        model, detections = model_registry.detect(lambda m: m.detect_objects(base64_string), key=user_id,
+                                                  summarize=lambda m, detections: m.count(detections))
+        litter_counts = model.count(detections)
 
-        # calculate the total points
-        total_points = sum(point_sys[litter] * count for litter, count in litter_counts.items())
+        # calculate the total points with that version's point table
+        total_points = model.points_for(litter_counts)
         
         # Update user points in the database   
-        db.user.update_one(
-            {'user_id': user_id},
-            {'$inc': {'total_points': total_points, 'total_litters': sum(litter_counts.values())}}
-        )
+        increment_user(user_id, {'total_points': total_points, 'total_litters': sum(litter_counts.values())})
+        if litter_counts:
+            daily = rollups.record_activity(db, user_id, points=total_points, litters=sum(litter_counts.values()))
+            daily_challenge.update_progress(db, user_id, daily, increment_user)
+
+        # Store where the litter was found for the heatmap
+        if location:
+            litter_map.record_detection(db, user_id, *location, litter_counts, total_points)
+        # Keep each detected object for trend analysis and point audits
+        if DETECTION_EVENTS_ENABLED:
+            detection_log.record(user_id, model, detections, location)
+        invalidate_user(user_id)
 
         # Prepare the JSON result
         result = {
             "points": total_points,
-            "litter": {litter: count for litter, count in litter_counts.items()}
+            "litter": {litter: count for litter, count in litter_counts.items()},
+            "model_version": model.version
         }
         
         points_earn = json.dumps(result)
 
+        log.info("litter_detected", user_id=user_id, points=total_points, items=sum(litter_counts.values()),
+                 model_version=model.version)
         return points_earn
     except Exception as e:
+        log.exception("detect_litter_failed")
         return jsonify({'error': str(e)}), 500
 
+# Litter heatmap for a bounding box (minLon,minLat,maxLon,maxLat) at a map zoom level
+@api.route('/heatmap', methods=['GET'])
+@jwt_required()
+def get_heatmap():
+    try:
+        bbox = litter_map.parse_bbox(request.args.get('bbox'))
+        zoom = int(request.args.get('zoom', '12'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    bucket_zoom, tiles = litter_map.fetch_heatmap(db, bbox, zoom)
+    return jsonify({'zoom': bucket_zoom, 'tiles': tiles}), 200
+
+# Detected litter per class and hour or day (from/to YYYY-MM-DD), everyone's or only mine, optionally within a bbox
+@api.route('/detections/trends', methods=['GET'])
+@jwt_required()
+def get_detection_trends():
+    interval = request.args.get('interval', 'day')
+    try:
+        start, end = detection_events.parse_range(request.args.get('from'), request.args.get('to'), interval)
+        bbox = litter_map.parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    user_id = get_jwt_identity() if request.args.get('mine', 'false').lower() == 'true' else None
+    series = detection_events.class_counts_over_time(db, start, end, interval, user_id, bbox)
+    return jsonify({'interval': interval, 'series': series}), 200
+
+# Detected litter per class and map tile, with the mean confidence per class
+@api.route('/detections/regions', methods=['GET'])
+@jwt_required()
+def get_detection_regions():
+    try:
+        start, end = detection_events.parse_range(request.args.get('from'), request.args.get('to'), 'day')
+        bbox = litter_map.parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+        zoom = int(request.args.get('zoom', detection_events.BUCKET_ZOOM))
+        tiles = detection_events.class_counts_by_region(db, start, end, zoom, bbox)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    zoom = min(zoom, detection_events.BUCKET_ZOOM)
+    return jsonify({'zoom': zoom, 'tiles': tiles}), 200
+
 # Store user session history (distance, activities, etc.)
 @api.route('/end_session', methods=['POST'])
 @jwt_required()
@@ -418,36 +605,75 @@ def store_session_history():
         }
         
         # Update user stats
-        db.user.update_one(
-            {'user_id': user_id},
-            {'$inc': {
-                'total_steps': data['steps'],
-                'total_distance': data['distancesTravelled'],
-                'total_time': data['elapsedTime']
-            }}
+        increment_user(user_id, {
+            'total_steps': data['steps'],
+            'total_distance': data['distancesTravelled'],
+            'total_time': data['elapsedTime']
+        })
+        daily = rollups.record_activity(
+            db, user_id, session_data['endTime'],
+            steps=data['steps'],
+            distance=data['distancesTravelled'],
+            time=data['elapsedTime'],
+            sessions=1
         )
+        daily_challenge.update_progress(db, user_id, daily, increment_user)
+        invalidate_user(user_id)
         
         # Check badges
         new_badges = db.badge.find({"steps_required": {"$lte": data['steps']}})
         badge_ids = [badge["_id"] for badge in new_badges]
-        print("New badges:", badge_ids)
+        log.debug("badges_checked", user_id=user_id, badges=badge_ids)
         if badge_ids:
             db.users.update_one(
                 {"user_id": user_id}, 
                 {"$addToSet": {"badges": {"$each": badge_ids}}}  # Add badges without duplicates
             )
-            print("Badges awarded!")
+            log.info("badges_awarded", user_id=user_id, badges=badge_ids)
         
         # Insert the session data into MongoDB collection
         result = db['plogging_session'].insert_one(session_data)
-        print('inserted', result.inserted_id, 'to session collection')
+        log.info("session_stored", user_id=user_id, session_id=str(result.inserted_id), steps=data['steps'])
         # Return a success response with inserted session ID
         return jsonify({'message': 'data stored successfully'}), 200
 
     except Exception as e:
-        print("Error storing session history:", e)  # Log the error
+        log.exception("store_session_failed", user_id=get_jwt_identity())
         return jsonify({'error': str(e)}), 500
 
+# List the user's past sessions, newest first, using keyset pagination
+@api.route('/sessions', methods=['GET'])
+@jwt_required()
+def list_sessions():
+    user_id = get_jwt_identity()
+    try:
+        limit = session_history.parse_page_size(request.args.get('limit'))
+        summaries, next_cursor = session_history.fetch_page(
+            db, user_id, cursor=request.args.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'sessions': summaries, 'next_cursor': next_cursor}), 200
+
+# Fetch the route of a single session
+@api.route('/sessions/<session_id>/route', methods=['GET'])
+@jwt_required()
+def get_session_route(session_id):
+    user_id = get_jwt_identity()
+    if not ObjectId.is_valid(session_id):
+        return jsonify({'error': 'Invalid session id'}), 400
+    session = db.plogging_session.find_one(
+        {'_id': ObjectId(session_id), 'user_id': user_id}, {'routes': 1, 'session_key': 1, 'route_chunks': 1}
+    )
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    # sessions tracked over the websocket store their route in route_chunks
+    if session.get('route_chunks'):
+        routes = serialize_route(*route_chunks.load_route(db, session['session_key']))
+    else:
+        routes = session.get('routes', [])
+    return jsonify({'session_id': session_id, 'routes': routes}), 200
+
 app.register_blueprint(api)
 
 if __name__ == '__main__':
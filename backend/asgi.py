@@ -0,0 +1,426 @@
+"""
+Asyncio serving mode for the REST API.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 80 --workers 2
+
+The hot /api routes are served natively on the event loop with the async
+Mongo driver, and litter inference runs in a process pool so it never blocks
+the loop. Every other route falls through to the Flask app in app.py, which
+also stays available on its own under gunicorn.
+"""
+import asyncio
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app as flask_app, model_registry, WRITE_BEHIND_ENABLED, user_counters
+from app import DETECTION_EVENTS_ENABLED, detection_log
+from utils import daily_challenge, detection_events, litter_map, rollups, route_chunks, session_history
+from utils.db import db as sync_db, get_async_db
+from utils.response_cache import cache, invalidate_user, SHARED
+from utils.session_store import serialize_route
+
+JWT_SECRET = os.getenv("JWT_SECRET_KEY")
+# same lifetime as flask_jwt_extended's default access tokens
+ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
+
+INFERENCE_WORKERS = int(os.getenv("ASGI_INFERENCE_WORKERS", os.cpu_count() or 1))
+inference_pool = None
+
+
+def create_access_token(identity):
+    """Create an access token with the claims flask_jwt_extended expects."""
+    now = datetime.now(timezone.utc)
+    claims = {
+        "fresh": False,
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "type": "access",
+        "sub": identity,
+        "nbf": now,
+        "exp": now + ACCESS_TOKEN_EXPIRES,
+    }
+    return jwt.encode(claims, JWT_SECRET, algorithm="HS256")
+
+
+def jwt_required(handler):
+    """Reject requests without a valid access token, else set request.state.user_id."""
+    @wraps(handler)
+    async def wrapper(request):
+        header = request.headers.get("Authorization", "")
+        if not header.startswith("Bearer "):
+            return JSONResponse({"msg": "Missing Authorization Header"}, status_code=401)
+        try:
+            claims = jwt.decode(header[len("Bearer "):], JWT_SECRET, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            return JSONResponse({"msg": "Token has expired"}, status_code=401)
+        except jwt.InvalidTokenError:
+            return JSONResponse({"msg": "Invalid token"}, status_code=422)
+        if claims.get("type") != "access":
+            return JSONResponse({"msg": "Only access tokens are allowed"}, status_code=422)
+        request.state.user_id = claims["sub"]
+        return await handler(request)
+    return wrapper
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def increment_user(db, user_id, inc):
+    """Apply `$inc` counters to a user, through the write-behind buffer if enabled."""
+    if WRITE_BEHIND_ENABLED:
+        user_counters.increment(user_id, inc)
+    else:
+        await db.user.update_one({'user_id': user_id}, {'$inc': inc})
+
+
+async def cached_json(request, key, build):
+    """
+    Async counterpart of response_cache.cached_json sharing the same cache:
+    a matching If-None-Match is answered with 304 without calling `build`.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        payload, status = await build()
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        if status != 200:
+            return Response(body, status_code=status, media_type="application/json")
+        etag = cache.put(key, body)
+    else:
+        etag, body = entry
+
+    quoted = f'"{etag}"'
+    if_none_match = [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]
+    if quoted in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers={"ETag": quoted})
+    return Response(body, media_type="application/json", headers={"ETag": quoted})
+
+
+async def login(request):
+    data = await json_body(request)
+    if data is None:
+        return JSONResponse({"message": "Missing JSON in request"}, status_code=405)
+    email = data.get("email")
+    password = data.get("password")
+    if not email or not password:
+        return JSONResponse({"message": "Missing email or password"}, status_code=400)
+    user = await get_async_db().user.find_one({"email": email}, {"user_id": 1, "password": 1})
+    # password hashing is CPU bound, keep it off the event loop
+    if not user or not await run_in_threadpool(check_password_hash, user.get("password", ""), password):
+        return JSONResponse({"message": "Invalid email or password"}, status_code=401)
+    user_id = user.get("user_id")
+    return JSONResponse({"user_id": user_id, "access_token": create_access_token(user_id)})
+
+
+async def register(request):
+    data = await json_body(request)
+    if not data:
+        return JSONResponse({"message": "Missing JSON in request"}, status_code=400)
+    email = data.get("email")
+    password = data.get("password")
+    if not email or not password:
+        return JSONResponse({"message": "Missing email or password"}, status_code=400)
+    db = get_async_db()
+    if await db.user.find_one({"email": email}, {"_id": 1}):
+        return JSONResponse({"message": "Email already exists"}, status_code=400)
+    await db.user.insert_one({
+        'name': 'New User',
+        'pfp': 'https://example.com/default_profile_pic.jpg',
+        'description': '',
+        'total_steps': 0,
+        'total_distance': 0,
+        'total_time': 0,
+        'total_points': 0,
+        'total_litters': 0,
+        'streak': 0,
+        'highest_streak': 0,
+        'user_id': str(uuid.uuid4()),
+        'email': email,
+        'password': await run_in_threadpool(generate_password_hash, password),
+    })
+    return JSONResponse({"message": "User registered successfully"}, status_code=201)
+
+
+@jwt_required
+async def get_profile(request):
+    user_id = request.state.user_id
+
+    async def build():
+        user = await get_async_db().user.find_one({"user_id": user_id})
+        if user:
+            return {
+                "name": user.get("name"),
+                "email": user.get("email"),
+                "pfp": user.get("pfp"),
+                "description": user.get("description"),
+                "streak": rollups.current_streak(user),
+                "badges": [{"title": badge.title, "icon": badge.icon} for badge in user.get("badges", [])]
+            }, 200
+        return {"error": "User not found"}, 404
+    return await cached_json(request, (user_id, 'profile'), build)
+
+
+@jwt_required
+async def get_leaderboard(request):
+    metric = request.query_params.get('metric', 'total_points')
+    try:
+        count = int(request.query_params.get('count', '10'))
+    except ValueError:
+        return JSONResponse({"error": "Invalid count parameter"}, status_code=400)
+
+    async def build():
+        users = get_async_db().user.find({}, {'user_id': 1, 'name': 1, metric: 1}).sort(metric, -1).limit(count)
+        leaderboard = [{
+            "user_id": user['user_id'],
+            metric: user.get(metric, 0),
+            "name": user.get('name', '2lazy2setaname')
+        } async for user in users]
+        return {'metric': metric, 'leaderboard': leaderboard}, 200
+    return await cached_json(request, (SHARED, 'leaderboard', metric, count), build)
+
+
+@jwt_required
+async def get_user_data(request):
+    return JSONResponse({'user_id': request.state.user_id})
+
+
+@jwt_required
+async def get_metrics(request):
+    user_id = request.state.user_id
+
+    async def build():
+        user = await get_async_db().user.find_one({'user_id': user_id})
+        return {'time': user.get("total_time"),
+                'distance': user.get("total_distance"),
+                'steps': user.get("total_steps"),
+                'calories': int(user.get("total_steps") * 0.04),
+                'curr_streak': rollups.current_streak(user),
+                'points': user.get("total_points", 0),
+                'litter': user.get("total_litters", 0)}, 200
+    return await cached_json(request, (user_id, 'metrics'), build)
+
+
+@jwt_required
+async def get_metrics_history(request):
+    granularity = request.query_params.get('granularity', 'day')
+    try:
+        start, end = rollups.parse_range(
+            request.query_params.get('from'), request.query_params.get('to'), granularity
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    series = await rollups.fetch_series_async(get_async_db(), request.state.user_id, start, end, granularity)
+    return JSONResponse({'granularity': granularity, 'series': series})
+
+
+async def get_daily_challenge(request):
+    challenge = await daily_challenge.get_daily_challenge_async(get_async_db())
+    return JSONResponse({'challenge': challenge})
+
+
+@jwt_required
+async def get_daily_challenge_progress(request):
+    db = get_async_db()
+    challenge = await daily_challenge.get_daily_challenge_async(db)
+    daily = await db.user_daily_stats.find_one({'_id': f"{request.state.user_id}:{daily_challenge.utc_day()}"})
+    return JSONResponse({'challenge': challenge, 'progress': daily_challenge.progress(challenge, daily)})
+
+
+def classify(base64_string, user_id, location):
+    # runs in an inference_pool process, which loads and hot-swaps models with its own copy of the registry;
+    # the detection events are buffered by the serving process
+    model, detections = model_registry.detect(lambda m: m.detect_objects(base64_string), key=user_id,
+                                              summarize=lambda m, detections: m.count(detections))
+    litter_counts = model.count(detections)
+    events = detection_events.make_events(model, detections, location)
+    return model.version, litter_counts, model.points_for(litter_counts), events
+
+
+@jwt_required
+async def detect_litter(request):
+    user_id = request.state.user_id
+    data = await json_body(request)
+    if not data or 'image' not in data:
+        return JSONResponse({'error': 'Missing image field'}, status_code=400)
+    try:
+        location = litter_map.parse_location(data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    try:
+        loop = asyncio.get_running_loop()
+        model_version, litter_counts, total_points, events = await loop.run_in_executor(
+            inference_pool, classify, data['image'], user_id, location
+        )
+
+        db = get_async_db()
+        await increment_user(db, user_id, {'total_points': total_points, 'total_litters': sum(litter_counts.values())})
+        if litter_counts:
+            daily = await rollups.record_activity_async(
+                db, user_id, points=total_points, litters=sum(litter_counts.values())
+            )
+            await daily_challenge.update_progress_async(db, user_id, daily, increment_user)
+        if location:
+            await litter_map.record_detection_async(db, user_id, *location, litter_counts, total_points)
+        if DETECTION_EVENTS_ENABLED:
+            detection_log.add(user_id, events, location)
+        invalidate_user(user_id)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+    return JSONResponse({"points": total_points, "litter": dict(litter_counts), "model_version": model_version})
+
+
+@jwt_required
+async def store_session_history(request):
+    user_id = request.state.user_id
+    data = await json_body(request)
+    if not data:
+        return JSONResponse({'error': 'No data received'}, status_code=400)
+    for field in ['routes', 'distancesTravelled', 'steps', 'timeStart', 'timeEnd', 'elapsedTime', 'sessionid']:
+        if field not in data:
+            return JSONResponse({'error': f'Missing {field} field'}, status_code=400)
+
+    try:
+        session_data = {
+            "user_id": user_id,
+            "startTime": datetime.fromtimestamp(data['timeStart'] // 1000, tz=timezone.utc),
+            "endTime": datetime.fromtimestamp(data['timeEnd'] // 1000, tz=timezone.utc),
+            "elapsedTime": data['elapsedTime'],
+            "routes": data['routes'],
+            "distancesTravelled": data['distancesTravelled'],
+            "steps": data['steps'],
+        }
+        db = get_async_db()
+        await increment_user(db, user_id, {
+            'total_steps': data['steps'],
+            'total_distance': data['distancesTravelled'],
+            'total_time': data['elapsedTime']
+        })
+        daily = await rollups.record_activity_async(
+            db, user_id, session_data['endTime'],
+            steps=data['steps'],
+            distance=data['distancesTravelled'],
+            time=data['elapsedTime'],
+            sessions=1
+        )
+        await daily_challenge.update_progress_async(db, user_id, daily, increment_user)
+        invalidate_user(user_id)
+
+        badge_ids = [badge["_id"] async for badge in
+                     db.badge.find({"steps_required": {"$lte": data['steps']}}, {"_id": 1})]
+        if badge_ids:
+            await db.users.update_one(
+                {"user_id": user_id},
+                {"$addToSet": {"badges": {"$each": badge_ids}}}
+            )
+        await db['plogging_session'].insert_one(session_data)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    return JSONResponse({'message': 'data stored successfully'})
+
+
+@jwt_required
+async def list_sessions(request):
+    try:
+        limit = session_history.parse_page_size(request.query_params.get('limit'))
+        summaries, next_cursor = await session_history.fetch_page_async(
+            get_async_db(), request.state.user_id, cursor=request.query_params.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    return JSONResponse({'sessions': summaries, 'next_cursor': next_cursor})
+
+
+@jwt_required
+async def get_session_route(request):
+    session_id = request.path_params['session_id']
+    if not ObjectId.is_valid(session_id):
+        return JSONResponse({'error': 'Invalid session id'}, status_code=400)
+    db = get_async_db()
+    session = await db.plogging_session.find_one(
+        {'_id': ObjectId(session_id), 'user_id': request.state.user_id}, {'routes': 1, 'session_key': 1, 'route_chunks': 1}
+    )
+    if not session:
+        return JSONResponse({'error': 'Session not found'}, status_code=404)
+    # sessions tracked over the websocket store their route in route_chunks
+    if session.get('route_chunks'):
+        routes = serialize_route(*await route_chunks.load_route_async(db, session['session_key']))
+    else:
+        routes = session.get('routes', [])
+    return JSONResponse({'session_id': session_id, 'routes': routes})
+
+
+@jwt_required
+async def get_heatmap(request):
+    try:
+        bbox = litter_map.parse_bbox(request.query_params.get('bbox'))
+        zoom = int(request.query_params.get('zoom', '12'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    bucket_zoom, tiles = await litter_map.fetch_heatmap_async(get_async_db(), bbox, zoom)
+    return JSONResponse({'zoom': bucket_zoom, 'tiles': tiles})
+
+
+def ensure_indexes():
+    session_history.ensure_indexes(sync_db)
+    rollups.ensure_indexes(sync_db)
+    litter_map.ensure_indexes(sync_db)
+    route_chunks.ensure_indexes(sync_db)
+    detection_events.ensure_indexes(sync_db)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global inference_pool
+    inference_pool = ProcessPoolExecutor(max_workers=INFERENCE_WORKERS)
+    await run_in_threadpool(ensure_indexes)
+    try:
+        yield
+    finally:
+        inference_pool.shutdown(wait=True)
+
+
+routes = [
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/register', register, methods=['POST']),
+    Route('/api/profile', get_profile, methods=['GET']),
+    Route('/api/leaderboard', get_leaderboard, methods=['GET']),
+    Route('/api/user/data', get_user_data, methods=['GET']),
+    Route('/api/metrics', get_metrics, methods=['GET']),
+    Route('/api/metrics/history', get_metrics_history, methods=['GET']),
+    Route('/api/daily-challenge', get_daily_challenge, methods=['GET']),
+    Route('/api/daily-challenge/progress', get_daily_challenge_progress, methods=['GET']),
+    Route('/api/detect-litter', detect_litter, methods=['POST']),
+    Route('/api/end_session', store_session_history, methods=['POST']),
+    Route('/api/sessions', list_sessions, methods=['GET']),
+    Route('/api/sessions/{session_id}/route', get_session_route, methods=['GET']),
+    Route('/api/heatmap', get_heatmap, methods=['GET']),
+    # everything else (profile updates, uploads, auth extras, health) is served by Flask
+    Mount('/', app=WSGIMiddleware(flask_app)),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
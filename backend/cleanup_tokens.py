@@ -1,17 +1,11 @@
 import schedule
 import time
-import os
-import certifi
-from pymongo import MongoClient
 from datetime import datetime, timezone
 from dotenv import load_dotenv
+from utils.db import db
 
 load_dotenv()
 
-# initialize MongoDB connection
-uri = os.getenv("MONGO_URI")
-client = MongoClient(uri, tlsCAFile=certifi.where())
-db = client["PlogGo"]
 expired_tokens = db['token_blacklist']
 
 def remove_expired_tokens():
@@ -1,14 +1,24 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+from collections import Counter
 from utils.ps_helper import load_litter_points
-from detect import detect_litter_from_base64
+from models.detect import Model, load_model
+from utils.model_registry import ModelRegistry
+from utils.profiling import init_flask as init_profiling
+from utils.structured_log import get_logger
 import json
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 
+# JSON event logs, written to stdout by a background thread (LOG_* env variables)
+log = get_logger("litter-classifier")
+
+# sampled cProfile/tracemalloc capture of requests (PROFILE_* env variables)
+init_profiling(app)
+
 # Load the point system for litter types
 POINT_SYSTEM = {
     "Aluminium foil": 2,
@@ -31,16 +41,33 @@ POINT_SYSTEM = {
     "Unlabeled litter": 1
 }
 
-# Alternately, if there's a points file, we could load it like this:
-# try:
-#     POINT_SYSTEM = load_litter_points("path/to/points/file.txt")
-# except Exception as e:
-#     print(f"Error loading points system: {e}")
+# versioned models of MODEL_REGISTRY_DIR, hot-swapped when its manifest changes;
+# without a manifest this model is served as version "legacy"
+MODEL_PATH = os.environ.get('LITTER_MODEL_PATH', './models/best.onnx')
+LABELS_PATH = './models/litter_classes.txt'
+model_registry = ModelRegistry(
+    load=load_model,
+    fallback=lambda: Model("legacy", MODEL_PATH, LABELS_PATH, POINT_SYSTEM).warm_up(),
+)
+
+def count_litter(model, base64_string):
+    freq_predictions = Counter(model.detect_base64(base64_string))
+
+    # merge bottle cap and bottle counts
+    if 'Bottle' in freq_predictions:
+        freq_predictions['Bottle'] += freq_predictions.get('Bottle cap', 0)
+        freq_predictions.pop('Bottle cap', None)
+
+    return freq_predictions
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"})
 
+@app.route('/health/model', methods=['GET'])
+def model_health():
+    return jsonify(model_registry.stats())
+
 @app.route('/classify', methods=['POST'])
 def classify_image():
     try:
@@ -51,31 +78,31 @@ def classify_image():
         base64_string = data['image']
         user_id = data.get('user_id', None)  # Optional user ID for logging/tracking
 
-        # Classify the litter in the image
-        detection_results = detect_litter_from_base64(base64_string)
+        # Classify the litter in the image, with the model version this user is routed to
+        model, detection_results = model_registry.detect(lambda m: count_litter(m, base64_string), key=user_id)
         
-        # Calculate points based on the point system
-        total_points = sum(POINT_SYSTEM.get(litter_type, 1) * count 
-                          for litter_type, count in detection_results.items())
+        # Calculate points based on that version's point system
+        total_points = model.points_for(detection_results)
         
         # Prepare the response
         result = {
             "points": total_points,
-            "litters": detection_results
+            "litters": detection_results,
+            "model_version": model.version
         }
         
+        log.debug("classified", user_id=user_id, points=total_points, litters=sum(detection_results.values()),
+                  model_version=model.version)
         return jsonify(result)
     
     except Exception as e:
-        print(f"Error in litter classification: {e}")
+        log.exception("classify_failed")
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
     port = int(os.environ.get('LITTER_CLASSIFIER_PORT', 5002))
-    print(f"Port: {port}")
     debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     
-    print(f"Starting litter classification server on port {port}")
-    print(f"Debug mode: {debug}")
+    log.info("server_start", port=port, debug=debug)
     
     app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
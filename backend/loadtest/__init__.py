@@ -0,0 +1,15 @@
+"""
+End-to-end load test of the REST API and the ws-server.
+
+    python -m loadtest run --users 50 --duration 120 --output results/$(git rev-parse --short HEAD).json
+    python -m loadtest compare results/base.json results/new.json
+    python -m loadtest codec
+
+`run` starts both servers against an in-memory database (see
+loadtest/stand_in.py) unless --api-url/--ws-url point at running servers.
+`codec` measures the size and encode/decode cost of ws-server messages as
+JSON and as MessagePack payloads (see utils/codec.py).
+
+loadtest/ws_bench.py benchmarks a single ws-server process with thousands
+of simulated tracking clients and can record and replay their traffic.
+"""
@@ -0,0 +1,147 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from loadtest import stats
+from loadtest.scenarios import VirtualUser, sample_image
+from loadtest.stand_in import BACKEND_DIR
+
+
+def start_stand_in(args):
+    command = [sys.executable, "-m", "loadtest.stand_in",
+               "--api-port", str(args.api_port), "--ws-port", str(args.ws_port)]
+    if args.mongo_uri:
+        command += ["--mongo-uri", args.mongo_uri]
+    if args.stub_detector:
+        command.append("--stub-detector")
+    process = subprocess.Popen(command, cwd=BACKEND_DIR)
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The stand-in servers exited during start up")
+        try:
+            requests.get(api_url + "/health/db", timeout=1)
+            requests.get(f"http://127.0.0.1:{args.ws_port}/health/db", timeout=1)
+            return process, api_url, f"http://127.0.0.1:{args.ws_port}"
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("The stand-in servers did not start within 60 seconds")
+
+
+def run(args):
+    process = None
+    if args.api_url and args.ws_url:
+        api_url, ws_url = args.api_url, args.ws_url
+    else:
+        process, api_url, ws_url = start_stand_in(args)
+
+    recorder = stats.Recorder()
+    image = sample_image()
+    deadline = time.monotonic() + args.duration
+    users = [
+        VirtualUser(api_url, ws_url, recorder, image, locations=args.locations,
+                    detections=args.detections, interval=args.interval, batch_size=args.batch_size, seed=i)
+        for i in range(args.users)
+    ]
+    threads = []
+    try:
+        for user in users:
+            thread = threading.Thread(target=user.run, args=(deadline,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.ramp_up / max(args.users, 1))
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0) + 30)
+    finally:
+        recorder.stop()
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    config = {name: value for name, value in vars(args).items() if name not in ("command", "output")}
+    config["mongo"] = args.mongo_uri or ("external" if process is None else "in-memory")
+    report = stats.build_report(recorder, config)
+    print_summary(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        stats.save_report(report, args.output)
+        print(f"Results written to {args.output}")
+
+
+def print_summary(report):
+    print(f"\n{'endpoint':<28}{'ok':>8}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:<28}{row['count']:>8}{row['errors']:>8}{_fmt(row['throughput_rps']):>9}"
+              f"{_fmt(row['p50_ms']):>9}{_fmt(row['p95_ms']):>9}{_fmt(row['p99_ms']):>9}")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(args):
+    baseline, current = stats.load_report(args.baseline), stats.load_report(args.current)
+    print(f"{args.metric}: {baseline.get('commit')} -> {current.get('commit')}")
+    regressed = False
+    for endpoint, before, after, change, worse in stats.compare(baseline, current, args.metric, args.threshold):
+        change_text = "-" if change is None else f"{change:+.1%}"
+        print(f"{endpoint:<28}{_fmt(before):>10}{_fmt(after):>10}{change_text:>10}{'  REGRESSION' if worse else ''}")
+        regressed = regressed or worse
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Drive simulated ploggers and report latencies")
+    run_parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    run_parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    run_parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which users start")
+    run_parser.add_argument("--locations", type=int, default=30, help="Location updates per session")
+    # 0.5 s stays within the ws-server's default admission control (LOCATION_MAX_RATE=2,
+    # LOCATION_MIN_INTERVAL_MS=200), which batched points pass too; faster updates are mostly
+    # dropped and distances stay near zero
+    run_parser.add_argument("--interval", type=float, default=0.5, help="Seconds between location updates")
+    run_parser.add_argument("--batch-size", type=int, default=1,
+                            help="Send location updates in location_batch events of this many points")
+    run_parser.add_argument("--detections", type=int, default=2, help="Detections per session")
+    run_parser.add_argument("--api-url", help="Use a running API instead of the stand-in")
+    run_parser.add_argument("--ws-url", help="Use a running ws-server instead of the stand-in")
+    run_parser.add_argument("--api-port", type=int, default=5100)
+    run_parser.add_argument("--ws-port", type=int, default=5101)
+    run_parser.add_argument("--mongo-uri", help="Run the stand-in against this MongoDB instead of in memory")
+    run_parser.add_argument("--stub-detector", action="store_true", help="Skip ONNX inference in the stand-in")
+    run_parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative increase reported as a regression (exit status 1)")
+
+    codec_parser = commands.add_parser("codec", help="Compare JSON and MessagePack payload sizes and costs")
+    codec_parser.add_argument("--repeat", type=int, default=2000, help="Iterations per measurement")
+    codec_parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "codec":
+        from loadtest.codec_bench import run_codec_benchmark
+        run_codec_benchmark(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Per-message cost of the ws-server payload codecs.
+
+Every message is encoded as a complete Socket.IO event packet, the way the
+server sends it: JSON payloads as one text frame, MessagePack payloads as a
+text frame plus a binary attachment.
+"""
+import json
+import time
+
+from socketio import packet
+
+from utils import codec
+
+
+def sample_messages():
+    """Representative payloads of the events ws-server sends and receives."""
+    point = {"latitude": 43.6629871, "longitude": -79.3957234, "timestamp": 1760000000123}
+    return {
+        "location_update": ("location_update", dict(point, sessionId="0b8e6f5e-8a4e-4b4e-9b76-2f3c9a1d7e11")),
+        "location_batch (50)": ("location_batch", {
+            "sessionId": "0b8e6f5e-8a4e-4b4e-9b76-2f3c9a1d7e11",
+            "points": [dict(point, seq=seq, latitude=point["latitude"] + seq * 1e-5) for seq in range(50)],
+        }),
+        "location ack": ("ack", {"accepted": True}),
+        "session_id": ("session_id", {"sessionId": "0b8e6f5e-8a4e-4b4e-9b76-2f3c9a1d7e11"}),
+        "tracking_completed": ("tracking_completed", {
+            "message": "Tracking session completed successfully",
+            "duration": 1834.226,
+            "distance": 2.4173,
+            "steps": 3184,
+            "session_id": "6ad6181b02765e7af93e57b9",
+        }),
+        "group_snapshot (100)": ("group_snapshot", {
+            "groupId": "cleanup-1", "tick": 412, "totals": {"members": 100, "distance": 84211},
+            "positions": [[index, 43.66299 + index * 1e-4, -79.39572, 840 + index] for index in range(100)],
+        }),
+    }
+
+
+def _frames(event, payload):
+    encoded = packet.Packet(packet.EVENT, data=[event, payload]).encode()
+    return encoded if isinstance(encoded, list) else [encoded]
+
+
+def _decode(frames):
+    decoded = packet.Packet(encoded_packet=frames[0])
+    for attachment in frames[1:]:
+        decoded.add_attachment(attachment)
+    return decoded.data
+
+
+def _size(frames):
+    return sum(len(frame.encode() if isinstance(frame, str) else frame) for frame in frames)
+
+
+def _per_call_us(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def measure(event, payload, repeat=2000):
+    """Bytes on the wire and encode/decode microseconds of one message in both codecs."""
+    json_frames = _frames(event, payload)
+    binary = codec.encode(payload)
+    binary_frames = _frames(event, binary)
+    return {
+        "json_bytes": _size(json_frames),
+        "msgpack_bytes": _size(binary_frames),
+        "json_encode_us": _per_call_us(lambda: _frames(event, payload), repeat),
+        "msgpack_encode_us": _per_call_us(lambda: _frames(event, codec.encode(payload)), repeat),
+        "json_decode_us": _per_call_us(lambda: _decode(json_frames), repeat),
+        "msgpack_decode_us": _per_call_us(lambda: codec.decode(_decode(binary_frames)[1]), repeat),
+    }
+
+
+def run_codec_benchmark(args):
+    if codec.msgpack is None:
+        raise SystemExit("msgpack is not installed")
+    print(f"{'message':<22}{'JSON B':>8}{'msgpack B':>11}{'saved':>8}"
+          f"{'enc JSON':>10}{'enc mp':>9}{'dec JSON':>10}{'dec mp':>9}   (microseconds)")
+    results = {}
+    for name, (event, payload) in sample_messages().items():
+        result = results[name] = measure(event, payload, args.repeat)
+        saved = 1 - result["msgpack_bytes"] / result["json_bytes"]
+        print(f"{name:<22}{result['json_bytes']:>8}{result['msgpack_bytes']:>11}{saved:>8.0%}"
+              f"{result['json_encode_us']:>10.1f}{result['msgpack_encode_us']:>9.1f}"
+              f"{result['json_decode_us']:>10.1f}{result['msgpack_decode_us']:>9.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
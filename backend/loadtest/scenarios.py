@@ -0,0 +1,157 @@
+import base64
+import io
+import math
+import random
+import threading
+import time
+import uuid
+
+import requests
+import socketio
+
+# a walk around Toronto city hall, one step of roughly 5 m per update
+START = (43.6534, -79.3841)
+STEP_DEGREES = 0.00005
+
+
+def sample_image(size=320):
+    """Return a base64 JPEG of random noise to submit for detection."""
+    from PIL import Image
+    import numpy as np
+
+    pixels = np.random.default_rng(0).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class VirtualUser:
+    """
+    One simulated plogger.
+
+    Registers and logs in once, then repeats plogging sessions until
+    `deadline`: start tracking over Socket.IO, stream location updates,
+    submit detections, finish tracking, store the session through the API
+    and look at the leaderboard.
+    """
+
+    def __init__(self, api_url, ws_url, recorder, image, locations=30, detections=2,
+                 interval=0.0, batch_size=1, seed=None):
+        self.api_url = api_url.rstrip("/")
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.image = image
+        self.locations = locations
+        self.detections = detections
+        self.interval = interval
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.http = requests.Session()
+        self.email = f"loadtest-{uuid.uuid4().hex}@example.com"
+        self.password = uuid.uuid4().hex
+        self.token = None
+
+    def _request(self, method, path, **kwargs):
+        endpoint = f"{method} {path}"
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.api_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(endpoint, time.perf_counter() - start, ok=False)
+            raise
+        self.recorder.record(endpoint, time.perf_counter() - start, ok=response.ok)
+        return response
+
+    def _send_batch(self, client, session_id, points):
+        ack = self.recorder.timed("ws location_batch", lambda: client.call(
+            "location_batch", {"sessionId": session_id, "points": points}, timeout=10))
+        if not ack or ack.get("lastSeq") != points[-1]["seq"]:
+            self.recorder.record("ws location_batch", 0, ok=False)
+
+    def sign_up(self):
+        credentials = {"email": self.email, "password": self.password}
+        self._request("POST", "/api/register", json=credentials)
+        response = self._request("POST", "/api/login", json=credentials)
+        response.raise_for_status()
+        self.token = response.json()["access_token"]
+        self.http.headers["Authorization"] = f"Bearer {self.token}"
+
+    def run(self, deadline):
+        try:
+            self.sign_up()
+        except Exception as e:
+            print(f"{self.email}: sign up failed: {e}")
+            return
+        while time.monotonic() < deadline:
+            try:
+                self.plog(deadline)
+            except Exception as e:
+                print(f"{self.email}: session failed: {e}")
+                time.sleep(1)
+
+    def plog(self, deadline):
+        received = {}
+        done = threading.Event()
+        client = socketio.Client(reconnection=False)
+        client.on("session_id", lambda data: received.update(session=data["sessionId"]))
+        client.on("tracking_completed", lambda data: (received.update(completed=data), done.set()))
+        client.on("error", lambda data: (received.setdefault("errors", []).append(data),
+                                         self.recorder.record("ws error event", 0, ok=False)))
+
+        self.recorder.timed("ws connect", lambda: client.connect(self.ws_url, wait_timeout=10))
+        try:
+            self.recorder.timed("ws start_tracking",
+                                lambda: client.call("start_tracking", {"token": self.token}, timeout=10))
+            session_id = received.get("session")
+            if not session_id:
+                self.recorder.record("ws start_tracking", 0, ok=False)
+                raise RuntimeError(f"no session id: {received.get('errors')}")
+
+            start = time.time()
+            route = []
+            pending = []
+            latitude, longitude = START
+            for _ in range(self.locations):
+                angle = self.random.uniform(0, 2 * math.pi)
+                latitude += STEP_DEGREES * math.sin(angle)
+                longitude += STEP_DEGREES * math.cos(angle)
+                point = {"latitude": latitude, "longitude": longitude, "timestamp": int(time.time() * 1000)}
+                route.append(point)
+                if self.batch_size > 1:
+                    pending.append(dict(point, seq=len(route)))
+                    if len(pending) >= self.batch_size:
+                        self._send_batch(client, session_id, pending)
+                        pending = []
+                else:
+                    self.recorder.timed("ws location_update",
+                                        lambda: client.call("location_update", dict(point, sessionId=session_id), timeout=10))
+                if self.interval:
+                    time.sleep(self.interval)
+                if time.monotonic() >= deadline:
+                    break
+
+            if pending:
+                self._send_batch(client, session_id, pending)
+
+            for _ in range(self.detections):
+                self._request("POST", "/api/detect-litter",
+                              json={"image": self.image, "latitude": latitude, "longitude": longitude})
+
+            self.recorder.timed("ws finish_tracking",
+                                lambda: client.call("finish_tracking", {"sessionId": session_id}, timeout=10))
+            if not done.wait(10):
+                self.recorder.record("ws finish_tracking", 0, ok=False)
+        finally:
+            client.disconnect()
+
+        end = time.time()
+        self._request("POST", "/api/end_session", json={
+            "routes": route,
+            "distancesTravelled": round(len(route) * 5.0, 1),
+            "steps": len(route) * 6,
+            "timeStart": int(start * 1000),
+            "timeEnd": int(end * 1000),
+            "elapsedTime": int(end - start),
+            "sessionid": session_id,
+        })
+        self._request("GET", "/api/leaderboard", params={"count": 10})
@@ -0,0 +1,99 @@
+"""
+Run the REST API and the ws-server in one process against a local database.
+
+    python -m loadtest.stand_in --api-port 5000 --ws-port 5001
+    python -m loadtest.stand_in --mongo-uri mongodb://localhost:27017
+
+Without --mongo-uri both servers share an in-memory mongomock database
+(`pip install mongomock`); with it they use that database, e.g. a local
+mongod. --stub-detector replaces the ONNX detector with a fixed result so
+the request path can be measured on machines without the model.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import threading
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_in_memory_database():
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("The in-memory stand-in needs mongomock: pip install mongomock")
+    from utils.db import use_client
+    use_client(mongomock.MongoClient())
+
+
+class StubModel:
+    """Stands in for models.detect.Model with a fixed result."""
+    version = "stub"
+    labels = ["Bottle", "Can", "Cigarette"]
+
+    def __init__(self, points):
+        self.points = points
+
+    def detect_objects(self, base64_string):
+        return [(10.0, 10.0, 60.0, 90.0, class_id, 0.8) for class_id in range(len(self.labels))]
+
+    def detect_base64(self, base64_string):
+        return list(self.labels)
+
+    def count(self, detections):
+        return Counter(self.labels[detection[4]] for detection in detections)
+
+    def points_for(self, counts):
+        return sum(self.points.get(label, 1) * count for label, count in counts.items())
+
+
+def load_ws_server():
+    # ws-server.py is not importable by name because of the hyphen
+    spec = importlib.util.spec_from_file_location("ws_server", os.path.join(BACKEND_DIR, "ws-server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run app.py and ws-server.py against a local database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=5000)
+    parser.add_argument("--ws-port", type=int, default=5001)
+    parser.add_argument("--mongo-uri", help="Local MongoDB to use instead of the in-memory stand-in")
+    parser.add_argument("--stub-detector", action="store_true", help="Skip ONNX inference in /api/detect-litter")
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)  # the servers load models and .env relative to backend/
+    os.environ.setdefault("JWT_SECRET_KEY", "loadtest-secret")
+    os.environ.setdefault("MONGO_DB_NAME", "PlogGoLoadTest")
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        use_in_memory_database()
+
+    import eventlet
+    from werkzeug.serving import make_server
+    import app as api_server
+    from utils.model_registry import ModelRegistry
+
+    if args.stub_detector:
+        api_server.model_registry = ModelRegistry(None, fallback=lambda: StubModel(api_server.POINT_SYSTEM))
+    api_server.app.config["DEBUG"] = False
+    ws_server = load_ws_server()
+    # the servers normally read the same secret from the same .env file
+    ws_server.JWT_SECRET = api_server.app.config["JWT_SECRET_KEY"]
+    ws_server.start_background_tasks()
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+    api = make_server(args.host, args.api_port, api_server.app, threaded=True)
+    threading.Thread(target=api.serve_forever, name="api", daemon=True).start()
+    print(f"API listening on http://{args.host}:{args.api_port}", flush=True)
+    print(f"Socket.IO listening on http://{args.host}:{args.ws_port}", flush=True)
+    eventlet.wsgi.server(eventlet.listen((args.host, args.ws_port)), ws_server.app, log_output=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import json
+import math
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list, None if it is empty."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Thread-safe collection of per-endpoint latencies and errors."""
+
+    def __init__(self):
+        self._latencies = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, endpoint, seconds, ok=True):
+        with self._lock:
+            if ok:
+                self._latencies[endpoint].append(seconds * 1000)
+            else:
+                self._errors[endpoint] += 1
+
+    def timed(self, endpoint, call):
+        """
+        Run `call()` and record its latency. The call counts as an error if
+        it raises or returns False; exceptions are re-raised.
+        """
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            self.record(endpoint, time.perf_counter() - start, ok=False)
+            raise
+        self.record(endpoint, time.perf_counter() - start, ok=result is not False)
+        return result
+
+    def stop(self):
+        self.finished = time.monotonic()
+
+    def summary(self):
+        """
+        Returns:
+            dict: endpoint -> count, errors, throughput (ok requests per
+            second over the whole run) and mean/p50/p95/p99/max latency in ms
+        """
+        elapsed = (self.finished or time.monotonic()) - self.started
+        with self._lock:
+            endpoints = set(self._latencies) | set(self._errors)
+            result = {}
+            for endpoint in sorted(endpoints):
+                values = sorted(self._latencies[endpoint])
+                result[endpoint] = {
+                    "count": len(values),
+                    "errors": self._errors[endpoint],
+                    "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+                    "mean_ms": round(sum(values) / len(values), 2) if values else None,
+                    "p50_ms": _round(percentile(values, 50)),
+                    "p95_ms": _round(percentile(values, 95)),
+                    "p99_ms": _round(percentile(values, 99)),
+                    "max_ms": _round(values[-1] if values else None),
+                }
+        return result
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def git_commit():
+    """Return the current git commit, or None outside a checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(recorder, config):
+    """Combine the run configuration and endpoint summary into a JSON-able report."""
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "duration_s": round((recorder.finished or time.monotonic()) - recorder.started, 2),
+        "config": config,
+        "endpoints": recorder.summary(),
+    }
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, metric="p95_ms", threshold=0.10):
+    """
+    Compare two reports endpoint by endpoint.
+
+    Args:
+        baseline, current (dict): Reports from `build_report`
+        metric (str): Latency field to compare
+        threshold (float): Relative increase that counts as a regression
+
+    Returns:
+        list: Rows of (endpoint, baseline value, current value, relative
+        change or None, regressed)
+    """
+    rows = []
+    endpoints = sorted(set(baseline["endpoints"]) | set(current["endpoints"]))
+    for endpoint in endpoints:
+        before = baseline["endpoints"].get(endpoint, {}).get(metric)
+        after = current["endpoints"].get(endpoint, {}).get(metric)
+        change = (after - before) / before if before and after is not None else None
+        rows.append((endpoint, before, after, change, change is not None and change > threshold))
+    return rows
@@ -0,0 +1,327 @@
+"""
+Simulated-client benchmark of one ws-server process.
+
+    python -m loadtest.ws_bench run --clients 2000 --duration 120 --interval 1 --record traces/walk.ndjson
+    python -m loadtest.ws_bench run --replay traces/walk.ndjson --speed 2 --output results/ws.json
+    python -m loadtest.ws_bench serve --port 5201 --users 2000
+
+`run` starts ws-server in a child process (`serve`: in-memory database
+seeded with users bench-0 ... bench-N) and drives it with simulated
+Socket.IO clients from green threads: start_tracking, a location_update
+every --interval seconds along a random walk, finish_tracking. It reports
+events/sec, ack latencies, the server's event loop lag and its RSS per
+live session. `--record` writes the events actually sent, with their send
+times, as NDJSON; `--replay` sends such a trace again for regression runs.
+Reports can be compared with `python -m loadtest compare`.
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import jwt
+import requests
+import socketio
+
+from loadtest import stats
+from loadtest.scenarios import START, STEP_DEGREES
+from loadtest.stand_in import BACKEND_DIR, load_ws_server, use_in_memory_database
+
+JWT_SECRET = "loadtest-secret"
+
+
+def synthetic_trace(clients, duration, interval, ramp_up, seed=0):
+    """
+    Planned steps of each simulated client.
+
+    Returns:
+        dict: client index -> list of (offset seconds, event, data)
+    """
+    rng = random.Random(seed)
+    scripts = {}
+    for client in range(clients):
+        start = ramp_up * client / max(clients, 1)
+        finish = max(duration - rng.uniform(0, min(interval, 2)), start + interval)
+        latitude = START[0] + rng.uniform(-0.01, 0.01)
+        longitude = START[1] + rng.uniform(-0.01, 0.01)
+        steps = [(start, "start_tracking", {})]
+        offset = start + rng.uniform(0, interval)
+        while offset < finish:
+            latitude += rng.choice((-1, 1)) * STEP_DEGREES
+            longitude += rng.choice((-1, 1)) * STEP_DEGREES
+            steps.append((offset, "location_update", {
+                "latitude": round(latitude, 7), "longitude": round(longitude, 7), "accuracy": rng.choice((5, 10, 20)),
+            }))
+            offset += interval * rng.uniform(0.8, 1.2)
+        steps.append((finish, "finish_tracking", {}))
+        scripts[client] = steps
+    return scripts
+
+
+def load_trace(path):
+    """Read a recorded trace into the same shape as `synthetic_trace`."""
+    scripts = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                step = json.loads(line)
+                scripts[step["client"]].append((step["t"], step["event"], step["data"]))
+    return {client: sorted(steps, key=lambda step: step[0]) for client, steps in scripts.items()}
+
+
+def save_trace(path, sent):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        for client, offset, event, data in sorted(sent, key=lambda step: step[1]):
+            f.write(json.dumps({"client": client, "t": round(offset, 3), "event": event, "data": data}) + "\n")
+
+
+class SimulatedClient:
+    """One Socket.IO client playing its script against the server, timed from `started`."""
+
+    def __init__(self, index, url, secret, steps, recorder, sent, speed=1.0):
+        self.index = index
+        self.url = url
+        self.token = jwt.encode({"sub": f"bench-{index}", "jti": str(uuid.uuid4())}, secret, algorithm="HS256")
+        self.steps = steps
+        self.recorder = recorder
+        self.sent = sent
+        self.speed = speed
+        self.session_id = None
+
+    def _wait_until(self, started, offset):
+        delay = started + offset / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self, started):
+        client = socketio.Client(reconnection=False)
+        session = eventlet.event.Event()
+        completed = eventlet.event.Event()
+        client.on("session_id", lambda data: session.ready() or session.send(data["sessionId"]))
+        client.on("tracking_completed", lambda data: completed.ready() or completed.send(data))
+        client.on("error", lambda data: self.recorder.record("ws error event", 0, ok=False))
+
+        self._wait_until(started, self.steps[0][0])
+        try:
+            self.recorder.timed("ws connect", lambda: client.connect(self.url, wait_timeout=30))
+        except Exception:
+            return
+        try:
+            for offset, event, data in self.steps:
+                self._wait_until(started, offset)
+                self.sent.append((self.index, time.monotonic() - started, event, data))
+                if event == "start_tracking":
+                    self.recorder.timed("ws start_tracking", lambda: self._start(client, session))
+                elif event in ("finish_tracking", "end_time"):
+                    if self.session_id:
+                        self.recorder.timed("ws finish_tracking", lambda: self._finish(client, completed))
+                elif self.session_id:
+                    payload = dict(data, sessionId=self.session_id)
+                    if event == "location_update":
+                        payload["timestamp"] = int(time.time() * 1000)
+                    self.recorder.timed(f"ws {event}", lambda: client.call(event, payload, timeout=30))
+        except Exception:
+            pass  # the failed call is recorded as an error
+        finally:
+            client.disconnect()
+
+    def _start(self, client, session):
+        client.call("start_tracking", {"token": self.token}, timeout=30)
+        self.session_id = session.wait(30)
+        return bool(self.session_id)
+
+    def _finish(self, client, completed):
+        client.call("finish_tracking", {"sessionId": self.session_id}, timeout=30)
+        return completed.wait(30) is not None
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MB, from /proc (Linux), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def sample_server(url, pid, started):
+    """One sample of the server gauges: live sessions, loop lag and RSS."""
+    sample = {"t": round(time.monotonic() - started, 1), "rss_mb": rss_mb(pid) if pid else None}
+    try:
+        sample.update(requests.get(url + "/health/sessions", timeout=5).json())
+        sample["loop_lag"] = requests.get(url + "/health/loop", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        pass
+    return sample
+
+
+def start_server(args):
+    command = [sys.executable, "-m", "loadtest.ws_bench", "serve", "--port", str(args.port),
+               "--users", str(args.clients)]
+    if args.mongo_uri:
+        command += ["--mongo-uri", args.mongo_uri]
+    env = dict(os.environ, JWT_SECRET_KEY=args.jwt_secret)
+    # the server's JSON logs would dominate the output
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The ws-server exited during start up")
+        try:
+            requests.get(url + "/health/sessions", timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("The ws-server did not start within 60 seconds")
+
+
+def summarize_server(samples, baseline_rss):
+    """Peak live sessions, RSS per live session at that peak and the worst loop lag."""
+    live = [sample for sample in samples if sample.get("live") is not None]
+    if not live:
+        return {}
+    peak = max(live, key=lambda sample: sample["live"])
+    lags = [sample["loop_lag"]["p99_ms"] for sample in live if sample.get("loop_lag", {}).get("p99_ms") is not None]
+    per_session = None
+    if peak["live"] and peak.get("rss_mb") is not None and baseline_rss is not None:
+        per_session = round((peak["rss_mb"] - baseline_rss) * 1024 / peak["live"], 1)
+    return {
+        "peak_live_sessions": peak["live"],
+        "baseline_rss_mb": round(baseline_rss, 1) if baseline_rss is not None else None,
+        "peak_rss_mb": round(peak["rss_mb"], 1) if peak.get("rss_mb") is not None else None,
+        "rss_per_session_kb": per_session,
+        "loop_lag_p99_ms": max(lags) if lags else None,
+        "loop_lag_max_ms": live[-1].get("loop_lag", {}).get("max_ms"),
+    }
+
+
+def run(args):
+    scripts = load_trace(args.replay) if args.replay else synthetic_trace(
+        args.clients, args.duration, args.interval, args.ramp_up, args.seed)
+    args.clients = max(scripts) + 1 if scripts else 0
+    process, pid = None, args.server_pid
+    if args.url:
+        url = args.url
+    else:
+        process, url = start_server(args)
+        pid = process.pid
+
+    recorder = stats.Recorder()
+    sent = []
+    samples = []
+    baseline_rss = rss_mb(pid) if pid else None
+    started = time.monotonic()
+    clients = [SimulatedClient(index, url, args.jwt_secret, steps, recorder, sent, args.speed)
+               for index, steps in scripts.items()]
+    pool = eventlet.GreenPool(len(clients) + 1)
+    try:
+        threads = [pool.spawn(client.run, started) for client in clients]
+        while not all(thread.dead for thread in threads):
+            samples.append(sample_server(url, pid, started))
+            if args.verbose:
+                print(json.dumps(samples[-1]), flush=True)
+            time.sleep(1)
+    finally:
+        recorder.stop()
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    config = {name: value for name, value in vars(args).items()
+              if name not in ("command", "output", "jwt_secret", "verbose")}
+    report = stats.build_report(recorder, config)
+    acked = sum(row["count"] for endpoint, row in report["endpoints"].items()
+                if endpoint.startswith("ws ") and endpoint != "ws connect")
+    report["server"] = dict(summarize_server(samples, baseline_rss),
+                            events_per_second=round(acked / report["duration_s"], 1) if report["duration_s"] else None)
+    report["samples"] = samples
+
+    from loadtest.__main__ import print_summary
+    print_summary(report)
+    print()
+    for name, value in report["server"].items():
+        print(f"{name:<28}{value}")
+    if args.record:
+        save_trace(args.record, sent)
+        print(f"Trace of {len(sent)} events written to {args.record}")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        stats.save_report(report, args.output)
+        print(f"Results written to {args.output}")
+
+
+def serve(args):
+    """Run ws-server alone, with bench-N users for the simulated clients."""
+    os.chdir(BACKEND_DIR)
+    os.environ.setdefault("JWT_SECRET_KEY", JWT_SECRET)
+    os.environ.setdefault("MONGO_DB_NAME", "PlogGoLoadTest")
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        use_in_memory_database()
+    from pymongo import UpdateOne
+    from utils.db import db
+
+    ws_server = load_ws_server()
+    ws_server.JWT_SECRET = os.environ["JWT_SECRET_KEY"]
+    for start in range(0, args.users, 1000):
+        db.user.bulk_write([
+            UpdateOne({"user_id": f"bench-{i}"}, {"$setOnInsert": {"name": f"Bench {i}"}}, upsert=True)
+            for i in range(start, min(start + 1000, args.users))
+        ], ordered=False)
+    ws_server.start_background_tasks()
+    eventlet.wsgi.server(eventlet.listen((args.host, args.port), backlog=4096), ws_server.app,
+                         log_output=False, max_size=100000)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest.ws_bench")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Drive simulated tracking clients and report server metrics")
+    run_parser.add_argument("--clients", type=int, default=500, help="Simulated clients, one session each")
+    run_parser.add_argument("--duration", type=float, default=60, help="Seconds each session lasts")
+    run_parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which clients start")
+    run_parser.add_argument("--interval", type=float, default=1.0, help="Seconds between location updates")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic trace")
+    run_parser.add_argument("--record", help="Write the events sent as an NDJSON trace to this file")
+    run_parser.add_argument("--replay", help="Send the events of a recorded trace instead of a synthetic one")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor")
+    run_parser.add_argument("--url", help="Use a running ws-server instead of starting one")
+    run_parser.add_argument("--server-pid", type=int, help="PID of the server given with --url, for RSS")
+    run_parser.add_argument("--jwt-secret", default=os.getenv("JWT_SECRET_KEY", JWT_SECRET))
+    run_parser.add_argument("--port", type=int, default=5201)
+    run_parser.add_argument("--mongo-uri", help="Run the started server against this MongoDB instead of in memory")
+    run_parser.add_argument("--output", help="Write the results as JSON to this file")
+    run_parser.add_argument("--verbose", action="store_true", help="Print the server samples as they are taken")
+
+    serve_parser = commands.add_parser("serve", help="Run ws-server alone with seeded bench users")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=5201)
+    serve_parser.add_argument("--users", type=int, default=1000)
+    serve_parser.add_argument("--mongo-uri")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
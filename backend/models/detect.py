@@ -4,6 +4,19 @@ import base64
 import onnxruntime as ort
 from PIL import Image
 from io import BytesIO
+from collections import Counter
+import os
+from utils.ps_helper import load_litter_points
+
+# side of the square model input, in pixels
+INPUT_SIZE = 640
+
+# candidate boxes at or below this confidence are dropped
+CONFIDENCE_THRESHOLD = 0.1
+
+# IoU above which overlapping boxes are suppressed when scoring uploads (class-agnostic NMS);
+# None counts every candidate above the confidence threshold, as uploads have always been scored
+SERVING_NMS_IOU = None
 
 def base64_to_image(base64_string):
         """
@@ -22,17 +35,26 @@ def base64_to_image(base64_string):
         # Decode base64 string
         img_data = base64.b64decode(base64_string)
         
-        # Convert to PIL Image
-        img_pil = Image.open(BytesIO(img_data))
-        
-        # Convert to numpy array (RGB)
-        img_np = np.array(img_pil)
-        
-        # Convert RGB to BGR 
-        if len(img_np.shape) == 3 and img_np.shape[2] == 3:
-            img_np = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-            
-        return img_np
+        return bytes_to_image(img_data)
+
+def bytes_to_image(img_data):
+    """
+    Decode encoded image bytes (JPEG, PNG, ...) the way uploads are decoded.
+
+    Returns:
+        numpy.ndarray: Image in BGR format for OpenCV processing
+    """
+    # Convert to PIL Image
+    img_pil = Image.open(BytesIO(img_data))
+
+    # Convert to numpy array (RGB)
+    img_np = np.array(img_pil)
+
+    # Convert RGB to BGR
+    if len(img_np.shape) == 3 and img_np.shape[2] == 3:
+        img_np = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+
+    return img_np
 
 # convert base 64 to cv2 compatible image format
 def base64_to_opencv(base64_string):
@@ -52,7 +74,10 @@ def base64_to_opencv(base64_string):
 def run_model(model_path, img):
     # Create ONNX Runtime session
     session = ort.InferenceSession(model_path)
-    
+
+    return infer(session, img)
+
+def infer(session, img):
     # Get input name
     input_name = session.get_inputs()[0].name
     
@@ -114,19 +139,22 @@ def NMS(boxes, conf_scores, iou_thresh = 0.50):
 
     return keep, keep_confidences
 
-def rescale_back(results,img_w,img_h):
+def rescale_back(results,img_w,img_h,iou_thresh=0.50):
     cx, cy, w, h, class_id, confidence = results[:,0], results[:,1], results[:,2], results[:,3], results[:,4], results[:,-1]
-    cx = cx/640.0 * img_w
-    cy = cy/640.0 * img_h
-    w = w/640.0 * img_w
-    h = h/640.0 * img_h
+    cx = cx/INPUT_SIZE * img_w
+    cy = cy/INPUT_SIZE * img_h
+    w = w/INPUT_SIZE * img_w
+    h = h/INPUT_SIZE * img_h
     x1 = cx - w/2
     y1 = cy - h/2
     x2 = cx + w/2
     y2 = cy + h/2
 
     boxes = np.column_stack((x1, y1, x2, y2, class_id))
-    keep, keep_confidences = NMS(boxes,confidence)
+    if iou_thresh is None:
+        order = confidence.argsort()[::-1]
+        return list(boxes[order]), list(confidence[order])
+    keep, keep_confidences = NMS(boxes,confidence,iou_thresh)
     # print(np.array(keep).shape)
     return keep, keep_confidences
 
@@ -137,57 +165,54 @@ def load_labels(path):
         classes = content.split('\n')
     return classes
 
-def filter_Detections(results, thresh = 0.1):
+def filter_Detections(results, thresh = CONFIDENCE_THRESHOLD):
     # if model is trained on 1 class only
     if len(results[0]) == 5:
         # filter out the detections with confidence > thresh
-        considerable_detections = [detection for detection in results if detection[4] > thresh]
-        considerable_detections = np.array(considerable_detections)
-        return considerable_detections
-
-    # if model is trained on multiple classes
-    else:
-        A = []
-        for detection in results:
+        return results[results[:, 4] > thresh]
 
-            class_id = detection[4:].argmax()
-            confidence_score = detection[4:].max()
-
-            new_detection = np.append(detection[:4],[class_id,confidence_score])
-
-            A.append(new_detection)
-
-        A = np.array(A)
-
-        # filter out the detections with confidence > thresh
-        considerable_detections = [detection for detection in A if detection[-1] > thresh]
-        considerable_detections = np.array(considerable_detections)
+    # if model is trained on multiple classes: [cx, cy, w, h, class_id, confidence]
+    # for the best class of each candidate box, computed for all boxes at once
+    scores = results[:, 4:]
+    A = np.column_stack((results[:, :4], scores.argmax(axis=1), scores.max(axis=1)))
 
-        return considerable_detections
+    # filter out the detections with confidence > thresh
+    return A[A[:, -1] > thresh]
 
-def detect_litter_from_base64(base64_string, model_path, labels_path):
-    # convert base64 encoded images to cv2 compatible type
-    image = base64_to_image(base64_string)
+def preprocess(image):
+    """
+    Turn a BGR image into the model input.
 
+    Returns:
+        tuple: (float32 array of shape (1, 3, 640, 640) scaled to 0-1, image width, image height)
+    """
     # YOLO model need RGB image
     img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     img_height, img_width = img.shape[:2]
 
     # resize image to desired sire for inference
-    img = cv2.resize(img, (640, 640))
+    img = cv2.resize(img, (INPUT_SIZE, INPUT_SIZE))
 
     # change the order of image dimension (640, 640, 3) to (3, 640, 640)
     img = img.transpose(2, 0, 1)
 
     # add an extra dimension at index 0
-    img = img.reshape(1, 3, 640, 640)
+    img = img.reshape(1, 3, INPUT_SIZE, INPUT_SIZE)
 
     # scale to 0-1
-    img = img/255.0
+    img = (img / 255.0).astype(np.float32)
 
-    # run model and get inferences
-    output = run_model(model_path, img)
-    
+    return img, img_width, img_height
+
+def postprocess(output, img_width, img_height, conf_thresh=CONFIDENCE_THRESHOLD, iou_thresh=SERVING_NMS_IOU):
+    """
+    Turn the raw model output into detections in image coordinates: boxes
+    above `conf_thresh`, after class-agnostic non-maximum suppression at
+    `iou_thresh` unless it is None.
+
+    Returns:
+        list: (x1, y1, x2, y2, class_id, confidence) tuples, most confident first
+    """
     # remove the first index
     results = output[0]
 
@@ -195,14 +220,76 @@ def detect_litter_from_base64(base64_string, model_path, labels_path):
     results = results.transpose()
 
     # filter inaccurate detections
-    results = filter_Detections(results)
+    results = filter_Detections(results, conf_thresh)
+    if len(results) == 0:
+        return []
 
     # rescale the images back to its original form
-    # rescaled_results, confidences = rescale_back(results, img_width, img_height)
+    keep, confidences = rescale_back(results, img_width, img_height, iou_thresh)
+
+    return [(*map(float, box[:4]), int(box[4]), float(confidence)) for box, confidence in zip(keep, confidences)]
+
+def detect(session, image, conf_thresh=CONFIDENCE_THRESHOLD, iou_thresh=SERVING_NMS_IOU):
+    """Run the serving pipeline on a BGR image with an ONNX Runtime session; returns `postprocess` detections."""
+    img, img_width, img_height = preprocess(image)
+    return postprocess(infer(session, img), img_width, img_height, conf_thresh, iou_thresh)
+
+def detect_litter_from_base64(base64_string, model_path, labels_path):
+    # convert base64 encoded images to cv2 compatible type
+    image = base64_to_image(base64_string)
+
+    img, img_width, img_height = preprocess(image)
+
+    # run model and get inferences
+    output = run_model(model_path, img)
+
+    detections = postprocess(output, img_width, img_height)
     
     # Load class labels
     classes = load_labels(labels_path) 
 
-    predictions = [classes[int(result[-2])] for result in results]
-
-    return predictions
\ No newline at end of file
+    predictions = [classes[detection[4]] for detection in detections]
+
+    return predictions
+
+class Model:
+    """
+    An ONNX model with its class labels and point table, loaded once and
+    shared by all requests of a process (ONNX Runtime sessions can be run
+    from several threads).
+    """
+
+    def __init__(self, version, model_path, labels_path, points):
+        self.version = version
+        self.session = ort.InferenceSession(model_path)
+        self.labels = load_labels(labels_path)
+        self.points = points
+
+    def warm_up(self):
+        """Run one inference so the first request does not pay for allocations, and check the labels fit."""
+        output = infer(self.session, np.zeros((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32))
+        classes = output.shape[1] - 4
+        if classes > len(self.labels):
+            raise ValueError(f"model {self.version} has {classes} classes but {len(self.labels)} labels")
+        return self
+
+    def detect_objects(self, base64_string):
+        """Detections of a base64 encoded image, as `postprocess` returns them."""
+        return detect(self.session, base64_to_image(base64_string))
+
+    def detect_base64(self, base64_string):
+        """Same as `detect_litter_from_base64`: one label name per detected object."""
+        return [self.labels[detection[4]] for detection in self.detect_objects(base64_string)]
+
+    def count(self, detections):
+        """Number of detected objects per label."""
+        return Counter(self.labels[detection[4]] for detection in detections)
+
+    def points_for(self, counts):
+        """Points earned for {label: count}; labels missing from the point table are worth 1."""
+        return sum(self.points.get(label, 1) * count for label, count in counts.items())
+
+def load_model(version, path):
+    """Load and warm up a registry bundle: `model.onnx`, `labels.txt` and `points.txt` in `path`."""
+    points = load_litter_points(os.path.join(path, "points.txt"))
+    return Model(version, os.path.join(path, "model.onnx"), os.path.join(path, "labels.txt"), points).warm_up()
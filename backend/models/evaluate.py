@@ -0,0 +1,220 @@
+"""
+Evaluate an ONNX model on a labelled image folder, on CPU, through the same
+decoding, preprocessing and post-processing as /api/detect-litter.
+
+    python -m models.evaluate --model models/best.onnx --images dataset/test/images
+    python -m models.evaluate --model models/best.onnx --data models/data.yaml --split test --json results.json
+
+The folder uses the YOLO layout the model was trained on: `.../images/x.jpg`
+with `.../labels/x.txt` holding one `class cx cy w h` line (normalized) per
+object. Images are streamed to a pool of processes, each with its own ONNX
+Runtime session. Reports mAP@50, mAP@50-95, per-class precision/recall and
+images/sec.
+
+By default predictions are kept exactly as uploads are scored: confidence
+above 0.1 and no NMS (see `--conf` and `--iou`). That is not how `yolo val`
+measures the model (confidence 0.001, per-class NMS at IoU 0.7, letterboxed
+input), so the numbers are not directly comparable with ultralytics;
+`--conf 0.001 --iou 0.7` brings the thresholds closer, NMS here stays
+class-agnostic.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+import onnxruntime as ort
+
+from models import detect
+from utils.detection_metrics import DetectionMetrics, match_predictions
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+_session = None
+_thresholds = (detect.CONFIDENCE_THRESHOLD, detect.SERVING_NMS_IOU)
+
+
+def iter_samples(images_dir):
+    """Yield (image path, label path) pairs; the label file may not exist for images without objects."""
+    labels_dir = os.path.join(os.path.dirname(os.path.normpath(images_dir)), "labels")
+    with os.scandir(images_dir) as entries:
+        names = sorted(entry.name for entry in entries
+                       if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+    for name in names:
+        yield os.path.join(images_dir, name), os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt")
+
+
+def read_labels(path, width, height):
+    """
+    Ground truth boxes of a YOLO label file, in pixels. Polygon rows
+    (segmentation exports) are reduced to their bounding box.
+
+    Returns:
+        tuple: (class ids, N x 4 array of x1 y1 x2 y2)
+    """
+    classes, boxes = [], []
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4))
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+            if len(values) < 5:
+                continue
+            coords = np.array(values[1:], dtype=np.float64)
+            if len(coords) == 4:
+                cx, cy, w, h = coords
+                box = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+            else:
+                xs, ys = coords[0::2], coords[1::2]
+                box = (xs.min(), ys.min(), xs.max(), ys.max())
+            classes.append(int(values[0]))
+            boxes.append(np.array(box) * (width, height, width, height))
+    return np.array(classes, dtype=np.int64), np.array(boxes).reshape(-1, 4)
+
+
+def _init_worker(model_path, threads, thresholds):
+    global _session, _thresholds
+    _thresholds = thresholds
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    _session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    # the first run allocates buffers; keep it out of the measured images
+    detect.infer(_session, np.zeros((1, 3, detect.INPUT_SIZE, detect.INPUT_SIZE), dtype=np.float32))
+
+
+def evaluate_image(sample):
+    """Detect objects in one image and match them to its labels. Runs in a worker process."""
+    image_path, label_path = sample
+    with open(image_path, "rb") as f:
+        data = f.read()
+    started = time.perf_counter()
+    image = detect.bytes_to_image(data)
+    detections = detect.detect(_session, image, *_thresholds)
+    elapsed = time.perf_counter() - started
+
+    height, width = image.shape[:2]
+    true_classes, true_boxes = read_labels(label_path, width, height)
+    pred_boxes = np.array([d[:4] for d in detections]).reshape(-1, 4)
+    pred_classes = np.array([d[4] for d in detections], dtype=np.int64)
+    confidences = np.array([d[5] for d in detections])
+    correct = match_predictions(pred_boxes, pred_classes, true_boxes, true_classes)
+    return confidences, pred_classes, correct, true_classes, elapsed
+
+
+def evaluate(model_path, images_dir, class_count, processes=None, threads=1, limit=None, progress_every=100,
+             conf_thresh=detect.CONFIDENCE_THRESHOLD, iou_thresh=detect.SERVING_NMS_IOU):
+    """
+    Evaluate `model_path` on every image in `images_dir`, keeping predictions
+    above `conf_thresh` after class-agnostic NMS at `iou_thresh` (none if None).
+
+    Returns:
+        dict: `DetectionMetrics.results()` plus images_per_second, latency_ms
+            (per image in one process: decode, preprocess, inference and
+            post-processing) and processes
+    """
+    processes = processes or os.cpu_count() or 1
+    samples = iter_samples(images_dir)
+    if limit:
+        samples = islice(samples, limit)
+    metrics = DetectionMetrics(class_count)
+    latencies = []
+    with Pool(processes, initializer=_init_worker, initargs=(model_path, threads, (conf_thresh, iou_thresh))) as pool:
+        started = time.perf_counter()
+        for confidences, pred_classes, correct, true_classes, elapsed in pool.imap_unordered(
+                evaluate_image, samples, chunksize=4):
+            metrics.add(confidences, pred_classes, correct, true_classes)
+            latencies.append(elapsed * 1000)
+            if progress_every and metrics.images % progress_every == 0:
+                rate = metrics.images / (time.perf_counter() - started)
+                print(f"{metrics.images} images, {rate:.1f} images/s", file=sys.stderr, flush=True)
+        duration = time.perf_counter() - started
+
+    results = metrics.results()
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    results.update({
+        "processes": processes,
+        "threads_per_process": threads,
+        "conf_threshold": conf_thresh,
+        "iou_threshold": iou_thresh,
+        "images_per_second": metrics.images / duration if duration > 0 else 0.0,
+        "latency_ms": {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)),
+                       "p95": float(np.percentile(latencies, 95))},
+    })
+    return results
+
+
+def iou_argument(value):
+    """Parse `--iou`: an IoU threshold, or "none" for no NMS."""
+    if value.lower() == "none":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number or 'none', got {value!r}")
+
+
+def print_report(results, names):
+    print(f"\n{results['images']} images, {results['processes']} processes x {results['threads_per_process']} threads: "
+          f"{results['images_per_second']:.1f} images/s, "
+          f"{results['latency_ms']['mean']:.0f} ms/image (p95 {results['latency_ms']['p95']:.0f} ms)")
+    iou = "no NMS" if results["iou_threshold"] is None else f"class-agnostic NMS at IoU {results['iou_threshold']}"
+    print(f"confidence > {results['conf_threshold']}, {iou}")
+    print(f"mAP@50 {results['map50']:.3f}  mAP@50-95 {results['map50_95']:.3f}  "
+          f"precision {results['precision']:.3f}  recall {results['recall']:.3f}\n")
+    print(f"{'class':<24}{'instances':>10}{'predicted':>10}{'P':>8}{'R':>8}{'AP50':>8}{'AP50-95':>9}")
+    for class_id, row in sorted(results["classes"].items()):
+        name = names[class_id] if class_id < len(names) else str(class_id)
+        ap50 = f"{row['ap50']:.3f}" if row["ap50"] is not None else "-"
+        ap = f"{row['ap50_95']:.3f}" if row["ap50_95"] is not None else "-"
+        print(f"{name[:23]:<24}{row['instances']:>10}{row['predictions']:>10}"
+              f"{row['precision']:>8.3f}{row['recall']:>8.3f}{ap50:>8}{ap:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m models.evaluate", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="models/best.onnx")
+    parser.add_argument("--images", help="Folder of images, next to a labels/ folder")
+    parser.add_argument("--data", help="Dataset yaml to take the images folder (and class names) from")
+    parser.add_argument("--split", default="test", help="Split of --data to evaluate (default test)")
+    parser.add_argument("--labels", default="models/litter_classes.txt", help="Class names served with the model")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--threads", type=int, default=1, help="ONNX Runtime threads per process")
+    parser.add_argument("--limit", type=int, help="Evaluate only the first N images")
+    parser.add_argument("--conf", type=float, default=detect.CONFIDENCE_THRESHOLD,
+                        help="Keep predictions above this confidence (default: as served)")
+    parser.add_argument("--iou", type=iou_argument, default=detect.SERVING_NMS_IOU,
+                        help="IoU for class-agnostic NMS, or 'none' (default: as served)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    names = detect.load_labels(args.labels)
+    images_dir = args.images
+    if args.data:
+        import yaml
+
+        with open(args.data) as f:
+            config = yaml.safe_load(f)
+        root = config.get("path") or os.path.dirname(os.path.abspath(args.data))
+        images_dir = images_dir or os.path.join(root, config[args.split])
+        names = config.get("names", names)
+        if isinstance(names, dict):
+            names = [names[key] for key in sorted(names)]
+    if not images_dir:
+        parser.error("one of --images or --data is required")
+
+    results = evaluate(args.model, images_dir, len(names), args.processes, args.threads, args.limit,
+                       conf_thresh=args.conf, iou_thresh=args.iou)
+    print_report(results, names)
+    if args.json:
+        results["classes"] = {names[c] if c < len(names) else str(c): row for c, row in results["classes"].items()}
+        with open(args.json, "w") as f:
+            json.dump({"model": args.model, "images_dir": images_dir, **results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Publish model bundles to the registry and change what is served.
+
+    python -m models.registry publish v4 --model runs/detect/train/weights/best.onnx
+    python -m models.registry shadow v4              # run v4 next to the active version, serve nothing from it
+    python -m models.registry rollout v4 --percent 10
+    python -m models.registry activate v4
+    python -m models.registry rollback               # stop the candidate, keep the active version
+    python -m models.registry list
+
+A bundle is a directory named after its version with model.onnx,
+labels.txt, points.txt ("name points" per line) and bundle.json. Serving
+processes poll manifest.json (MODEL_REGISTRY_DIR, default
+./models/registry) and swap versions without a restart; see
+utils/model_registry.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+
+from utils.model_registry import REGISTRY_DIR, read_manifest, write_manifest
+
+
+def publish(directory, version, model, labels, points, check=True):
+    """Copy a model with its labels and point table into a new bundle. Returns the bundle path."""
+    path = os.path.join(directory, version)
+    if os.path.exists(path):
+        raise SystemExit(f"Version {version} already exists; versions are immutable, publish a new one")
+    os.makedirs(directory, exist_ok=True)
+    staging = path + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for source, name in ((model, "model.onnx"), (labels, "labels.txt"), (points, "points.txt")):
+        shutil.copyfile(source, os.path.join(staging, name))
+    digest = hashlib.sha256()
+    with open(model, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with open(os.path.join(staging, "bundle.json"), "w") as f:
+        json.dump({"version": version, "sha256": digest.hexdigest(), "source": os.path.abspath(model),
+                   "published": datetime.now(timezone.utc).isoformat()}, f, indent=2)
+    if check:
+        # load and warm up the bundle the way the servers will, before anything can route to it
+        from models.detect import load_model
+        load_model(version, staging)
+    os.rename(staging, path)
+    return path
+
+
+def set_candidate(directory, version, mode, percent=0):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise SystemExit(f"No manifest in {directory}; activate a version first")
+    _require(directory, version)
+    manifest["candidate"] = {"version": version, "mode": mode, **({"percent": percent} if mode == "percent" else {})}
+    write_manifest(directory, manifest)
+
+
+def activate(directory, version):
+    _require(directory, version)
+    manifest = read_manifest(directory) or {}
+    manifest["active"] = version
+    if (manifest.get("candidate") or {}).get("version") == version:
+        manifest.pop("candidate")
+    write_manifest(directory, manifest)
+
+
+def rollback(directory):
+    manifest = read_manifest(directory)
+    if manifest and manifest.pop("candidate", None):
+        write_manifest(directory, manifest)
+
+
+def _require(directory, version):
+    if not os.path.isfile(os.path.join(directory, version, "model.onnx")):
+        raise SystemExit(f"No bundle {version} in {directory}")
+
+
+def list_versions(directory):
+    manifest = read_manifest(directory) or {}
+    candidate = manifest.get("candidate") or {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        info_path = os.path.join(directory, name, "bundle.json")
+        if not os.path.isfile(info_path):
+            continue
+        with open(info_path) as f:
+            info = json.load(f)
+        role = ("active" if name == manifest.get("active")
+                else f"{candidate['mode']} {candidate.get('percent', '')}".strip() if name == candidate.get("version")
+                else "")
+        print(f"{name:<20}{role:<14}{info['published'][:19]}  {info['sha256'][:12]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m models.registry")
+    parser.add_argument("--dir", default=REGISTRY_DIR, help="Registry directory (MODEL_REGISTRY_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = commands.add_parser("publish", help="Add a new version")
+    publish_parser.add_argument("version")
+    publish_parser.add_argument("--model", required=True, help="Exported ONNX model")
+    publish_parser.add_argument("--labels", default="models/litter_classes.txt")
+    publish_parser.add_argument("--points", default="models/litter_points.txt")
+    publish_parser.add_argument("--no-check", action="store_true", help="Do not load the model before publishing")
+    publish_parser.add_argument("--activate", action="store_true", help="Serve it to everyone right away")
+
+    for name, help_text in (("activate", "Serve a version to everyone"),
+                            ("shadow", "Run a version next to the active one without serving its results")):
+        commands.add_parser(name, help=help_text).add_argument("version")
+    rollout_parser = commands.add_parser("rollout", help="Serve a version to a percentage of users")
+    rollout_parser.add_argument("version")
+    rollout_parser.add_argument("--percent", type=int, required=True)
+    commands.add_parser("rollback", help="Drop the shadow or rollout candidate")
+    commands.add_parser("list", help="List versions")
+
+    args = parser.parse_args()
+    if args.command == "publish":
+        print(publish(args.dir, args.version, args.model, args.labels, args.points, check=not args.no_check))
+        if args.activate:
+            activate(args.dir, args.version)
+    elif args.command == "activate":
+        activate(args.dir, args.version)
+    elif args.command == "shadow":
+        set_candidate(args.dir, args.version, "shadow")
+    elif args.command == "rollout":
+        if not 0 <= args.percent <= 100:
+            parser.error("--percent must be between 0 and 100")
+        set_candidate(args.dir, args.version, "percent", args.percent)
+    elif args.command == "rollback":
+        rollback(args.dir)
+    list_versions(args.dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
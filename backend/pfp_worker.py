@@ -0,0 +1,33 @@
+import os
+import time
+from dotenv import load_dotenv
+from utils import profile_pictures
+from utils.db import db
+
+load_dotenv()
+
+s3 = profile_pictures.make_s3_client()
+bucket_name = os.getenv("AWS_S3_BUCKET_NAME")
+
+# seconds to wait before polling again when the queue is empty
+POLL_INTERVAL = float(os.getenv("PFP_WORKER_POLL_INTERVAL", "2"))
+
+def run_once():
+    """Process one queued profile picture, returns False if the queue was empty."""
+    job = profile_pictures.claim_job(db)
+    if not job:
+        return False
+    try:
+        profile_pictures.process_job(db, s3, bucket_name, job)
+        print(f"Thumbnails ready for user {job['user_id']}")
+    except Exception as e:
+        print(f"Thumbnailing {job['key']} failed: {e}")
+        profile_pictures.fail_job(db, job, e)
+    return True
+
+if __name__ == "__main__":
+    print("Profile picture worker started...")
+    profile_pictures.ensure_indexes(db)
+    while True:
+        if not run_once():
+            time.sleep(POLL_INTERVAL)
@@ -0,0 +1,14 @@
+"""
+Bulk import and synthetic data for MongoDB.
+
+    python -m seed import badge=badges.json challenges=challenges.ndjson --mode merge
+    python -m seed import user=users.ndjson --key user_id --mode replace --workers 8
+    python -m seed generate --users 100000 --sessions-per-user 20 --processes 8
+    python -m seed generate --users 1000 --output seed-data/
+
+`import` streams JSON arrays or NDJSON files (see utils/to_mongo.py) into
+unordered bulk writes, with a pool of writer threads per collection.
+`generate` creates users, their plogging sessions, badges and challenges,
+either straight into the database (MONGO_URI / MONGO_DB_NAME) from several
+processes, or as NDJSON files to import later. Both print docs/sec progress.
+"""
@@ -0,0 +1,234 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bson import json_util
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+from seed import synthetic
+from utils import to_mongo
+from utils.db import get_db
+
+
+class Progress:
+    """Documents written per collection, printed with docs/sec every `interval` seconds."""
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.counts = Counter()
+        self.failed = Counter()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self._last = (self.started, 0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._report, daemon=True)
+
+    def add(self, collection, written, failed=0):
+        with self.lock:
+            self.counts[collection] += written
+            self.failed[collection] += failed
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.print_line(final=True)
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            self.print_line()
+
+    def print_line(self, final=False):
+        now = time.monotonic()
+        with self.lock:
+            total = sum(self.counts.values())
+            parts = [f"{name}: {count:,}" + (f" ({self.failed[name]:,} failed)" if self.failed[name] else "")
+                     for name, count in sorted(self.counts.items())]
+        last_time, last_total = self._last
+        self._last = (now, total)
+        if final:
+            rate = total / (now - self.started) if now > self.started else 0
+            print(f"done in {now - self.started:.1f}s, {total:,} docs, {rate:,.0f} docs/s | " + " | ".join(parts))
+        else:
+            rate = (total - last_total) / (now - last_time) if now > last_time else 0
+            print(f"{now - self.started:7.1f}s {total:>12,} docs {rate:>10,.0f} docs/s | " + " | ".join(parts),
+                  flush=True)
+
+
+def load(collection, documents, progress, mode, key, batch_size, workers):
+    """
+    Write an iterable of documents with `workers` threads, each sending one
+    unordered bulk_write at a time. At most two batches per worker are
+    buffered, so memory does not grow with the input size.
+    """
+    target = get_db()[collection]
+    with ThreadPoolExecutor(workers) as pool:
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                progress.add(collection, *future.result())
+
+        for batch in to_mongo.batches(documents, batch_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(to_mongo.write_batch, target, batch, mode, key))
+        collect(wait(pending)[0])
+
+
+def default_key(collection):
+    """Field identifying the documents of a collection: `user_id` for users (as generated), else `_id`."""
+    return "user_id" if collection == "user" else "_id"
+
+
+def import_files(args):
+    jobs = []
+    for spec in args.files:
+        collection, _, pattern = spec.partition("=")
+        paths = sorted(glob.glob(pattern))
+        if not collection or not paths:
+            raise SystemExit(f"Expected collection=path with existing files, got {spec!r}")
+        jobs.extend((collection, path) for path in paths)
+    if args.drop:
+        for collection in sorted({collection for collection, _ in jobs}):
+            to_mongo.delete_all(get_db(), collection)
+
+    with Progress() as progress, ThreadPoolExecutor(len(jobs)) as readers:
+        futures = [readers.submit(load, collection, to_mongo.iter_json_file(path), progress,
+                                  args.mode, args.key or default_key(collection), args.batch_size, args.workers)
+                   for collection, path in jobs]
+        for future in futures:
+            future.result()
+
+
+def _generate_shard(task):
+    # runs in a worker process; the process has its own MongoClient (utils.db)
+    start, stop, args = task
+    queue = _progress_queue
+    progress = _QueueProgress(queue)
+    if args.output:
+        part = f"part-{start // args.shard_size:05d}"
+        written = _write_ndjson(os.path.join(args.output, f"user.{part}.ndjson"),
+                                synthetic.users(start, stop, args.seed, args.badges, _password_hash))
+        queue.put(("user", written, 0))
+        written = _write_ndjson(os.path.join(args.output, f"plogging_session.{part}.ndjson"),
+                                synthetic.sessions(start, stop, args.sessions_per_user, args.seed, args.route_points))
+        queue.put(("plogging_session", written, 0))
+        return
+    load("user", synthetic.users(start, stop, args.seed, args.badges, _password_hash), progress,
+         "replace", "user_id", args.batch_size, args.workers)
+    load("plogging_session",
+         synthetic.sessions(start, stop, args.sessions_per_user, args.seed, args.route_points), progress,
+         "replace", "_id", args.batch_size, args.workers)
+
+
+class _QueueProgress:
+    def __init__(self, queue):
+        self.queue = queue
+
+    def add(self, collection, written, failed=0):
+        self.queue.put((collection, written, failed))
+
+
+_progress_queue = None
+_password_hash = None
+
+
+def _init_worker(queue, password_hash):
+    global _progress_queue, _password_hash
+    _progress_queue, _password_hash = queue, password_hash
+
+
+def _write_ndjson(path, documents):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in documents:
+            f.write(json_util.dumps(doc) + "\n")
+            count += 1
+    return count
+
+
+def generate(args):
+    password_hash = generate_password_hash(synthetic.PASSWORD)
+    small = {"badge": synthetic.badges(args.badges), "challenges": synthetic.challenges(args.challenges, args.seed)}
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    context = multiprocessing.get_context()
+    queue = context.Queue()
+    tasks = [(start, min(start + args.shard_size, args.users), args)
+             for start in range(0, args.users, args.shard_size)]
+    with Progress() as progress:
+        for collection, docs in small.items():
+            if args.output:
+                progress.add(collection, _write_ndjson(os.path.join(args.output, f"{collection}.ndjson"), docs))
+            else:
+                load(collection, docs, progress, "replace", "_id", args.batch_size, 1)
+
+        def drain():
+            while True:
+                message = queue.get()
+                if message is None:
+                    return
+                progress.add(*message)
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        with context.Pool(args.processes, initializer=_init_worker, initargs=(queue, password_hash)) as pool:
+            for _ in pool.imap_unordered(_generate_shard, tasks):
+                pass
+        queue.put(None)
+        drainer.join()
+    if not args.output:
+        print(f"All users can log in with the password {synthetic.PASSWORD!r}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m seed")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Stream JSON/NDJSON files into collections")
+    import_parser.add_argument("files", nargs="+", metavar="collection=path",
+                               help="Collection and file (or glob) to load into it")
+    import_parser.add_argument("--mode", choices=["insert", "replace", "merge"], default="merge",
+                               help="insert new documents, replace or $set-merge existing ones (default merge)")
+    import_parser.add_argument("--key", help="Field that identifies documents to replace or merge "
+                                             "(default user_id for user, _id otherwise)")
+    import_parser.add_argument("--batch-size", type=int, default=to_mongo.BATCH_SIZE)
+    import_parser.add_argument("--workers", type=int, default=4, help="Writer threads per file")
+    import_parser.add_argument("--drop", action="store_true", help="Delete the collections' documents first")
+
+    generate_parser = commands.add_parser("generate", help="Generate a synthetic dataset")
+    generate_parser.add_argument("--users", type=int, default=1000)
+    generate_parser.add_argument("--sessions-per-user", type=int, default=10)
+    generate_parser.add_argument("--route-points", type=int, default=20, help="Route points per session")
+    generate_parser.add_argument("--badges", type=int, default=20)
+    generate_parser.add_argument("--challenges", type=int, default=30)
+    generate_parser.add_argument("--seed", type=int, default=0, help="Same seed, same dataset")
+    generate_parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    generate_parser.add_argument("--shard-size", type=int, default=1000, help="Users per process task")
+    generate_parser.add_argument("--batch-size", type=int, default=to_mongo.BATCH_SIZE)
+    generate_parser.add_argument("--workers", type=int, default=2, help="Writer threads per process")
+    generate_parser.add_argument("--output", help="Write NDJSON files to this directory instead of the database")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        import_files(args)
+    else:
+        generate(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import random
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+# all synthetic users share this password, so any of them can log in to staging
+PASSWORD = "ploggo-seed"
+# a walk around Toronto city hall
+START = (43.6534, -79.3841)
+METRICS = ("steps", "distance", "time", "sessions")
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def user_id(seed, index):
+    """Deterministic user id, so sessions can be generated separately from their users."""
+    return str(uuid.UUID(int=random.Random(f"{seed}:user:{index}").getrandbits(128), version=4))
+
+
+def badges(count):
+    return [{"_id": f"badge-{n}", "name": f"Badge {n}", "steps_required": (n + 1) * 5000,
+             "description": f"Walk {(n + 1) * 5000} steps in one session"} for n in range(count)]
+
+
+def challenges(count, seed=0):
+    rng = random.Random(f"{seed}:challenges")
+    docs = []
+    for n in range(count):
+        metric = METRICS[n % len(METRICS)]
+        goal = {"steps": 5000, "distance": 3000, "time": 1800, "sessions": 2}[metric] * rng.randint(1, 4)
+        docs.append({"_id": f"challenge-{n}", "title": f"Challenge {n}", "metric": metric, "goal": goal})
+    return docs
+
+
+def users(start, stop, seed=0, badge_count=0, password_hash=None):
+    """
+    Users start ... stop-1 with plausible totals. Generating the password
+    hash is slow, so it is computed once and shared.
+    """
+    password_hash = password_hash or generate_password_hash(PASSWORD)
+    for index in range(start, stop):
+        rng = random.Random(f"{seed}:user:{index}:profile")
+        steps = rng.randint(0, 2_000_000)
+        yield {
+            "user_id": user_id(seed, index),
+            "name": f"Seed User {index}",
+            "email": f"seed-{index}@example.com",
+            "password": password_hash,
+            "pfp": "https://example.com/default_profile_pic.jpg",
+            "description": "",
+            "total_steps": steps,
+            "total_distance": round(steps * 0.75, 1),
+            "total_time": steps // 2,
+            "total_points": rng.randint(0, 50_000),
+            "total_litters": rng.randint(0, 10_000),
+            "streak": rng.randint(0, 30),
+            "highest_streak": rng.randint(30, 90),
+            "badges": [f"badge-{n}" for n in range(badge_count) if (n + 1) * 5000 <= steps // 50],
+        }
+
+
+def sessions(start, stop, per_user, seed=0, route_points=20):
+    """
+    Plogging sessions of users start ... stop-1, in the shape /api/end_session
+    stores. The `_id`s are derived from the seed, so generating again replaces
+    the same sessions instead of adding more.
+    """
+    for index in range(start, stop):
+        rng = random.Random(f"{seed}:user:{index}:sessions")
+        owner = user_id(seed, index)
+        for _ in range(per_user):
+            started = EPOCH + timedelta(seconds=rng.randint(0, 365 * 86400))
+            elapsed = rng.randint(300, 7200)
+            latitude = START[0] + rng.uniform(-0.05, 0.05)
+            longitude = START[1] + rng.uniform(-0.05, 0.05)
+            routes = []
+            for point in range(route_points):
+                latitude += rng.uniform(-0.0002, 0.0002)
+                longitude += rng.uniform(-0.0002, 0.0002)
+                routes.append({
+                    "latitude": round(latitude, 6), "longitude": round(longitude, 6),
+                    "timestamp": (started + timedelta(seconds=elapsed * point / route_points)).isoformat(),
+                })
+            steps = int(elapsed * rng.uniform(1.2, 1.8))
+            yield {
+                "_id": ObjectId(struct.pack(">I", int(started.timestamp())) + rng.getrandbits(64).to_bytes(8, "big")),
+                "user_id": owner,
+                "startTime": started,
+                "endTime": started + timedelta(seconds=elapsed),
+                "elapsedTime": elapsed,
+                "routes": routes,
+                "distancesTravelled": round(steps * 0.75, 1),
+                "steps": steps,
+            }
@@ -0,0 +1,166 @@
+import os
+import time
+
+import numpy as np
+from utils.helper import haversine_distance
+
+# sustained fixes per second accepted per session, and the burst allowed on top (0 disables)
+MAX_RATE = float(os.getenv("LOCATION_MAX_RATE", "2"))
+BURST = float(os.getenv("LOCATION_BURST", "10"))
+# fixes a location_batch can draw at once: the bucket of a session that sent nothing for a
+# while keeps refilling up to this, so fixes buffered offline are stored when the client is back
+BATCH_BURST = float(os.getenv("LOCATION_BATCH_BURST", "600"))
+# fixes closer than this to the last accepted one, in meters or milliseconds, are dropped
+MIN_DISTANCE_M = float(os.getenv("LOCATION_MIN_DISTANCE_M", "1"))
+MIN_INTERVAL_MS = int(os.getenv("LOCATION_MIN_INTERVAL_MS", "200"))
+# fixes inside the accuracy radius the client reports are jitter; the radius is capped at this
+MAX_JITTER_M = float(os.getenv("LOCATION_MAX_JITTER_M", "25"))
+
+REASONS = ("rate_limited", "too_soon", "too_close", "jitter")
+
+
+class SessionAdmission:
+    """Token bucket, last accepted fix and counters of one tracking session."""
+
+    __slots__ = ("tokens", "refilled", "last_latitude", "last_longitude", "last_timestamp", "last_seq", "counters")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.refilled = now
+        self.last_latitude = None
+        self.last_longitude = None
+        self.last_timestamp = None
+        self.last_seq = -1
+        self.counters = dict.fromkeys(("received", "accepted") + REASONS, 0)
+
+
+class LocationAdmission:
+    """
+    Per-session admission control of `location_update` and `location_batch` fixes.
+
+    A fix is dropped when it is within LOCATION_MIN_INTERVAL_MS or
+    LOCATION_MIN_DISTANCE_M of the last accepted fix, or within the accuracy
+    radius the client reported for it (GPS jitter of a standing user). The
+    distance is measured from the last accepted fix, so jitter is coalesced
+    into it and slow movement is still recorded once it leaves the radius.
+    Fixes that pass are taken from a token bucket refilled at
+    LOCATION_MAX_RATE per second, which bounds the work and route memory of
+    every session regardless of how often its client sends.
+
+    Batched fixes pass the same checks one by one, in sequence order, and
+    take from the same bucket. A batch may use up to LOCATION_BATCH_BURST
+    tokens, which a session only has after sending nothing for a while, so
+    the accepted rate of a session stays bounded however it sends.
+
+    State lives in the ws-server process that owns the connection and is
+    rebuilt from the next fix after a reconnect to another process.
+    """
+
+    def __init__(self, max_rate=MAX_RATE, burst=BURST, min_distance=MIN_DISTANCE_M,
+                 min_interval_ms=MIN_INTERVAL_MS, max_jitter=MAX_JITTER_M, clock=time.monotonic,
+                 batch_burst=BATCH_BURST):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.batch_burst = max(batch_burst, burst)
+        self.min_distance = min_distance
+        self.min_interval_ms = min_interval_ms
+        self.max_jitter = max_jitter
+        self.clock = clock
+        self.sessions = {}
+        self.totals = dict.fromkeys(("received", "accepted") + REASONS, 0)
+
+    def admit(self, session_id, latitude, longitude, timestamp, accuracy=None):
+        """
+        Decide whether to store a fix of a session.
+
+        Returns:
+            str: None if the fix is accepted, otherwise the reason it was dropped
+        """
+        now = self.clock()
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = SessionAdmission(self.burst, now)
+        reason = self._check(state, latitude, longitude, timestamp, accuracy, now, self.burst)
+        self._record(state, reason, latitude, longitude, timestamp)
+        return reason
+
+    def admit_batch(self, session_id, seqs, latitudes, longitudes, timestamps, accuracies=None, age=0.0):
+        """
+        Decide which fixes of a parsed location batch to store. Fixes at or
+        below the highest sequence number seen before (a resent batch) are
+        skipped without being counted.
+
+        Args:
+            accuracies: Accuracy radius of every fix, NaN where not reported
+            age: Seconds the session has been running, used when this process
+                has no state for it yet (e.g. after a reconnect to another
+                process): it starts with the tokens earned in that time
+
+        Returns:
+            tuple: (boolean array, True for the fixes to store, number of fixes dropped)
+        """
+        now = self.clock()
+        state = self.sessions.get(session_id)
+        if state is None:
+            tokens = min(self.batch_burst, self.burst + max(age, 0.0) * self.max_rate)
+            state = self.sessions[session_id] = SessionAdmission(tokens, now)
+        keep = np.zeros(len(seqs), dtype=bool)
+        dropped = 0
+        for i in range(len(seqs)):
+            if seqs[i] <= state.last_seq:
+                continue
+            latitude, longitude, timestamp = float(latitudes[i]), float(longitudes[i]), int(timestamps[i])
+            accuracy = None
+            if accuracies is not None and not np.isnan(accuracies[i]):
+                accuracy = float(accuracies[i])
+            reason = self._check(state, latitude, longitude, timestamp, accuracy, now, self.batch_burst)
+            self._record(state, reason, latitude, longitude, timestamp)
+            keep[i] = reason is None
+            dropped += reason is not None
+        if len(seqs):
+            state.last_seq = max(state.last_seq, int(seqs[-1]))
+        return keep, dropped
+
+    def _record(self, state, reason, latitude, longitude, timestamp):
+        state.counters["received"] += 1
+        self.totals["received"] += 1
+        outcome = reason or "accepted"
+        state.counters[outcome] += 1
+        self.totals[outcome] += 1
+        if reason is None:
+            state.last_latitude, state.last_longitude, state.last_timestamp = latitude, longitude, timestamp
+
+    def _check(self, state, latitude, longitude, timestamp, accuracy, now, burst):
+        if state.last_latitude is not None:
+            if timestamp - state.last_timestamp < self.min_interval_ms:
+                return "too_soon"
+            distance = haversine_distance(latitude, longitude, state.last_latitude, state.last_longitude)
+            if distance < self.min_distance:
+                return "too_close"
+            if accuracy and distance < min(float(accuracy), self.max_jitter):
+                return "jitter"
+        if self.max_rate > 0:
+            # refill for the time since the last check, then take a token for this fix
+            state.tokens = min(burst, state.tokens + (now - state.refilled) * self.max_rate)
+            state.refilled = now
+            if state.tokens < 1:
+                return "rate_limited"
+            state.tokens -= 1
+        return None
+
+    def counters(self, session_id):
+        """Counters of one session, or None if it sent no fixes to this process."""
+        state = self.sessions.get(session_id)
+        return dict(state.counters) if state is not None else None
+
+    def forget(self, session_id):
+        """Drop the state of a finished session and return its counters."""
+        state = self.sessions.pop(session_id, None)
+        return state.counters if state is not None else None
+
+    def stats(self):
+        """Totals of all sessions of this process plus the counters of each live one."""
+        return {
+            "totals": dict(self.totals),
+            "sessions": {session_id: dict(state.counters) for session_id, state in self.sessions.items()},
+        }
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+
+# the challenge of the current UTC day, cached per process: (day, challenge)
+_cached = (None, None)
+_lock = threading.Lock()
+
+
+def utc_day(now=None):
+    """Return the current UTC day as YYYY-MM-DD."""
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+def pick_index(day, count):
+    """
+    Deterministically map a day to one of `count` challenges.
+
+    Every process computes the same index for the same day, so the choice
+    does not depend on which worker handles the first request of the day.
+    """
+    digest = hashlib.sha256(day.encode()).hexdigest()
+    return int(digest, 16) % count
+
+
+def _serialize(challenge):
+    challenge = dict(challenge)
+    challenge["_id"] = str(challenge["_id"])
+    return challenge
+
+
+def choose_challenge(db, day):
+    """
+    Choose and store the challenge of a day, or read it if already stored.
+
+    The first writer of the day wins, so the stored challenge stays fixed
+    even if the challenges collection changes during the day.
+
+    Returns:
+        dict: The day's challenge, or None if there are no challenges
+    """
+    stored = db.daily_challenge.find_one({"_id": day})
+    if stored:
+        return stored["challenge"]
+
+    challenge_ids = sorted(doc["_id"] for doc in db.challenges.find({}, {"_id": 1}))
+    if not challenge_ids:
+        return None
+    challenge = db.challenges.find_one({"_id": challenge_ids[pick_index(day, len(challenge_ids))]})
+    try:
+        db.daily_challenge.insert_one({
+            "_id": day,
+            "challenge": _serialize(challenge),
+            "created_at": datetime.now(timezone.utc),
+        })
+    except DuplicateKeyError:
+        pass  # another worker stored the day's challenge first
+    return db.daily_challenge.find_one({"_id": day})["challenge"]
+
+
+async def choose_challenge_async(db, day):
+    """Async variant of `choose_challenge` for an AsyncMongoClient database."""
+    stored = await db.daily_challenge.find_one({"_id": day})
+    if stored:
+        return stored["challenge"]
+
+    challenge_ids = sorted([doc["_id"] async for doc in db.challenges.find({}, {"_id": 1})])
+    if not challenge_ids:
+        return None
+    challenge = await db.challenges.find_one({"_id": challenge_ids[pick_index(day, len(challenge_ids))]})
+    try:
+        await db.daily_challenge.insert_one({
+            "_id": day,
+            "challenge": _serialize(challenge),
+            "created_at": datetime.now(timezone.utc),
+        })
+    except DuplicateKeyError:
+        pass  # another worker stored the day's challenge first
+    return (await db.daily_challenge.find_one({"_id": day}))["challenge"]
+
+
+def get_daily_challenge(db, now=None):
+    """
+    Return today's challenge, served from the in-process cache until the
+    UTC day rolls over.
+    """
+    global _cached
+    day = utc_day(now)
+    cached_day, challenge = _cached
+    if cached_day == day:
+        return challenge
+    with _lock:
+        if _cached[0] != day:
+            challenge = choose_challenge(db, day)
+            if challenge is not None:
+                _cached = (day, challenge)
+            return challenge
+        return _cached[1]
+
+
+async def get_daily_challenge_async(db, now=None):
+    """Async variant of `get_daily_challenge` sharing the same in-process cache."""
+    global _cached
+    day = utc_day(now)
+    cached_day, challenge = _cached
+    if cached_day == day:
+        return challenge
+    challenge = await choose_challenge_async(db, day)
+    if challenge is not None:
+        _cached = (day, challenge)
+    return challenge
+
+
+def progress(challenge, daily):
+    """
+    Return the progress of a user towards a challenge from their daily rollup.
+
+    Challenges may define a `metric` (a rollup counter such as "steps" or
+    "litters") and a `goal`; challenges without them have no measurable progress.
+    """
+    if not challenge or not challenge.get("metric") or not challenge.get("goal"):
+        return None
+    value = (daily or {}).get(challenge["metric"], 0)
+    return {
+        "metric": challenge["metric"],
+        "goal": challenge["goal"],
+        "value": value,
+        "completed": bool((daily or {}).get("challenge_completed")),
+    }
+
+
+def update_progress(db, user_id, daily, increment=None):
+    """
+    Evaluate today's challenge for a user after their daily rollup changed.
+
+    Completion is recorded on the daily rollup document with a conditional
+    update, so the challenge points are awarded at most once per day even
+    when detections and sessions arrive concurrently.
+
+    Args:
+        db: PlogGo database
+        user_id (str): User whose activity was recorded
+        daily (dict): Updated daily rollup document from rollups.record_activity
+        increment: `increment(user_id, inc)` applying the challenge points to
+            the user, e.g. through the write-behind buffer; a direct `$inc`
+            if None
+
+    Returns:
+        bool: True if this update completed the challenge
+    """
+    if not _is_today(daily):
+        return False
+    challenge = get_daily_challenge(db)
+    if not _reached_goal(challenge, daily):
+        return False
+    result = db.user_daily_stats.update_one(*_completion_update(challenge, daily))
+    if result.modified_count != 1:
+        return False
+    if increment is not None:
+        increment(user_id, {"total_points": challenge.get("points", 0)})
+    else:
+        db.user.update_one({"user_id": user_id}, {"$inc": {"total_points": challenge.get("points", 0)}})
+    return True
+
+
+async def update_progress_async(db, user_id, daily, increment=None):
+    """
+    Async variant of `update_progress` for an AsyncMongoClient database;
+    `increment(db, user_id, inc)` is awaited.
+    """
+    if not _is_today(daily):
+        return False
+    challenge = await get_daily_challenge_async(db)
+    if not _reached_goal(challenge, daily):
+        return False
+    result = await db.user_daily_stats.update_one(*_completion_update(challenge, daily))
+    if result.modified_count != 1:
+        return False
+    if increment is not None:
+        await increment(db, user_id, {"total_points": challenge.get("points", 0)})
+    else:
+        await db.user.update_one({"user_id": user_id}, {"$inc": {"total_points": challenge.get("points", 0)}})
+    return True
+
+
+def _is_today(daily):
+    return bool(daily) and daily["day"].strftime("%Y-%m-%d") == utc_day()
+
+
+def _reached_goal(challenge, daily):
+    state = progress(challenge, daily)
+    return bool(state) and not state["completed"] and state["value"] >= state["goal"]
+
+
+def _completion_update(challenge, daily):
+    # only matches while the challenge is not yet completed, so points are awarded once
+    return (
+        {"_id": daily["_id"], "challenge_completed": {"$exists": False}},
+        {"$set": {"challenge_completed": challenge["_id"]}},
+    )
@@ -0,0 +1,229 @@
+import os
+import threading
+from collections import Counter
+
+from pymongo import MongoClient, monitoring
+
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Count connection pool events so pool utilization can be published.
+
+    Counters are per process and cumulative except `in_use` and `open`,
+    which are gauges of the connections currently checked out and open.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.in_use = 0
+        self.open = 0
+        self.peak_in_use = 0
+
+    def _count(self, name, in_use=0, open_=0):
+        with self._lock:
+            self.counters[name] += 1
+            self.in_use += in_use
+            self.open += open_
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def pool_created(self, event):
+        self._count("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count("connections_created", open_=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("connections_closed", open_=-1)
+
+    def connection_check_out_started(self, event):
+        self._count("checkouts_started")
+
+    def connection_check_out_failed(self, event):
+        # reason is "timeout" when the wait queue timeout expired
+        self._count(f"checkouts_failed_{event.reason}")
+
+    def connection_checked_out(self, event):
+        self._count("checkouts", in_use=1)
+
+    def connection_checked_in(self, event):
+        self._count("checkins", in_use=-1)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.in_use = self.open = self.peak_in_use = 0
+
+
+pool_listener = PoolStatsListener()
+
+
+def _int_env(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def client_options():
+    """
+    Read the MongoClient pool and timeout settings from the environment.
+
+    MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE: connections per process
+    MONGO_MAX_IDLE_TIME_MS: close pooled connections idle for longer
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: how long a request waits for a free connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS
+    MONGO_COMPRESSORS: e.g. "zstd,snappy,zlib"
+    MONGO_READ_PREFERENCE: e.g. "secondaryPreferred"
+    MONGO_TLS_CA_FILE: CA bundle, defaults to certifi's for mongodb+srv URIs
+    """
+    options = {
+        "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _int_env("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "waitQueueTimeoutMS": _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _int_env("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _int_env("MONGO_SOCKET_TIMEOUT_MS"),
+        "compressors": os.getenv("MONGO_COMPRESSORS"),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE"),
+        "tlsCAFile": os.getenv("MONGO_TLS_CA_FILE"),
+        "event_listeners": [pool_listener],
+    }
+    if not options["tlsCAFile"] and os.getenv("MONGO_URI", "").startswith("mongodb+srv://"):
+        try:
+            import certifi
+            options["tlsCAFile"] = certifi.where()
+        except ImportError:
+            pass
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def get_client():
+    """
+    Return this process's MongoClient, creating it on first use.
+
+    The client is created lazily and re-created when the process id changes,
+    so a client created before a fork (gunicorn master, multiprocessing)
+    is never shared with the child.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(os.getenv("MONGO_URI"), **client_options())
+            _client_pid = pid
+    return _client
+
+
+def use_client(client):
+    """
+    Make this process use `client` instead of connecting to MONGO_URI,
+    e.g. a mongomock.MongoClient when load testing without a database.
+    """
+    global _client, _client_pid
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def get_db(name=None):
+    """Return a database of this process's client, by default MONGO_DB_NAME (PlogGo)."""
+    return get_client()[name or os.getenv("MONGO_DB_NAME", "PlogGo")]
+
+
+def get_async_db(name=None):
+    """
+    Return a database of this process's AsyncMongoClient, for the ASGI server.
+
+    Uses the same pool settings and pool listener as the synchronous client.
+    """
+    global _async_client, _async_client_pid
+    from pymongo import AsyncMongoClient
+
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        _async_client = AsyncMongoClient(os.getenv("MONGO_URI"), **client_options())
+        _async_client_pid = pid
+    return _async_client[name or os.getenv("MONGO_DB_NAME", "PlogGo")]
+
+
+def _reset_after_fork():
+    # the parent's client (and its monitor threads) must not be used in the child
+    global _client, _client_pid, _async_client, _async_client_pid, _lock
+    _client = None
+    _client_pid = None
+    _async_client = None
+    _async_client_pid = None
+    _lock = threading.Lock()
+    pool_listener.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class LazyDatabase:
+    """
+    Stand-in for a pymongo Database that connects on first use.
+
+    Modules can keep a module-level `db` and use it as before
+    (`db.user.find_one(...)`, `db['plogging_session']`) without creating
+    a client at import time.
+    """
+
+    def __init__(self, name=None):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db(self._name), attr)
+
+    def __getitem__(self, collection):
+        return get_db(self._name)[collection]
+
+    def __repr__(self):
+        return f"LazyDatabase({self._name or os.getenv('MONGO_DB_NAME', 'PlogGo')!r})"
+
+
+db = LazyDatabase()
+
+
+def pool_stats():
+    """
+    Return connection pool utilization of this process.
+
+    `utilization` is the share of maxPoolSize currently checked out; a high
+    `peak_in_use` together with `checkouts_failed_timeout` means the pool
+    (or MONGO_WAIT_QUEUE_TIMEOUT_MS) is too small for the load.
+    """
+    max_pool_size = client_options()["maxPoolSize"]
+    with pool_listener._lock:
+        return {
+            "pid": os.getpid(),
+            "connected": (_client is not None and _client_pid == os.getpid())
+                         or (_async_client is not None and _async_client_pid == os.getpid()),
+            "max_pool_size": max_pool_size,
+            "in_use": pool_listener.in_use,
+            "open": pool_listener.open,
+            "peak_in_use": pool_listener.peak_in_use,
+            "utilization": pool_listener.in_use / max_pool_size if max_pool_size else None,
+            "counters": dict(pool_listener.counters),
+        }
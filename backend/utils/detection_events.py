@@ -0,0 +1,330 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.litter_map import MAX_TILES, tile_center, tile_for, tile_range
+from utils.structured_log import get_logger
+
+# buckets are per user, UTC hour and map tile at this zoom (about 10 km wide at 12)
+BUCKET_ZOOM = int(os.getenv("DETECTION_EVENTS_TILE_ZOOM", 12))
+
+# events per bucket document; a full bucket is continued in a new one
+BUCKET_MAX_EVENTS = int(os.getenv("DETECTION_EVENTS_BUCKET_SIZE", 500))
+
+# buffered events are written every FLUSH_SECONDS, or as soon as MAX_PENDING are waiting
+FLUSH_SECONDS = float(os.getenv("DETECTION_EVENTS_FLUSH_SECONDS", 1))
+MAX_PENDING = int(os.getenv("DETECTION_EVENTS_MAX_PENDING", 1000))
+
+# longest range an aggregate may cover
+MAX_RANGE_HOURS = 24 * 14
+MAX_RANGE_DAYS = 366
+
+log = get_logger("detection-events")
+
+
+def ensure_indexes(db):
+    """Create the indexes for bucket upserts and for time, user and region aggregates."""
+    db.detection_events.create_index([("user_id", 1), ("hour", 1), ("x", 1), ("y", 1), ("count", 1)],
+                                     name="open_bucket")
+    db.detection_events.create_index([("hour", 1)], name="hour")
+    db.detection_events.create_index([("x", 1), ("y", 1), ("hour", 1)], name="tile_hour")
+
+
+def hour_start(moment):
+    """Truncate a datetime to its UTC hour."""
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def make_events(model, detections, location=None, at=None):
+    """
+    Compact event records of one inference, keyed like ws-server's codec:
+    t time, c class id, n class name, p confidence, b box (x1, y1, x2, y2
+    pixels), m model version, l [longitude, latitude] if known.
+
+    Args:
+        model: The models.detect.Model that produced the detections
+        detections (list): (x1, y1, x2, y2, class_id, confidence) tuples
+        location (tuple): Optional (latitude, longitude)
+        at (datetime): Detection time, now by default
+    """
+    at = at or datetime.now(timezone.utc)
+    events = []
+    for x1, y1, x2, y2, class_id, confidence in detections:
+        event = {"t": at, "c": int(class_id), "n": model.labels[class_id], "p": round(float(confidence), 3),
+                 "b": [round(x1), round(y1), round(x2), round(y2)], "m": model.version}
+        if location:
+            event["l"] = [location[1], location[0]]
+        events.append(event)
+    return events
+
+
+def bucket_writes(user_id, hour, tile, events, bucket_size=BUCKET_MAX_EVENTS):
+    """
+    Upserts appending events to the open bucket of a user, hour and tile.
+
+    The bucket also keeps per-class counts and confidence sums
+    (`classes.<name>.n` and `.p`), which is all the aggregates read. A bucket
+    is open while it has room for the whole chunk; otherwise the upsert
+    starts a new one.
+
+    Returns:
+        list: UpdateOne requests, one per chunk of at most `bucket_size` events
+    """
+    x, y = tile if tile else (None, None)
+    writes = []
+    for start in range(0, len(events), bucket_size):
+        chunk = events[start:start + bucket_size]
+        inc = {"count": len(chunk)}
+        for event in chunk:
+            inc[f"classes.{event['n']}.n"] = inc.get(f"classes.{event['n']}.n", 0) + 1
+            inc[f"classes.{event['n']}.p"] = inc.get(f"classes.{event['n']}.p", 0) + event["p"]
+        writes.append(UpdateOne(
+            {"user_id": user_id, "hour": hour, "x": x, "y": y, "count": {"$lte": bucket_size - len(chunk)}},
+            {"$push": {"events": {"$each": chunk}}, "$inc": inc, "$setOnInsert": {"z": BUCKET_ZOOM if tile else None}},
+            upsert=True,
+        ))
+    return writes
+
+
+class DetectionEventBuffer:
+    """
+    Write-behind buffer for detection events, like write_behind.CounterAggregator.
+
+    Events are grouped by bucket (user, hour, tile) in memory and written
+    with one unordered `bulk_write` every `flush_interval` seconds, so a
+    busy hour of one user costs one update per flush, not one per object.
+    Buckets of a failed flush are retried with the next one; after a
+    partial failure some of their events may be stored twice.
+    """
+
+    def __init__(self, get_collection, flush_interval=FLUSH_SECONDS, max_pending=MAX_PENDING):
+        self._get_collection = get_collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(list)
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread_pid = None
+        self._thread = None
+        # counters
+        self.events_received = 0
+        self.events_written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, user_id, model, detections, location=None, at=None):
+        """Buffer the detections of one inference (see `make_events`). Returns the number of events buffered."""
+        if not detections:
+            return 0
+        return self.add(user_id, make_events(model, detections, location, at), location)
+
+    def add(self, user_id, events, location=None):
+        """Buffer events made by `make_events`, e.g. in an inference process. Returns the number buffered."""
+        if not events:
+            return 0
+        self._ensure_thread()
+        tile = tile_for(*location, BUCKET_ZOOM) if location else None
+        key = (user_id, hour_start(events[0]["t"]), tile)
+        with self._lock:
+            if self._pending_count >= self.max_pending * 10:
+                # the database is not keeping up; keep memory bounded
+                self.dropped += len(events)
+                return 0
+            self._pending[key].extend(events)
+            self._pending_count += len(events)
+            self.events_received += len(events)
+            full = self._pending_count >= self.max_pending
+        if full:
+            self._wakeup.set()
+        return len(events)
+
+    def flush(self):
+        """Write all buffered events now. Returns the number of events written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending, self._pending_count = self._pending, defaultdict(list), 0
+
+            keys, writes = [], []
+            for key, events in batch.items():
+                for write in bucket_writes(*key, events):
+                    keys.append(key)
+                    writes.append(write)
+            failed = set()
+            try:
+                self._get_collection().bulk_write(writes, ordered=False)
+            except BulkWriteError as e:
+                failed = {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+            except Exception:
+                failed = set(keys)
+            if failed:
+                self.failed_flushes += 1
+                with self._lock:
+                    for key in failed:
+                        self._pending[key][:0] = batch[key]
+                        self._pending_count += len(batch[key])
+
+            written = sum(len(events) for key, events in batch.items() if key not in failed)
+            self.flushes += 1
+            self.events_written += written
+            return written
+
+    def _ensure_thread(self):
+        # started lazily in the process that records, not in a parent that later forks
+        if self._thread_pid == os.getpid() or self._stopped:
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="detection-events", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("detection_events_flush_failed")
+
+    def stop(self, timeout=5):
+        """Stop the flusher thread and write everything still buffered."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            if not self.flush():
+                time.sleep(0.1)
+
+    def stats(self):
+        """Return the buffer counters."""
+        return {
+            "pending_events": self._pending_count,
+            "pending_buckets": len(self._pending),
+            "events_received": self.events_received,
+            "events_written": self.events_written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+def parse_range(start, end, interval):
+    """
+    Parse and validate the `from`/`to` query parameters (YYYY-MM-DD, `to`
+    inclusive) of an aggregate.
+
+    Returns:
+        tuple: (start datetime, exclusive end datetime), UTC
+
+    Raises:
+        ValueError: If the dates are malformed or the range is too large
+    """
+    if interval not in ("hour", "day"):
+        raise ValueError("interval must be 'hour' or 'day'")
+    try:
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        end_day = datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=timezone.utc) if end else today
+        start_day = (datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc) if start
+                     else end_day - timedelta(days=6))
+    except ValueError:
+        raise ValueError("Dates must be formatted as YYYY-MM-DD")
+    if start_day > end_day:
+        raise ValueError("'from' must not be after 'to'")
+    end_time = end_day + timedelta(days=1)
+    if interval == "hour" and end_time - start_day > timedelta(hours=MAX_RANGE_HOURS):
+        raise ValueError(f"Hourly range is limited to {MAX_RANGE_HOURS // 24} days")
+    if end_time - start_day > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f"Range is limited to {MAX_RANGE_DAYS} days")
+    return start_day, end_time
+
+
+def _match(start, end, user_id=None, bbox=None):
+    match = {"hour": {"$gte": start, "$lt": end}}
+    if user_id is not None:
+        match["user_id"] = user_id
+    if bbox is not None:
+        min_x, max_x, min_y, max_y = tile_range(bbox, BUCKET_ZOOM)
+        match["x"] = {"$gte": min_x, "$lte": max_x}
+        match["y"] = {"$gte": min_y, "$lte": max_y}
+    return match
+
+
+def class_counts_over_time(db, start, end, interval="day", user_id=None, bbox=None):
+    """
+    Detected objects per class and hour or day, from bucket totals only.
+
+    Returns:
+        list: {"period", "total", "counts": {class: count}}, oldest first
+    """
+    period = {"$dateToString": {"format": "%Y-%m-%dT%H:00Z" if interval == "hour" else "%Y-%m-%d",
+                                "date": "$hour"}}
+    pipeline = [
+        {"$match": _match(start, end, user_id, bbox)},
+        {"$project": {"period": period, "classes": {"$objectToArray": "$classes"}}},
+        {"$unwind": "$classes"},
+        {"$group": {"_id": {"period": "$period", "name": "$classes.k"}, "count": {"$sum": "$classes.v.n"}}},
+    ]
+    series = defaultdict(dict)
+    for row in db.detection_events.aggregate(pipeline):
+        series[row["_id"]["period"]][row["_id"]["name"]] = row["count"]
+    return [{"period": key, "total": sum(counts.values()), "counts": counts}
+            for key, counts in sorted(series.items())]
+
+
+def class_counts_by_region(db, start, end, zoom=BUCKET_ZOOM, bbox=None):
+    """
+    Detected objects per class and map tile at `zoom` (at most BUCKET_ZOOM),
+    with the mean confidence per class, from bucket totals only. Events
+    without a location are not counted. Like the heatmap, at most MAX_TILES
+    tiles are returned, the ones with the most objects.
+
+    Returns:
+        list: {"x", "y", "latitude", "longitude", "total", "counts", "confidence"} per tile
+
+    Raises:
+        ValueError: If zoom is negative
+    """
+    if zoom < 0:
+        raise ValueError("zoom must not be negative")
+    zoom = min(zoom, BUCKET_ZOOM)
+    scale = 1 << (BUCKET_ZOOM - zoom)
+    match = _match(start, end, bbox=bbox)
+    match.setdefault("x", {"$ne": None})
+    pipeline = [
+        {"$match": match},
+        {"$project": {"tx": {"$floor": {"$divide": ["$x", scale]}}, "ty": {"$floor": {"$divide": ["$y", scale]}},
+                      "classes": {"$objectToArray": "$classes"}}},
+        {"$unwind": "$classes"},
+        {"$group": {"_id": {"x": "$tx", "y": "$ty", "name": "$classes.k"},
+                    "count": {"$sum": "$classes.v.n"}, "confidence": {"$sum": "$classes.v.p"}}},
+        {"$group": {"_id": {"x": "$_id.x", "y": "$_id.y"}, "total": {"$sum": "$count"},
+                    "classes": {"$push": {"name": "$_id.name", "count": "$count", "confidence": "$confidence"}}}},
+        {"$sort": {"total": -1}},
+        {"$limit": MAX_TILES},
+    ]
+    tiles = []
+    for row in db.detection_events.aggregate(pipeline):
+        x, y = int(row["_id"]["x"]), int(row["_id"]["y"])
+        latitude, longitude = tile_center(x, y, zoom)
+        tiles.append({
+            "x": x, "y": y, "latitude": latitude, "longitude": longitude, "total": row["total"],
+            "counts": {c["name"]: c["count"] for c in row["classes"]},
+            "confidence": {c["name"]: round(c["confidence"] / c["count"], 3) if c["count"] else None
+                           for c in row["classes"]},
+        })
+    return tiles
+
@@ -0,0 +1,138 @@
+import numpy as np
+
+# IoU thresholds of mAP@50-95 (COCO): 0.50, 0.55, ..., 0.95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def box_iou(a, b):
+    """IoU of every box in `a` (N x 4, x1 y1 x2 y2) with every box in `b` (M x 4), as an N x M array."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def match_predictions(pred_boxes, pred_classes, true_boxes, true_classes, thresholds=IOU_THRESHOLDS):
+    """
+    Mark each prediction as a true positive at each IoU threshold. A ground
+    truth box is matched by at most one prediction of its class, highest IoU
+    first.
+
+    Returns:
+        numpy.ndarray: Boolean array, predictions x thresholds
+    """
+    pred_classes = np.asarray(pred_classes).reshape(-1)
+    true_classes = np.asarray(true_classes).reshape(-1)
+    correct = np.zeros((len(pred_classes), len(thresholds)), dtype=bool)
+    if not len(pred_classes) or not len(true_classes):
+        return correct
+    iou = box_iou(true_boxes, pred_boxes) * (true_classes[:, None] == pred_classes[None, :])
+    for t, threshold in enumerate(thresholds):
+        true_index, pred_index = np.nonzero(iou >= threshold)
+        if not len(true_index):
+            continue
+        order = np.argsort(-iou[true_index, pred_index], kind="stable")
+        true_index, pred_index = true_index[order], pred_index[order]
+        # keep the best match of each prediction, then of each ground truth box
+        _, first = np.unique(pred_index, return_index=True)
+        true_index, pred_index = true_index[first], pred_index[first]
+        order = np.argsort(-iou[true_index, pred_index], kind="stable")
+        true_index, pred_index = true_index[order], pred_index[order]
+        _, first = np.unique(true_index, return_index=True)
+        correct[pred_index[first], t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """
+    Area under a precision-recall curve, with the precision envelope sampled
+    at 101 recall points (COCO, as ultralytics computes it).
+    """
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    envelope = np.flip(np.maximum.accumulate(np.flip(precision)))
+    points = np.linspace(0, 1, 101)
+    values = np.interp(points, recall, envelope)
+    return float(np.sum((values[1:] + values[:-1]) / 2 * np.diff(points)))
+
+
+class DetectionMetrics:
+    """
+    Streaming accumulator for detection accuracy. Only per-prediction
+    results (confidence, class, true positive flags) are kept, so images can
+    be evaluated elsewhere and added one at a time.
+    """
+
+    def __init__(self, class_count):
+        self.class_count = class_count
+        self.confidences = []
+        self.classes = []
+        self.correct = []
+        self.true_counts = np.zeros(class_count, dtype=np.int64)
+        self.images = 0
+
+    def add(self, confidences, pred_classes, correct, true_classes):
+        """Add one image: its predictions, their `match_predictions` result, and its ground truth classes."""
+        self.confidences.append(np.asarray(confidences, dtype=np.float64).reshape(-1))
+        self.classes.append(np.asarray(pred_classes, dtype=np.int64).reshape(-1))
+        self.correct.append(np.asarray(correct, dtype=bool).reshape(-1, len(IOU_THRESHOLDS)))
+        self.true_counts += np.bincount(np.asarray(true_classes, dtype=np.int64).reshape(-1),
+                                        minlength=self.class_count)[:self.class_count]
+        self.images += 1
+
+    def results(self):
+        """
+        Accuracy over all added images.
+
+        Precision and recall are at IoU 0.5 over every prediction kept, i.e.
+        at the confidence threshold the model was run with. Classes without
+        ground truth boxes are left out of the means.
+
+        Returns:
+            dict: map50, map50_95, precision, recall and per class
+                {class: {"instances", "predictions", "precision", "recall", "ap50", "ap50_95"}}
+        """
+        confidences = np.concatenate(self.confidences) if self.confidences else np.zeros(0)
+        classes = np.concatenate(self.classes) if self.classes else np.zeros(0, dtype=np.int64)
+        correct = (np.concatenate(self.correct) if self.correct
+                   else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool))
+        order = np.argsort(-confidences, kind="stable")
+        classes, correct = classes[order], correct[order]
+
+        per_class = {}
+        for c in range(self.class_count):
+            instances = int(self.true_counts[c])
+            hits = correct[classes == c]
+            predictions = len(hits)
+            if not instances:
+                if predictions:
+                    per_class[c] = {"instances": 0, "predictions": predictions, "precision": 0.0,
+                                    "recall": 0.0, "ap50": None, "ap50_95": None}
+                continue
+            true_positives = np.cumsum(hits, axis=0)
+            false_positives = np.cumsum(~hits, axis=0)
+            recall = true_positives / instances
+            precision = true_positives / np.maximum(true_positives + false_positives, 1)
+            ap = [average_precision(recall[:, t], precision[:, t]) if predictions else 0.0
+                  for t in range(len(IOU_THRESHOLDS))]
+            per_class[c] = {
+                "instances": instances,
+                "predictions": predictions,
+                "precision": float(true_positives[-1, 0] / predictions) if predictions else 0.0,
+                "recall": float(recall[-1, 0]) if predictions else 0.0,
+                "ap50": ap[0],
+                "ap50_95": float(np.mean(ap)),
+            }
+
+        scored = [row for row in per_class.values() if row["instances"]]
+
+        def mean(field):
+            return float(np.mean([row[field] for row in scored])) if scored else 0.0
+
+        return {"images": self.images, "map50": mean("ap50"), "map50_95": mean("ap50_95"),
+                "precision": mean("precision"), "recall": mean("recall"), "classes": per_class}
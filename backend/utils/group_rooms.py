@@ -0,0 +1,184 @@
+import os
+
+# seconds between group snapshots
+TICK_SECONDS = float(os.getenv("GROUP_TICK_SECONDS", "1"))
+MAX_MEMBERS = int(os.getenv("GROUP_MAX_MEMBERS", "500"))
+# 5 decimals is about 1 m, finer than the live map can show
+COORDINATE_DECIMALS = 5
+
+
+def group_room(group_id, codec="json"):
+    """Socket.IO room of the members of a group that use a payload codec."""
+    return f"group:{group_id}" if codec == "json" else f"group:{group_id}:{codec}"
+
+
+class GroupMember:
+    __slots__ = ("index", "user_id", "name", "sid", "session_id", "latitude", "longitude", "distance")
+
+    def __init__(self, index, user_id, name, sid, session_id):
+        self.index = index
+        self.user_id = user_id
+        self.name = name
+        self.sid = sid
+        self.session_id = session_id
+        self.latitude = None
+        self.longitude = None
+        self.distance = 0.0
+
+    def position(self):
+        return [self.index, self.latitude, self.longitude, round(self.distance)]
+
+
+class GroupRoom:
+    """
+    Live positions of the members of one group plogging event.
+
+    Members are numbered when they join, and snapshots refer to them by that
+    number and their display name only, never by account id. A delta
+    snapshot lists only the members that moved, joined or left since the
+    previous tick, as rows instead of objects, so one tick costs one message
+    per member whatever the update rate of the room.
+    """
+
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.members = {}
+        self.next_index = 0
+        self.tick = 0
+        self.total_distance = 0.0
+        self.moved = set()
+        self.joined = []
+        self.left = []
+
+    def join(self, user_id, name, sid, session_id):
+        member = self.members.get(user_id)
+        if member is None:
+            if len(self.members) >= MAX_MEMBERS:
+                raise ValueError(f"Group is full ({MAX_MEMBERS} members)")
+            member = self.members[user_id] = GroupMember(self.next_index, user_id, name, sid, session_id)
+            self.next_index += 1
+            self.joined.append(member)
+        member.sid, member.session_id = sid, session_id
+        return member
+
+    def leave(self, user_id):
+        member = self.members.pop(user_id, None)
+        if member is not None:
+            self.total_distance -= member.distance
+            self.moved.discard(member)
+            if member in self.joined:
+                self.joined.remove(member)
+            else:
+                self.left.append(member.index)
+        return member
+
+    def update(self, member, latitude, longitude, distance):
+        member.latitude = round(latitude, COORDINATE_DECIMALS)
+        member.longitude = round(longitude, COORDINATE_DECIMALS)
+        member.distance += distance
+        self.total_distance += distance
+        self.moved.add(member)
+
+    def totals(self):
+        return {"members": len(self.members), "distance": round(self.total_distance)}
+
+    def snapshot(self):
+        """Full state of the room, sent to a member when it joins."""
+        return {
+            "groupId": self.group_id,
+            "tick": self.tick,
+            "members": [[member.index, member.name, member.latitude, member.longitude, round(member.distance)]
+                        for member in self.members.values()],
+            "totals": self.totals(),
+        }
+
+    def delta(self):
+        """Changes since the previous tick, or None if nothing changed."""
+        if not (self.moved or self.joined or self.left):
+            return None
+        self.tick += 1
+        payload = {"groupId": self.group_id, "tick": self.tick, "totals": self.totals()}
+        if self.joined:
+            payload["joined"] = [[member.index, member.name] for member in self.joined]
+        if self.moved:
+            payload["positions"] = [member.position() for member in self.moved]
+        if self.left:
+            payload["left"] = self.left
+        self.moved, self.joined, self.left = set(), [], []
+        return payload
+
+
+class GroupRooms:
+    """
+    Group rooms of this ws-server process, indexed by connection and by
+    tracking session so location updates find their member in O(1).
+
+    Group state is per process: with several ws-server processes, all
+    members of a group must be routed to the same one.
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.sid_members = {}
+        self.session_members = {}
+
+    def join(self, group_id, sid, session_id, user_id, name):
+        """Add a tracking session to a group, leaving any group it was in. Returns the room snapshot."""
+        self.leave(sid)
+        room = self.rooms.get(group_id) or GroupRoom(group_id)
+        previous = room.members.get(user_id)
+        if previous is not None:
+            # the user rejoins from a new connection before the old one closed
+            self.sid_members.pop(previous.sid, None)
+            self.session_members.pop(previous.session_id, None)
+        member = room.join(user_id, name, sid, session_id)
+        self.rooms[group_id] = room
+        self.sid_members[sid] = (room, member)
+        self.session_members[session_id] = (room, member)
+        return room.snapshot()
+
+    def member_sid(self, group_id, user_id):
+        """Connection of a user's member in a group, or None if the user is not in it."""
+        room = self.rooms.get(group_id)
+        member = room.members.get(user_id) if room is not None else None
+        return member.sid if member is not None else None
+
+    def leave(self, sid):
+        """Remove a connection's member from its group. Returns the group id, if any."""
+        entry = self.sid_members.pop(sid, None)
+        if entry is None:
+            return None
+        room, member = entry
+        self.session_members.pop(member.session_id, None)
+        room.leave(member.user_id)
+        if not room.members and not room.left:
+            del self.rooms[room.group_id]
+        return room.group_id
+
+    def leave_session(self, session_id):
+        """Remove the member of a finished tracking session. Returns (group id, sid), if it was in a group."""
+        entry = self.session_members.get(session_id)
+        if entry is None:
+            return None
+        sid = entry[1].sid
+        return self.leave(sid), sid
+
+    def update(self, session_id, latitude, longitude, distance):
+        """Record a stored fix of a session, if it is in a group."""
+        entry = self.session_members.get(session_id)
+        if entry is not None:
+            entry[0].update(entry[1], latitude, longitude, distance)
+
+    def deltas(self):
+        """(group_id, delta snapshot) of every room that changed since the previous tick."""
+        changed = []
+        for group_id, room in list(self.rooms.items()):
+            payload = room.delta()
+            if payload is not None:
+                changed.append((group_id, payload))
+            if not room.members:
+                del self.rooms[group_id]
+        return changed
+
+    def stats(self):
+        return {"group_rooms": len(self.rooms), "group_members": len(self.sid_members)}
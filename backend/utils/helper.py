@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
@@ -30,4 +31,24 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     distance = R * c
     
-    return distance
\ No newline at end of file
+    return distance
+
+
+def haversine_segments(latitudes, longitudes):
+    """
+    Calculate the distances between consecutive points of a route in meters,
+    vectorized with NumPy (same formula as haversine_distance).
+
+    Args:
+        latitudes, longitudes: Sequences of coordinates (in degrees)
+
+    Returns:
+        numpy array with one distance per segment (one less than the number of points)
+    """
+    R = 6371000
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
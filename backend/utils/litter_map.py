@@ -0,0 +1,200 @@
+import math
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+
+# zoom levels at which tile buckets are maintained (web mercator / slippy map tiles)
+TILE_ZOOMS = (6, 9, 12, 15)
+
+# upper bound on the number of buckets a single heatmap request may read
+MAX_TILES = 4096
+
+MAX_LATITUDE = 85.05112878
+
+
+def ensure_indexes(db):
+    """Create the indexes for raw detections and heatmap tile buckets."""
+    db.litter_detection.create_index([("location", "2dsphere")], name="location_2dsphere")
+    db.litter_tiles.create_index([("z", 1), ("x", 1), ("y", 1)], name="zxy")
+
+
+def parse_location(data):
+    """
+    Read optional `latitude`/`longitude` fields from a request body.
+
+    Returns:
+        tuple: (latitude, longitude) as floats, or None if not provided
+
+    Raises:
+        ValueError: If only one coordinate is given or they are out of range
+    """
+    latitude = data.get("latitude")
+    longitude = data.get("longitude")
+    if latitude is None and longitude is None:
+        return None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must both be numbers")
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError("latitude or longitude out of range")
+    return latitude, longitude
+
+
+def tile_for(latitude, longitude, zoom):
+    """
+    Return the (x, y) slippy map tile containing a point at a zoom level.
+    """
+    n = 1 << zoom
+    latitude = max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE)
+    lat_rad = math.radians(latitude)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_center(x, y, zoom):
+    """Return the (latitude, longitude) of the center of a tile."""
+    n = 1 << zoom
+    longitude = (x + 0.5) / n * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return latitude, longitude
+
+
+def record_detection(db, user_id, latitude, longitude, litter_counts, points):
+    """
+    Store a located detection and add its counts to every tile bucket level.
+
+    Args:
+        db: PlogGo database
+        user_id (str): User who submitted the detection
+        latitude, longitude (float): Where the litter was picked up
+        litter_counts (dict): Litter class -> number of items detected
+        points (int): Points awarded for the detection
+    """
+    writes = detection_writes(user_id, latitude, longitude, litter_counts, points)
+    if writes:
+        detection, tile_updates = writes
+        db.litter_detection.insert_one(detection)
+        db.litter_tiles.bulk_write(tile_updates, ordered=False)
+
+
+async def record_detection_async(db, user_id, latitude, longitude, litter_counts, points):
+    """Async variant of `record_detection` for an AsyncMongoClient database."""
+    writes = detection_writes(user_id, latitude, longitude, litter_counts, points)
+    if writes:
+        detection, tile_updates = writes
+        await db.litter_detection.insert_one(detection)
+        await db.litter_tiles.bulk_write(tile_updates, ordered=False)
+
+
+def detection_writes(user_id, latitude, longitude, litter_counts, points):
+    """
+    Build the raw detection document and the tile bucket upserts of a detection.
+
+    Returns:
+        tuple: (detection document, list of UpdateOne), or None if nothing was detected
+    """
+    total = sum(litter_counts.values())
+    if not total:
+        return None
+    detection = {
+        "user_id": user_id,
+        "location": {"type": "Point", "coordinates": [longitude, latitude]},
+        "litter": dict(litter_counts),
+        "points": points,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+    inc = {f"counts.{litter}": count for litter, count in litter_counts.items()}
+    inc["total"] = total
+    updates = []
+    for zoom in TILE_ZOOMS:
+        x, y = tile_for(latitude, longitude, zoom)
+        updates.append(UpdateOne(
+            {"_id": f"{zoom}/{x}/{y}"},
+            {"$inc": inc, "$setOnInsert": {"z": zoom, "x": x, "y": y}},
+            upsert=True,
+        ))
+    return detection, updates
+
+
+def parse_bbox(value):
+    """
+    Parse a `minLon,minLat,maxLon,maxLat` bounding box.
+
+    Raises:
+        ValueError: If the box is malformed
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums")
+    if not -180 <= min_lon <= 180 or not -180 <= max_lon <= 180:
+        raise ValueError("bbox longitude out of range")
+    if not -90 <= min_lat <= 90 or not -90 <= max_lat <= 90:
+        raise ValueError("bbox latitude out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tile_range(bbox, zoom):
+    """Return the inclusive (min_x, max_x, min_y, max_y) tiles covering a bbox."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    min_x, min_y = tile_for(max_lat, min_lon, zoom)
+    max_x, max_y = tile_for(min_lat, max_lon, zoom)
+    return min_x, max_x, min_y, max_y
+
+
+def bucket_zoom(bbox, zoom):
+    """
+    Pick the stored bucket level for a map zoom: the finest level at most
+    three levels below the map zoom whose tiles covering the bbox stay
+    within MAX_TILES, falling back to the coarsest level.
+    """
+    candidates = [z for z in TILE_ZOOMS if z <= zoom + 3] or [TILE_ZOOMS[0]]
+    for z in reversed(candidates):
+        min_x, max_x, min_y, max_y = tile_range(bbox, z)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) <= MAX_TILES:
+            return z
+    return TILE_ZOOMS[0]
+
+
+def fetch_heatmap(db, bbox, zoom):
+    """
+    Read the tile buckets covering a bounding box.
+
+    Returns:
+        tuple: (bucket zoom used, list of tiles with center and counts)
+    """
+    z = bucket_zoom(bbox, zoom)
+    return z, _serialize_tiles(_tile_cursor(db, bbox, z), z)
+
+
+async def fetch_heatmap_async(db, bbox, zoom):
+    """Async variant of `fetch_heatmap` for an AsyncMongoClient database."""
+    z = bucket_zoom(bbox, zoom)
+    return z, _serialize_tiles(await _tile_cursor(db, bbox, z).to_list(None), z)
+
+
+def _tile_cursor(db, bbox, z):
+    min_x, max_x, min_y, max_y = tile_range(bbox, z)
+    return db.litter_tiles.find(
+        {"z": z, "x": {"$gte": min_x, "$lte": max_x}, "y": {"$gte": min_y, "$lte": max_y}},
+        {"_id": 0},
+    ).limit(MAX_TILES)
+
+
+def _serialize_tiles(docs, z):
+    tiles = []
+    for doc in docs:
+        latitude, longitude = tile_center(doc["x"], doc["y"], z)
+        tiles.append({
+            "x": doc["x"],
+            "y": doc["y"],
+            "latitude": latitude,
+            "longitude": longitude,
+            "total": doc.get("total", 0),
+            "counts": doc.get("counts", {}),
+        })
+    return tiles
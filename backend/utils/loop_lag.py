@@ -0,0 +1,38 @@
+import math
+import time
+from collections import deque
+
+
+class LoopLagMonitor:
+    """
+    Event loop lag of a cooperative server (eventlet): a background task
+    sleeps `interval` seconds in a loop and records how much later than
+    requested it wakes up. Handlers that block the loop, e.g. on a
+    synchronous database call, show up as lag of every other connection.
+    """
+
+    def __init__(self, sleep, interval=0.1, window=600):
+        self.sleep = sleep
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_ms = 0.0
+
+    def run(self):
+        while True:
+            start = time.perf_counter()
+            self.sleep(self.interval)
+            lag_ms = max((time.perf_counter() - start - self.interval) * 1000, 0.0)
+            self.samples.append(lag_ms)
+            self.max_ms = max(self.max_ms, lag_ms)
+
+    def stats(self):
+        """Lag over the last `window` samples, and the maximum since start, in ms."""
+        values = sorted(self.samples)
+        if not values:
+            return {"samples": 0, "mean_ms": None, "p99_ms": None, "max_ms": None}
+        return {
+            "samples": len(values),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p99_ms": round(values[max(math.ceil(0.99 * len(values)), 1) - 1], 2),
+            "max_ms": round(self.max_ms, 2),
+        }
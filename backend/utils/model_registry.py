@@ -0,0 +1,283 @@
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.structured_log import get_logger
+
+# directory of model bundles (one sub-directory per version) and manifest.json
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "./models/registry")
+
+# how often each serving process checks the manifest for a new version
+POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", 5))
+
+# shadow inferences waiting or running at once; more are skipped, not queued
+SHADOW_MAX_PENDING = int(os.getenv("MODEL_SHADOW_MAX_PENDING", 4))
+
+MANIFEST = "manifest.json"
+ROLLOUT_MODES = ("shadow", "percent")
+
+log = get_logger("model-registry")
+
+# what requests are served with; replaced as a whole, so a request never sees half a swap
+Routing = namedtuple("Routing", ["active", "candidate", "mode", "percent"])
+
+
+def read_manifest(directory):
+    """
+    Read and validate `manifest.json` of a registry directory:
+
+        {"active": "v3", "candidate": {"version": "v4", "mode": "percent", "percent": 10}}
+
+    `candidate` is optional; mode "shadow" runs it next to the active version
+    without serving its results, mode "percent" serves it to that share of users.
+
+    Returns:
+        dict: The manifest, or None if the directory has none
+
+    Raises:
+        ValueError: If the manifest is malformed
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not isinstance(manifest.get("active"), str):
+        raise ValueError("manifest needs an active version")
+    candidate = manifest.get("candidate")
+    if candidate is not None:
+        if not isinstance(candidate.get("version"), str) or candidate.get("mode") not in ROLLOUT_MODES:
+            raise ValueError(f"candidate needs a version and a mode in {ROLLOUT_MODES}")
+        if candidate["mode"] == "percent" and not 0 <= candidate.get("percent", -1) <= 100:
+            raise ValueError("percent rollout needs a percent between 0 and 100")
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    """Replace the manifest atomically, so serving processes never read a partial file."""
+    path = os.path.join(directory, MANIFEST)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(temporary, path)
+
+
+def rollout_bucket(key):
+    """Stable 0-99 bucket of a routing key (e.g. a user id), so a user keeps seeing the same version."""
+    return zlib.crc32(str(key).encode()) % 100
+
+
+class ModelRegistry:
+    """
+    Versioned models of a registry directory, hot-swapped without a restart.
+
+    A background thread of each serving process polls the manifest. A new
+    version is loaded and warmed up by `load(version, bundle_dir)` next to
+    the one being served, then becomes live with a single assignment;
+    requests already running finish on the model they started with. A
+    version that fails to load is logged and the current one keeps serving.
+
+    Without a manifest, `fallback()` provides the model, e.g. the single
+    model path used before the registry existed.
+    """
+
+    def __init__(self, directory=REGISTRY_DIR, load=None, fallback=None, poll_seconds=POLL_SECONDS):
+        self.directory = directory
+        self.load = load
+        self.fallback = fallback
+        self.poll_seconds = poll_seconds
+        self._routing = None
+        self._models = {}
+        self._signature = None
+        # held while loading, which can take seconds; requests never wait on it once a model is live
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._shadow_pool = None
+        self._shadow_pending = 0
+        # counters
+        self.served = Counter()
+        self.swaps = 0
+        self.load_failures = 0
+        self.last_error = None
+        self.shadow_runs = 0
+        self.shadow_disagreements = 0
+        self.shadow_skipped = 0
+
+    def route(self, key=None):
+        """
+        Pick the model for a request.
+
+        Args:
+            key: Routing key for percentage rollouts, e.g. the user id; a
+                random bucket is used if None
+
+        Returns:
+            tuple: (model to serve with, model to shadow with or None)
+        """
+        self._ensure_thread()
+        routing = self._routing
+        if routing is None:
+            with self._refresh_lock:
+                if self._routing is None:
+                    self._refresh_locked(initial=True)
+            routing = self._routing
+        if routing.candidate is None:
+            return routing.active, None
+        if routing.mode == "shadow":
+            return routing.active, routing.candidate
+        bucket = rollout_bucket(key) if key is not None else random.randrange(100)
+        return (routing.candidate if bucket < routing.percent else routing.active), None
+
+    def detect(self, run, key=None, summarize=None):
+        """
+        Run `run(model)` on the routed model. In shadow mode the candidate
+        runs the same call on a background thread and the two results are
+        logged for comparison, through `summarize(model, result)` if given
+        (e.g. counts per class instead of raw boxes).
+
+        Returns:
+            tuple: (model that produced the result, result)
+        """
+        model, shadow = self.route(key)
+        result = run(model)
+        self.served[model.version] += 1
+        if shadow is not None:
+            summarize = summarize or (lambda model, result: result)
+            self._shadow(shadow, lambda m: summarize(m, run(m)), model, summarize(model, result))
+        return model, result
+
+    def refresh(self):
+        """Load what the manifest asks for if it changed since the last check."""
+        with self._refresh_lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self, initial=False):
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST)) if self.directory else None
+        except FileNotFoundError:
+            stat = None
+        signature = (stat.st_mtime_ns, stat.st_size) if stat else None
+        if self._routing is not None and signature == self._signature:
+            return
+
+        if signature is None:
+            if self._routing is None:
+                if self.fallback is None:
+                    raise RuntimeError(f"No {MANIFEST} in {self.directory} and no fallback model")
+                self._swap(Routing(self.fallback(), None, None, 0), {})
+            self._signature = signature
+            return
+
+        try:
+            manifest = read_manifest(self.directory)
+            active = self._get(manifest["active"])
+        except Exception as e:
+            self._failed(e)
+            if initial:
+                raise
+            return
+        models = {active.version: active}
+        candidate, mode, percent = manifest.get("candidate"), None, 0
+        if candidate:
+            try:
+                models[candidate["version"]] = self._get(candidate["version"])
+                mode, percent = candidate["mode"], candidate.get("percent", 0)
+            except Exception as e:
+                self._failed(e)
+        routing = Routing(active, models.get(candidate["version"]) if mode else None, mode, percent)
+        self._swap(routing, models)
+        # a failed load is retried on the next poll; loaded versions are reused from self._models
+        if not candidate or mode:
+            self._signature = signature
+
+    def _get(self, version):
+        model = self._models.get(version)
+        if model is None:
+            started = time.perf_counter()
+            model = self.load(version, os.path.join(self.directory, version))
+            log.info("model_loaded", version=version, ms=round((time.perf_counter() - started) * 1000))
+        return model
+
+    def _swap(self, routing, models):
+        previous = self._routing
+        self._routing = routing
+        self._models = models
+        if previous is None or _describe(previous) != _describe(routing):
+            self.swaps += previous is not None
+            log.info("model_routing", **_describe(routing))
+
+    def _failed(self, error):
+        self.load_failures += 1
+        self.last_error = str(error)
+        log.error("model_load_failed", error=str(error))
+
+    def _shadow(self, shadow, run, model, result):
+        with self._lock:
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                self.shadow_skipped += 1
+                return
+            self._shadow_pending += 1
+            if self._shadow_pool is None:
+                self._shadow_pool = ThreadPoolExecutor(1, thread_name_prefix="model-shadow")
+
+        def compare():
+            try:
+                shadow_result = run(shadow)
+                self.shadow_runs += 1
+                self.shadow_disagreements += shadow_result != result
+                log.info("model_shadow", active=model.version, candidate=shadow.version,
+                         agree=shadow_result == result, active_result=result, candidate_result=shadow_result)
+            except Exception:
+                log.exception("model_shadow_failed", candidate=shadow.version)
+            finally:
+                with self._lock:
+                    self._shadow_pending -= 1
+
+        self._shadow_pool.submit(compare)
+
+    def _ensure_thread(self):
+        # like the write-behind flusher, started lazily in the process that serves
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                # a forked child must not reuse the parent's sessions or threads
+                self._routing, self._models, self._signature = None, {}, None
+                self._shadow_pool, self._shadow_pending = None, 0
+                threading.Thread(target=self._run, name="model-registry", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("model_refresh_failed")
+
+    def stats(self):
+        """Versions being served, rollout and swap/shadow counters of this process."""
+        routing = self._routing
+        return {
+            **(_describe(routing) if routing else {"active": None, "candidate": None, "mode": None, "percent": 0}),
+            "served": dict(self.served),
+            "swaps": self.swaps,
+            "load_failures": self.load_failures,
+            "last_error": self.last_error,
+            "shadow_runs": self.shadow_runs,
+            "shadow_disagreements": self.shadow_disagreements,
+            "shadow_skipped": self.shadow_skipped,
+        }
+
+
+def _describe(routing):
+    return {"active": routing.active.version,
+            "candidate": routing.candidate.version if routing.candidate else None,
+            "mode": routing.mode, "percent": routing.percent}
@@ -0,0 +1,188 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import boto3
+from PIL import Image, ImageOps
+from pymongo import ReturnDocument
+
+# square thumbnail edge lengths in pixels, the middle one becomes `pfp`
+THUMBNAIL_SIZES = (64, 256, 512)
+PFP_SIZE = 256
+
+# formats written for every size: (extension, PIL format, content type)
+THUMBNAIL_FORMATS = (
+    ("webp", "WEBP", "image/webp"),
+    ("jpg", "JPEG", "image/jpeg"),
+)
+
+ALLOWED_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+UPLOAD_URL_EXPIRY = 600
+
+# how long a worker may hold a job before another worker retries it
+JOB_LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+
+
+def make_s3_client():
+    """
+    Create the S3 client from the environment.
+
+    Setting AWS_S3_ENDPOINT_URL points the client at an S3 compatible
+    stand-in (MinIO, moto_server) for local development and tests.
+    """
+    return boto3.client('s3',
+        region_name=os.getenv("AWS_S3_REGION"),
+        endpoint_url=os.getenv("AWS_S3_ENDPOINT_URL") or None,
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+    )
+
+
+def public_url(key, bucket_name=None, region_name=None):
+    """Return the public URL of an object in the profile picture bucket."""
+    bucket_name = bucket_name or os.getenv("AWS_S3_BUCKET_NAME")
+    region_name = region_name or os.getenv("AWS_S3_REGION")
+    endpoint = os.getenv("AWS_S3_ENDPOINT_URL")
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{bucket_name}/{key}"
+    return f"https://{bucket_name}.s3.{region_name}.amazonaws.com/{key}"
+
+
+def upload_prefix(user_id):
+    return f"uploads/profile_pics/{user_id}/"
+
+
+def create_upload(s3, bucket_name, user_id, content_type="image/jpeg"):
+    """
+    Create a presigned POST the client uses to upload a picture directly to S3.
+
+    Returns:
+        dict: `url` and form `fields` for the upload and the object `key`
+
+    Raises:
+        ValueError: If the content type is not an accepted image type
+    """
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    key = f"{upload_prefix(user_id)}{uuid.uuid4()}"
+    post = s3.generate_presigned_post(
+        Bucket=bucket_name,
+        Key=key,
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, MAX_UPLOAD_BYTES],
+        ],
+        ExpiresIn=UPLOAD_URL_EXPIRY,
+    )
+    return {"url": post["url"], "fields": post["fields"], "key": key}
+
+
+def enqueue_thumbnail_job(db, user_id, key):
+    """
+    Queue an uploaded picture for thumbnailing.
+
+    Raises:
+        ValueError: If the key is not one of the user's upload keys
+    """
+    if not key or not key.startswith(upload_prefix(user_id)) or ".." in key:
+        raise ValueError("Invalid upload key")
+    now = datetime.now(timezone.utc)
+    db.pfp_jobs.insert_one({
+        "user_id": user_id,
+        "key": key,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "lease_until": now,
+    })
+
+
+def ensure_indexes(db):
+    """Create the index used by workers to claim jobs."""
+    db.pfp_jobs.create_index([("status", 1), ("lease_until", 1)], name="status_lease")
+
+
+def claim_job(db):
+    """
+    Atomically claim the next pending job, or a job whose worker's lease expired.
+
+    A job whose lease expired after MAX_ATTEMPTS claims is marked failed
+    instead: its worker died without reporting an error (e.g. killed while
+    decoding a huge image), and claiming it again would kill the next one.
+
+    Returns:
+        dict: The claimed job, or None if the queue is empty
+    """
+    now = datetime.now(timezone.utc)
+    db.pfp_jobs.update_many(
+        {"status": "processing", "lease_until": {"$lte": now}, "attempts": {"$gte": MAX_ATTEMPTS}},
+        {"$set": {"status": "failed", "error": "Lease expired after the last attempt"}},
+    )
+    return db.pfp_jobs.find_one_and_update(
+        {"status": {"$in": ["pending", "processing"]}, "lease_until": {"$lte": now},
+         "attempts": {"$lt": MAX_ATTEMPTS}},
+        {"$set": {"status": "processing", "lease_until": now + JOB_LEASE}, "$inc": {"attempts": 1}},
+        sort=[("lease_until", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def make_thumbnails(image_bytes):
+    """
+    Resize an image to every thumbnail size and format.
+
+    The image is decoded once, rotated according to its EXIF orientation
+    and center-cropped to a square before resizing.
+
+    Returns:
+        dict: (size, extension) -> (encoded bytes, content type)
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        edge = min(image.size)
+        image = ImageOps.fit(image, (edge, edge))
+        thumbnails = {}
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            # downscale from the previous (larger) size, which is cheaper than from the original
+            if size < image.width:
+                image = image.resize((size, size), Image.LANCZOS)
+            for extension, pil_format, content_type in THUMBNAIL_FORMATS:
+                out = BytesIO()
+                image.save(out, pil_format, quality=85)
+                thumbnails[(size, extension)] = (out.getvalue(), content_type)
+    return thumbnails
+
+
+def process_job(db, s3, bucket_name, job):
+    """
+    Generate and upload the thumbnails of a job, then point the user's `pfp` at them.
+    """
+    user_id = job["user_id"]
+    original = s3.get_object(Bucket=bucket_name, Key=job["key"])["Body"].read()
+    version = uuid.uuid4().hex[:8]
+    urls = {}
+    for (size, extension), (body, content_type) in make_thumbnails(original).items():
+        key = f"profile_pics/{user_id}/{version}/{size}.{extension}"
+        s3.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType=content_type,
+                      CacheControl="public, max-age=31536000, immutable")
+        urls.setdefault(str(size), {})[extension] = public_url(key, bucket_name)
+
+    db.user.update_one(
+        {"user_id": user_id},
+        {"$set": {"pfp": urls[str(PFP_SIZE)]["jpg"], "pfp_sizes": urls}},
+    )
+    db.pfp_jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "done", "urls": urls}})
+    s3.delete_object(Bucket=bucket_name, Key=job["key"])
+
+
+def fail_job(db, job, error):
+    """Return a failed job to the queue, or give up after MAX_ATTEMPTS."""
+    status = "failed" if job.get("attempts", 0) >= MAX_ATTEMPTS else "pending"
+    db.pfp_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": status, "error": str(error), "lease_until": datetime.now(timezone.utc)}},
+    )
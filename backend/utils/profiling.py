@@ -0,0 +1,239 @@
+import cProfile
+import functools
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from utils.structured_log import get_logger
+
+log = get_logger("profiling")
+
+TOP_ALLOCATIONS = 25
+
+# set from the environment by configure()
+SAMPLE_RATE = 0.0
+ADMIN_TOKEN = None
+PROFILE_DIR = "./profiles"
+MAX_FILES = 300
+MAX_BYTES = 100 * 1024 * 1024
+TRACE_MEMORY = True
+
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+_disk_lock = threading.Lock()
+# cProfile cannot nest, so events dispatched from other handlers are not profiled again
+_active = threading.local()
+
+
+def configure():
+    """
+    Read the profiling settings from the environment. Called by the server
+    integrations, after the servers have loaded their .env file.
+
+    Returns:
+        bool: True if profiling is enabled at all
+    """
+    global SAMPLE_RATE, ADMIN_TOKEN, PROFILE_DIR, MAX_FILES, MAX_BYTES, TRACE_MEMORY
+    # fraction of requests/events to profile, 0 disables sampling
+    SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    # requests carrying this token in the X-Profile-Token header are always profiled
+    ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN") or None
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+    # the oldest profiles are deleted beyond these limits
+    MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "300"))
+    MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(100 * 1024 * 1024)))
+    TRACE_MEMORY = os.getenv("PROFILE_TRACEMALLOC", "true").lower() == "true"
+    return SAMPLE_RATE > 0 or ADMIN_TOKEN is not None
+
+
+def should_profile(token=None):
+    """Decide whether to profile a request: admin token match or random sample."""
+    if getattr(_active, "profile", None) is not None:
+        return False
+    if ADMIN_TOKEN and token == ADMIN_TOKEN:
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+class RequestProfile:
+    """
+    cProfile and tracemalloc capture of a single request or event.
+
+    `stop()` writes three files to PROFILE_DIR sharing a prefix:
+    `.prof` (pstats, for snakeviz/gprof2dot), `.collapsed` (folded stacks
+    for flamegraph.pl / speedscope) and `.alloc.txt` (top allocation sites).
+    """
+
+    def __init__(self, name):
+        self.name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "request"
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+
+    def start(self):
+        global _tracemalloc_users
+        if TRACE_MEMORY:
+            with _tracemalloc_lock:
+                if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(10)
+                _tracemalloc_users += 1
+            self.snapshot = tracemalloc.take_snapshot()
+        _active.profile = self
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def stop(self):
+        global _tracemalloc_users
+        self.profiler.disable()
+        _active.profile = None
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        allocations = None
+        if self.snapshot is not None:
+            allocations = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")
+            with _tracemalloc_lock:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0:
+                    tracemalloc.stop()
+        try:
+            self._write(elapsed_ms, allocations)
+        except OSError as e:
+            log.warning("profile_write_failed", name=self.name, error=str(e))
+
+    def _write(self, elapsed_ms, allocations):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prefix = os.path.join(
+            PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.name}-{elapsed_ms:.0f}ms"
+        )
+        stats = pstats.Stats(self.profiler)
+        stats.dump_stats(prefix + ".prof")
+        with open(prefix + ".collapsed", "w") as f:
+            for stack, micros in collapsed_stacks(stats).items():
+                f.write(f"{stack} {micros}\n")
+        if allocations is not None:
+            with open(prefix + ".alloc.txt", "w") as f:
+                f.write(f"{self.name}: {elapsed_ms:.1f} ms\n")
+                for stat in allocations[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+        enforce_disk_limits()
+
+
+def _label(func):
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ",").replace(" ", "_")
+
+
+def collapsed_stacks(stats, max_depth=64, min_micros=1):
+    """
+    Approximate folded stacks from a cProfile call graph.
+
+    cProfile only records caller -> callee edges, so the own time of a
+    function is split across its call paths in proportion to the time spent
+    under each caller, which is what flamegraph converters for pstats do.
+
+    Returns:
+        Counter: "root;child;leaf" -> microseconds of own time
+    """
+    entries = stats.stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge[3]
+    folded = Counter()
+
+    def walk(func, path, share):
+        _, _, own, total, _ = entries[func]
+        path = path + (_label(func),)
+        micros = int(own * share * 1e6)
+        if micros >= min_micros:
+            folded[";".join(path)] += micros
+        if len(path) >= max_depth:
+            return
+        for callee, edge_total in callees[func].items():
+            callee_total = entries[callee][3]
+            callee_share = share * edge_total / callee_total if callee_total else 0
+            # skip recursion and paths too small to show up in a flame graph
+            if _label(callee) in path or callee_share * callee_total * 1e6 < min_micros:
+                continue
+            walk(callee, path, callee_share)
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, (), 1.0)
+    return folded
+
+
+def enforce_disk_limits():
+    """Delete the oldest profile files beyond PROFILE_MAX_FILES / PROFILE_MAX_BYTES."""
+    with _disk_lock:
+        try:
+            files = [entry for entry in os.scandir(PROFILE_DIR) if entry.is_file()]
+        except FileNotFoundError:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        while files and (len(files) > MAX_FILES or total > MAX_BYTES):
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            try:
+                os.remove(oldest.path)
+            except FileNotFoundError:
+                pass
+
+
+def init_flask(app):
+    """
+    Profile sampled Flask requests, and every request whose X-Profile-Token
+    header matches PROFILE_ADMIN_TOKEN.
+    """
+    from flask import g, request
+
+    if not configure():
+        return
+
+    @app.before_request
+    def start_profile():
+        if should_profile(request.headers.get("X-Profile-Token")):
+            g.request_profile = RequestProfile(f"{request.method}_{request.path}").start()
+
+    @app.teardown_request
+    def stop_profile(exc):
+        profile = g.pop("request_profile", None)
+        if profile is not None:
+            profile.stop()
+
+
+class SocketIOProfiler:
+    """
+    Profile sampled Socket.IO events. Connections that sent a matching
+    X-Profile-Token header have all of their events profiled.
+    """
+
+    def __init__(self):
+        self.enabled = configure()
+        self.admin_sids = set()
+
+    def connected(self, sid, environ):
+        if ADMIN_TOKEN and environ.get("HTTP_X_PROFILE_TOKEN") == ADMIN_TOKEN:
+            self.admin_sids.add(sid)
+
+    def disconnected(self, sid):
+        self.admin_sids.discard(sid)
+
+    def event(self, handler):
+        """Decorator for `sio.event` handlers taking (sid, ...)."""
+        @functools.wraps(handler)
+        def wrapper(sid, *args):
+            admin = sid in self.admin_sids and getattr(_active, "profile", None) is None
+            if not self.enabled or not (admin or should_profile()):
+                return handler(sid, *args)
+            profile = RequestProfile(f"event_{handler.__name__}").start()
+            try:
+                return handler(sid, *args)
+            finally:
+                profile.stop()
+        return wrapper
@@ -2,9 +2,10 @@ def load_litter_points(file_path):
     litter_points = {}
     with open(file_path, 'r') as file:
         for line in file:
-            # Strip any leading/trailing whitespace and split by space
-            parts = line.strip().split(' ')
-            if len(parts) == 2:
+            # Strip any leading/trailing whitespace and split off the points;
+            # names may contain spaces ("Aluminium foil 2")
+            parts = line.strip().rsplit(' ', 1)
+            if len(parts) == 2 and parts[1].isdigit():
                 litter_name = parts[0]
                 points = int(parts[1])
                 litter_points[litter_name] = points
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+
+# key scope for responses shared by all users (e.g. the leaderboard)
+SHARED = "*"
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of serialized JSON responses with strong ETags.
+
+    Keys are tuples whose first element is the scope (a user_id or SHARED)
+    so all responses of a user can be dropped at once by the write paths.
+    Entries also expire after `ttl` seconds, which bounds staleness for
+    writes that happen in another worker process.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (etag, body) for a live entry, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body):
+        """Store a serialized body and return its strong ETag."""
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (etag, body, time.monotonic() + self.ttl)
+            self._scopes.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def invalidate(self, scope):
+        """Drop every cached response of a scope (a user_id or SHARED)."""
+        with self._lock:
+            for key in list(self._scopes.get(scope, ())):
+                self._remove(key)
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is not None:
+            keys = self._scopes.get(key[0])
+            keys.discard(key)
+            if not keys:
+                del self._scopes[key[0]]
+
+
+cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30")),
+)
+
+
+def invalidate_user(user_id, shared=True):
+    """
+    Drop the cached responses of a user after a write, and by default the
+    shared responses (leaderboard) that may include the user's totals.
+    """
+    cache.invalidate(user_id)
+    if shared:
+        cache.invalidate(SHARED)
+
+
+def cached_json(key, build):
+    """
+    Serve a JSON response through the cache.
+
+    If the client's If-None-Match matches the cached ETag, answer 304
+    without calling `build`; on a miss, `build` returns (payload, status)
+    and only 200 responses are cached.
+
+    Args:
+        key (tuple): Cache key, first element is the scope
+        build (callable): Produces (payload dict, status code) on a miss
+    """
+    entry = cache.get(key)
+    if entry is None:
+        payload, status = build()
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        if status != 200:
+            return Response(body, status=status, mimetype="application/json")
+        etag = cache.put(key, body)
+    else:
+        etag, body = entry
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag)
+    return response
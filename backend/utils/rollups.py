@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+
+# counters kept in every daily/weekly rollup document
+ROLLUP_FIELDS = ("steps", "distance", "time", "points", "litters", "sessions")
+
+MAX_RANGE_DAYS = 366
+MAX_RANGE_WEEKS = 260
+
+
+def ensure_indexes(db):
+    """Create the indexes used by time-ranged rollup queries."""
+    db.user_daily_stats.create_index([("user_id", 1), ("day", 1)], name="user_day")
+    db.user_weekly_stats.create_index([("user_id", 1), ("week", 1)], name="user_week")
+
+
+def day_start(when):
+    """Truncate a datetime to midnight UTC (naive, as stored by pymongo)."""
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(when.year, when.month, when.day)
+
+
+def week_start(when):
+    """Return midnight UTC of the Monday starting the week of `when`."""
+    day = day_start(when)
+    return day - timedelta(days=day.weekday())
+
+
+def rollup_updates(user_id, when, increments):
+    """
+    Build the upserts applying `increments` to the day and week rollups.
+
+    Args:
+        user_id (str): User the activity belongs to
+        when (datetime): Time of the activity
+        increments (dict): Counter name -> amount, names from ROLLUP_FIELDS
+
+    Returns:
+        list: (collection name, filter, update) tuples, one per rollup document;
+            the daily one also counts the updates it received in `records`
+    """
+    inc = {field: value for field, value in increments.items() if field in ROLLUP_FIELDS and value is not None}
+    day = day_start(when)
+    week = week_start(when)
+    return [
+        ("user_daily_stats",
+         {"_id": f"{user_id}:{day:%Y-%m-%d}"},
+         {"$inc": {**inc, "records": 1}, "$setOnInsert": {"user_id": user_id, "day": day}}),
+        ("user_weekly_stats",
+         {"_id": f"{user_id}:{week:%Y-%m-%d}"},
+         {"$inc": inc, "$setOnInsert": {"user_id": user_id, "week": week}}),
+    ]
+
+
+def streak_update(day):
+    """
+    Build the pipeline update advancing a user's streak for activity on `day`.
+
+    Only the user's `last_active_day` is compared, so the cost does not depend
+    on how much history the user has. Activity on the same day leaves the
+    streak unchanged, activity on the following day extends it, anything
+    later restarts it at 1 and late (out of order) activity is ignored.
+    """
+    yesterday = day - timedelta(days=1)
+    return [
+        {"$set": {
+            "streak": {"$switch": {
+                "branches": [
+                    {"case": {"$gte": ["$last_active_day", day]}, "then": "$streak"},
+                    {"case": {"$eq": ["$last_active_day", yesterday]},
+                     "then": {"$add": [{"$ifNull": ["$streak", 0]}, 1]}},
+                ],
+                "default": 1,
+            }},
+        }},
+        {"$set": {
+            "highest_streak": {"$max": [{"$ifNull": ["$highest_streak", 0]}, "$streak"]},
+            "last_active_day": {"$max": ["$last_active_day", day]},
+        }},
+    ]
+
+
+def record_activity(db, user_id, when=None, **increments):
+    """
+    Add activity to the user's daily and weekly rollups and advance the streak.
+
+    The streak only changes with the first activity of a day, so the user
+    document is written once per user and day (when the daily rollup counts
+    its first record), not on every detection or session.
+
+    Args:
+        db: PlogGo database
+        user_id (str): User the activity belongs to
+        when (datetime): Time of the activity, defaults to now
+        **increments: Counter amounts, e.g. steps=120, points=5
+
+    Returns:
+        dict: The updated daily rollup document
+    """
+    when = when or datetime.now(timezone.utc)
+    (daily_collection, daily_filter, daily_update), weekly = rollup_updates(user_id, when, increments)
+    daily = db[daily_collection].find_one_and_update(
+        daily_filter, daily_update, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    db[weekly[0]].update_one(weekly[1], weekly[2], upsert=True)
+    if daily.get("records") == 1:
+        db.user.update_one({"user_id": user_id}, streak_update(day_start(when)))
+    return daily
+
+
+async def record_activity_async(db, user_id, when=None, **increments):
+    """Async variant of `record_activity` for an AsyncMongoClient database."""
+    when = when or datetime.now(timezone.utc)
+    (daily_collection, daily_filter, daily_update), weekly = rollup_updates(user_id, when, increments)
+    daily = await db[daily_collection].find_one_and_update(
+        daily_filter, daily_update, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    await db[weekly[0]].update_one(weekly[1], weekly[2], upsert=True)
+    if daily.get("records") == 1:
+        await db.user.update_one({"user_id": user_id}, streak_update(day_start(when)))
+    return daily
+
+
+def current_streak(user, today=None):
+    """
+    Return the streak as seen today: a streak whose last active day is
+    before yesterday has lapsed even though it has not been rewritten yet.
+    """
+    last_active = user.get("last_active_day")
+    if not last_active:
+        return 0
+    today = day_start(today or datetime.now(timezone.utc))
+    if day_start(last_active) < today - timedelta(days=1):
+        return 0
+    return user.get("streak", 0)
+
+
+def parse_range(start, end, granularity):
+    """
+    Parse and validate the `from`/`to` query parameters (YYYY-MM-DD).
+
+    Returns:
+        tuple: (start datetime, end datetime)
+
+    Raises:
+        ValueError: If the dates are malformed or the range is too large
+    """
+    if granularity not in ("day", "week"):
+        raise ValueError("granularity must be 'day' or 'week'")
+    try:
+        end_day = datetime.strptime(end, "%Y-%m-%d") if end else day_start(datetime.now(timezone.utc))
+        start_day = datetime.strptime(start, "%Y-%m-%d") if start else end_day - timedelta(days=29)
+    except ValueError:
+        raise ValueError("Dates must be formatted as YYYY-MM-DD")
+    if start_day > end_day:
+        raise ValueError("'from' must not be after 'to'")
+    if granularity == "day" and (end_day - start_day).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"Range is limited to {MAX_RANGE_DAYS} days")
+    if granularity == "week":
+        start_day = week_start(start_day)
+        if (end_day - start_day).days // 7 >= MAX_RANGE_WEEKS:
+            raise ValueError(f"Range is limited to {MAX_RANGE_WEEKS} weeks")
+    return start_day, end_day
+
+
+def fetch_series(db, user_id, start, end, granularity="day"):
+    """
+    Read the rollup documents of a user between `start` and `end` inclusive.
+
+    Returns:
+        list: One dict per active day/week, oldest first
+    """
+    return _series(_series_cursor(db, user_id, start, end, granularity), granularity)
+
+
+async def fetch_series_async(db, user_id, start, end, granularity="day"):
+    """Async variant of `fetch_series` for an AsyncMongoClient database."""
+    docs = await _series_cursor(db, user_id, start, end, granularity).to_list(None)
+    return _series(docs, granularity)
+
+
+def _series_cursor(db, user_id, start, end, granularity):
+    key = "day" if granularity == "day" else "week"
+    collection = db.user_daily_stats if granularity == "day" else db.user_weekly_stats
+    return collection.find(
+        {"user_id": user_id, key: {"$gte": start, "$lte": end}},
+        {"_id": 0, "user_id": 0},
+    ).sort(key, 1)
+
+
+def _series(docs, granularity):
+    key = "day" if granularity == "day" else "week"
+    series = []
+    for doc in docs:
+        entry = {field: doc.get(field, 0) for field in ROLLUP_FIELDS}
+        entry[key] = doc[key].strftime("%Y-%m-%d")
+        series.append(entry)
+    return series
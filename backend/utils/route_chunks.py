@@ -0,0 +1,153 @@
+import os
+from datetime import datetime, timezone
+from pymongo import ReplaceOne
+
+# fixes per route chunk document (24 bytes of payload each, far below the 16 MB limit)
+CHUNK_POINTS = int(os.getenv("ROUTE_CHUNK_POINTS", "500"))
+
+# a live session with new fixes is checkpointed at least this often
+CHECKPOINT_INTERVAL_MS = int(float(os.getenv("ROUTE_CHECKPOINT_SECONDS", "30")) * 1000)
+
+
+def ensure_indexes(db):
+    """Create the index used to read a session's route chunks in order."""
+    db.route_chunks.create_index([("session_id", 1), ("chunk", 1)], name="session_chunk")
+
+
+def chunk_id(session_id, chunk):
+    return f"{session_id}:{chunk:06d}"
+
+
+def checkpoint_due(session, now_ms):
+    """
+    Whether a live session should be checkpointed: a full chunk is buffered,
+    or fixes newer than the last checkpoint have waited CHECKPOINT_INTERVAL_MS.
+    """
+    if session["points"] - session["flushed"] >= CHUNK_POINTS:
+        return True
+    return session["points"] > session["persisted"] and now_ms - session["checkpointed_at"] >= CHECKPOINT_INTERVAL_MS
+
+
+def chunk_documents(session_id, user_id, offset, latitudes, longitudes, timestamps):
+    """
+    Split buffered fixes into route chunk documents.
+
+    Chunk n holds fixes [n * CHUNK_POINTS, (n + 1) * CHUNK_POINTS) of the
+    route. `offset` is the route index of the first buffered fix and always
+    starts a chunk, because only complete chunks are released from the buffer.
+    Chunks are replaced as a whole, so rewriting one is idempotent.
+    """
+    docs = []
+    for start in range(0, len(timestamps), CHUNK_POINTS):
+        end = start + CHUNK_POINTS
+        chunk = (offset + start) // CHUNK_POINTS
+        docs.append({
+            "_id": chunk_id(session_id, chunk),
+            "session_id": session_id,
+            "user_id": user_id,
+            "chunk": chunk,
+            "count": len(timestamps[start:end]),
+            "latitudes": latitudes[start:end].tolist(),
+            "longitudes": longitudes[start:end].tolist(),
+            "timestamps": timestamps[start:end].tolist(),
+        })
+    return docs
+
+
+def checkpoint_document(session_id, session, flushed, persisted, now_ms):
+    """The state needed to resume a live session after a restart."""
+    return {
+        "_id": session_id,
+        "user_id": session["user_id"],
+        "start_time": session["start_time"],
+        "total_distance": session["total_distance"],
+        "steps": session["steps"],
+        "last_seq": session["last_seq"],
+        "flushed": flushed,
+        "persisted": persisted,
+        "checkpointed_at": now_ms,
+        "last_latitude": session["last_latitude"],
+        "last_longitude": session["last_longitude"],
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def checkpoint(db, sessions, session_id, now_ms):
+    """
+    Write the buffered fixes of a live session to `route_chunks` and its
+    resumable state to `tracking_checkpoints`, then release complete chunks
+    from the session store.
+
+    Returns:
+        int: Number of fixes persisted by this checkpoint, or None if the session does not exist
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        return None
+    offset, latitudes, longitudes, timestamps = sessions.pending(session_id)
+    docs = chunk_documents(session_id, session["user_id"], offset, latitudes, longitudes, timestamps)
+    if docs:
+        db.route_chunks.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+    persisted = offset + len(timestamps)
+    drop = len(timestamps) // CHUNK_POINTS * CHUNK_POINTS
+    db.tracking_checkpoints.replace_one(
+        {"_id": session_id},
+        checkpoint_document(session_id, session, offset + drop, persisted, now_ms),
+        upsert=True,
+    )
+    sessions.mark_checkpointed(session_id, drop, persisted, now_ms)
+    return persisted - session["persisted"]
+
+
+def resume(db, sessions, session_id):
+    """
+    Restore a live session from its checkpoint, e.g. after a ws-server restart.
+
+    Fixes received after the last checkpoint are lost; clients resending
+    location batches from their last acknowledged sequence number fill the gap.
+
+    Returns:
+        bool: True if a checkpoint was found and restored
+    """
+    state = db.tracking_checkpoints.find_one({"_id": session_id})
+    if not state:
+        return False
+    latitudes, longitudes, timestamps = [], [], []
+    if state["persisted"] > state["flushed"]:
+        partial = db.route_chunks.find_one({"_id": chunk_id(session_id, state["flushed"] // CHUNK_POINTS)})
+        if partial:
+            latitudes, longitudes, timestamps = partial["latitudes"], partial["longitudes"], partial["timestamps"]
+    sessions.restore(session_id, state, latitudes, longitudes, timestamps)
+    return True
+
+
+def finish(db, sessions, session_id, now_ms):
+    """
+    Checkpoint the rest of a session and drop its resumable state.
+
+    Returns:
+        tuple: (number of fixes, number of route chunks) of the session
+    """
+    checkpoint(db, sessions, session_id, now_ms)
+    points = sessions.get(session_id)["persisted"]
+    db.tracking_checkpoints.delete_one({"_id": session_id})
+    return points, -(-points // CHUNK_POINTS)
+
+
+def load_route(db, session_key):
+    """Return a session's route as (latitudes, longitudes, timestamps) lists, in order."""
+    return _assemble(db.route_chunks.find({"session_id": session_key}).sort("chunk", 1))
+
+
+async def load_route_async(db, session_key):
+    """Async variant of `load_route` for an AsyncMongoClient database."""
+    return _assemble(await db.route_chunks.find({"session_id": session_key}).sort("chunk", 1).to_list(None))
+
+
+def _assemble(chunks):
+    latitudes, longitudes, timestamps = [], [], []
+    for chunk in chunks:
+        latitudes.extend(chunk["latitudes"])
+        longitudes.extend(chunk["longitudes"])
+        timestamps.extend(chunk["timestamps"])
+    return latitudes, longitudes, timestamps
@@ -0,0 +1,140 @@
+import base64
+import json
+from datetime import datetime, timezone
+from bson import ObjectId
+
+# fields returned for session summaries, routes are only served by the route endpoint
+SUMMARY_PROJECTION = {
+    "startTime": 1,
+    "endTime": 1,
+    "elapsedTime": 1,
+    "distancesTravelled": 1,
+    "steps": 1,
+}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def ensure_indexes(db):
+    """
+    Create the index backing keyset pagination of a user's session history.
+
+    The index matches the sort order used by `build_page_query` so each page
+    is a bounded index range scan no matter how many sessions a user has.
+    """
+    db.plogging_session.create_index(
+        [("user_id", 1), ("startTime", -1), ("_id", -1)],
+        name="user_start_time",
+    )
+
+
+def encode_cursor(session):
+    """
+    Encode the position of a session document as an opaque page cursor.
+
+    Args:
+        session (dict): Session document with `startTime` and `_id`
+
+    Returns:
+        str: URL safe cursor string
+    """
+    start_ms = int(session["startTime"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+    raw = json.dumps([start_ms, str(session["_id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Returns:
+        tuple: (startTime datetime, ObjectId)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        start_ms, session_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc), ObjectId(session_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_page_query(user_id, cursor=None):
+    """
+    Build the filter for one page of a user's sessions, newest first.
+
+    Sessions are ordered by (startTime, _id) descending; the cursor is the
+    last session of the previous page, so the next page starts strictly after it.
+    Legacy sessions without a `startTime` have no place in that order and
+    are left out.
+    """
+    query = {"user_id": user_id, "startTime": {"$type": "date"}}
+    if cursor:
+        start_time, session_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"startTime": {"$lt": start_time}},
+            {"startTime": start_time, "_id": {"$lt": session_id}},
+        ]
+    return query
+
+
+def parse_page_size(value):
+    """Parse the `limit` query parameter, clamped to MAX_PAGE_SIZE."""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc).isoformat()
+    return value
+
+
+def serialize_summary(session):
+    """Convert a projected session document into a JSON friendly summary."""
+    return {
+        "session_id": str(session["_id"]),
+        "startTime": _isoformat(session.get("startTime")),
+        "endTime": _isoformat(session.get("endTime")),
+        "elapsedTime": session.get("elapsedTime"),
+        "distancesTravelled": session.get("distancesTravelled"),
+        "steps": session.get("steps"),
+    }
+
+
+def fetch_page(db, user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of session summaries for a user.
+
+    Returns:
+        tuple: (list of summaries, cursor for the next page or None)
+    """
+    docs = list(_page_cursor(db, user_id, cursor, limit))
+    return _page(docs, limit)
+
+
+async def fetch_page_async(db, user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Async variant of `fetch_page` for an AsyncMongoClient database."""
+    docs = await _page_cursor(db, user_id, cursor, limit).to_list(None)
+    return _page(docs, limit)
+
+
+def _page_cursor(db, user_id, cursor, limit):
+    # one extra document tells whether there is a next page
+    return (
+        db.plogging_session.find(build_page_query(user_id, cursor), SUMMARY_PROJECTION)
+        .sort([("startTime", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+
+
+def _page(docs, limit):
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return [serialize_summary(doc) for doc in docs[:limit]], next_cursor
@@ -0,0 +1,196 @@
+import math
+import os
+import time
+
+# a live session without stored fixes for this long is reaped
+IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# a session whose client disconnected is reaped after this long, unless the client reconnects
+DISCONNECT_GRACE_SECONDS = float(os.getenv("SESSION_DISCONNECT_GRACE_SECONDS", "300"))
+# "finish" stores reaped sessions like finish_tracking does, "checkpoint" only persists them
+# so the user can resume them with start_tracking
+REAP_MODE = os.getenv("SESSION_REAP_MODE", "finish")
+# a reap that raised (e.g. a transient Mongo error) is retried after this long, doubling up to the max
+REAP_RETRY_SECONDS = float(os.getenv("SESSION_REAP_RETRY_SECONDS", "30"))
+REAP_RETRY_MAX_SECONDS = float(os.getenv("SESSION_REAP_RETRY_MAX_SECONDS", "900"))
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel of key deadlines.
+
+    `schedule` only moves a key between slots when its deadline gets earlier;
+    a later deadline is recorded in a dict and the key is moved when its old
+    slot comes up. Rescheduling on every update is therefore O(1), and
+    `advance` visits each key at most once per wheel revolution.
+    """
+
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self._slots = [set() for _ in range(slots)]
+        self._deadlines = {}
+        self._placed = {}
+        self._current = math.floor(clock() / tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay):
+        """Set the deadline of `key` to `delay` seconds from now."""
+        deadline = max(math.ceil((self.clock() + delay) / self.tick), self._current + 1)
+        self._deadlines[key] = deadline
+        placed = self._placed.get(key)
+        if placed is not None and placed <= deadline:
+            return
+        if placed is not None:
+            self._slots[placed % len(self._slots)].discard(key)
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+        placed = self._placed.pop(key, None)
+        if placed is not None:
+            self._slots[placed % len(self._slots)].discard(key)
+
+    def _place(self, key, tick):
+        self._placed[key] = tick
+        self._slots[tick % len(self._slots)].add(key)
+
+    def advance(self, now=None):
+        """
+        Move the wheel to `now` and return the keys whose deadline passed,
+        removing them from the wheel.
+        """
+        target = math.floor((self.clock() if now is None else now) / self.tick)
+        # after a jump longer than a revolution every slot is visited once
+        first = max(self._current + 1, target - len(self._slots) + 1)
+        self._current = target
+        expired = []
+        for tick in range(first, target + 1):
+            index = tick % len(self._slots)
+            keys, self._slots[index] = self._slots[index], set()
+            for key in keys:
+                deadline = self._deadlines[key]
+                if deadline <= target:
+                    del self._deadlines[key]
+                    del self._placed[key]
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)
+        return expired
+
+
+class SessionReaper:
+    """
+    Connection bookkeeping and idle expiry of live tracking sessions.
+
+    Each session has a deadline: IDLE_SECONDS after its last stored fix, or
+    DISCONNECT_GRACE_SECONDS after its client disconnected. Sessions past
+    their deadline are handed to `reap(session_id, sid)` by `run_once`, with
+    the sid of the connection still tracking them, if any. `reap` returns
+    False if it did not end the session, e.g. after rescheduling it. A
+    session whose `reap` raised is put back on the wheel and retried with
+    exponential backoff, so it is never left in memory without a deadline.
+
+    The deadlines only see the activity of this process. With a session
+    store shared by several processes, `reap` must check the store's last
+    activity before ending a session (see `delay_for`).
+    """
+
+    def __init__(self, reap, idle_seconds=IDLE_SECONDS, grace_seconds=DISCONNECT_GRACE_SECONDS,
+                 wheel=None, retry_seconds=REAP_RETRY_SECONDS, retry_max_seconds=REAP_RETRY_MAX_SECONDS):
+        self.reap = reap
+        self.idle_seconds = idle_seconds
+        self.grace_seconds = grace_seconds
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        # failed reaps in a row of each session, for the retry backoff
+        self.attempts = {}
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self.sid_sessions = {}
+        self.session_sids = {}
+        self.reaped = 0
+        self.failures = 0
+
+    def touch(self, sid, session_id):
+        """A connection started, resumed or stored fixes of a session."""
+        if self.session_sids.get(session_id) != sid:
+            previous = self.session_sids.get(session_id)
+            if previous is not None:
+                self.sid_sessions.pop(previous, None)
+            replaced = self.sid_sessions.get(sid)
+            if replaced is not None:
+                self.session_sids.pop(replaced, None)
+            self.sid_sessions[sid] = session_id
+            self.session_sids[session_id] = sid
+        self.attempts.pop(session_id, None)
+        self.wheel.schedule(session_id, self.idle_seconds)
+
+    def detach(self, sid):
+        """A connection closed; its session gets the disconnect grace period."""
+        session_id = self.sid_sessions.pop(sid, None)
+        if session_id is not None and self.session_sids.get(session_id) == sid:
+            del self.session_sids[session_id]
+            self.wheel.schedule(session_id, self.grace_seconds)
+        return session_id
+
+    def delay_for(self, sid):
+        """Inactivity after which a session is reaped: the idle limit while connected, else the grace period."""
+        return self.idle_seconds if sid is not None else self.grace_seconds
+
+    def reschedule(self, session_id, sid, delay):
+        """
+        Put a session handed to `reap` back on the wheel, e.g. because it
+        was active in another process, keeping its connection if any.
+        """
+        if sid is not None and sid not in self.sid_sessions:
+            self.sid_sessions[sid] = session_id
+            self.session_sids[session_id] = sid
+        self.wheel.schedule(session_id, delay)
+
+    def retry_delay(self, attempts):
+        """Seconds before retrying a session whose reap failed `attempts` times before."""
+        return min(self.retry_seconds * 2 ** min(attempts, 32), self.retry_max_seconds)
+
+    def finished(self, session_id):
+        """A session was finished by its client."""
+        self.wheel.cancel(session_id)
+        self.attempts.pop(session_id, None)
+        sid = self.session_sids.pop(session_id, None)
+        if sid is not None:
+            self.sid_sessions.pop(sid, None)
+
+    def run_once(self, now=None):
+        """Reap the sessions whose deadline passed. Returns the number reaped."""
+        reaped = 0
+        for session_id in self.wheel.advance(now):
+            sid = self.session_sids.pop(session_id, None)
+            if sid is not None:
+                self.sid_sessions.pop(sid, None)
+            try:
+                ended = self.reap(session_id, sid) is not False
+            except Exception:
+                # `reap` logs its errors; try again later, keeping the connection
+                self.failures += 1
+                attempts = self.attempts.get(session_id, 0)
+                self.attempts[session_id] = attempts + 1
+                self.reschedule(session_id, sid, self.retry_delay(attempts))
+                continue
+            self.attempts.pop(session_id, None)
+            reaped += ended
+        self.reaped += reaped
+        return reaped
+
+    def stats(self):
+        live = len(self.wheel)
+        return {
+            "live": live,
+            "connected": len(self.session_sids),
+            "disconnected": live - len(self.session_sids),
+            "reaped": self.reaped,
+            "reap_failures": self.failures,
+            "reap_retrying": len(self.attempts),
+        }
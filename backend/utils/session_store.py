@@ -0,0 +1,585 @@
+import os
+import struct
+import time
+from array import array
+from datetime import datetime
+import numpy as np
+from utils.helper import haversine_distance, haversine_segments
+
+# approximate step length used to estimate steps from distance
+STEP_LENGTH_M = 0.8
+
+# live sessions kept in an external store expire this long after their last update
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_STORE_TTL", str(6 * 3600)))
+
+# how long a claim to finish a session (see `claim`) keeps other processes from finishing it
+CLAIM_SECONDS = 60
+
+# one route fix in the Redis store: latitude, longitude (float64), epoch ms (int64)
+FIX = struct.Struct("<ddq")
+FIX_DTYPE = np.dtype([("latitude", "<f8"), ("longitude", "<f8"), ("timestamp", "<i8")])
+
+# largest number of fixes accepted in one location_batch event
+MAX_BATCH_POINTS = 1000
+
+
+def parse_location_batch(points, now_ms):
+    """
+    Validate the points of a location_batch event.
+
+    Each point has a client sequence number `seq`, `latitude`, `longitude`,
+    an optional epoch ms `timestamp` (defaults to `now_ms`) and an optional
+    `accuracy` radius in metres. Points are sorted by sequence number and
+    repeated sequence numbers are dropped.
+
+    Returns:
+        tuple: (seqs, latitudes, longitudes, timestamps, accuracies) numpy
+            arrays, accuracies NaN where not reported
+
+    Raises:
+        ValueError: If the batch is empty, too large or has malformed points
+    """
+    if not isinstance(points, list) or not points:
+        raise ValueError("points must be a non-empty list")
+    if len(points) > MAX_BATCH_POINTS:
+        raise ValueError(f"at most {MAX_BATCH_POINTS} points per batch")
+    try:
+        seqs = np.array([int(point["seq"]) for point in points], dtype=np.int64)
+        latitudes = np.array([float(point["latitude"]) for point in points], dtype=np.float64)
+        longitudes = np.array([float(point["longitude"]) for point in points], dtype=np.float64)
+        timestamps = np.array([int(point.get("timestamp") or now_ms) for point in points], dtype=np.int64)
+        accuracies = np.array([float(point.get("accuracy") or "nan") for point in points], dtype=np.float64)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ValueError("each point needs numeric seq, latitude and longitude")
+    if not (np.all(np.abs(latitudes) <= 90) and np.all(np.abs(longitudes) <= 180)):
+        raise ValueError("latitude or longitude out of range")
+    # np.unique sorts and keeps the first point of every sequence number
+    seqs, first = np.unique(seqs, return_index=True)
+    return seqs, latitudes[first], longitudes[first], timestamps[first], accuracies[first]
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _batch_after(last_seq, seqs, latitudes, longitudes, timestamps):
+    # points the session has already accepted are dropped, so resent batches count once
+    new = seqs > last_seq
+    return seqs[new], latitudes[new], longitudes[new], timestamps[new]
+
+
+def _batch_distances(previous, latitudes, longitudes):
+    # segment distances of the batch, starting from the session's last fix if any
+    if previous is not None:
+        latitudes = np.concatenate(([previous[0]], latitudes))
+        longitudes = np.concatenate(([previous[1]], longitudes))
+    return haversine_segments(latitudes, longitudes)
+
+
+class TrackingSession:
+    """
+    A live tracking session with its route in columnar buffers.
+
+    Latitudes, longitudes and epoch ms timestamps are kept in typed arrays
+    (24 bytes per fix, instead of a dict with a datetime per fix), and the
+    distance and step totals are updated as fixes arrive. Fixes in complete
+    route chunks are dropped from the buffers once checkpointed to Mongo;
+    `flushed` counts them and `persisted` counts all checkpointed fixes.
+    `active_at` is the server time (epoch ms) of the last start, resume or fix.
+    """
+
+    __slots__ = ("user_id", "start_time", "total_distance", "steps", "last_seq",
+                 "flushed", "persisted", "checkpointed_at", "last_latitude", "last_longitude",
+                 "latitudes", "longitudes", "timestamps", "active_at")
+
+    def __init__(self, user_id, start_time):
+        self.user_id = user_id
+        self.start_time = start_time
+        self.total_distance = 0.0
+        self.steps = 0
+        self.last_seq = -1  # highest sequence number accepted from location_batch
+        self.flushed = 0
+        self.persisted = 0
+        self.checkpointed_at = start_time
+        self.last_latitude = None
+        self.last_longitude = None
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.timestamps = array("q")
+        self.active_at = _now_ms()
+
+    def add_point(self, latitude, longitude, timestamp):
+        """Append a fix and return the metres from the previous fix."""
+        self.active_at = _now_ms()
+        distance = 0.0
+        if self.last_latitude is not None:
+            distance = haversine_distance(latitude, longitude, self.last_latitude, self.last_longitude)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.timestamps.append(int(timestamp))
+        self.last_latitude, self.last_longitude = latitude, longitude
+        self.total_distance += distance
+        self.steps += int(distance / STEP_LENGTH_M)
+        return distance
+
+    def add_batch(self, seqs, latitudes, longitudes, timestamps):
+        """
+        Append the fixes of a parsed batch newer than `last_seq`.
+
+        Returns:
+            float: Metres added by the batch
+        """
+        self.active_at = _now_ms()
+        seqs, latitudes, longitudes, timestamps = _batch_after(self.last_seq, seqs, latitudes, longitudes, timestamps)
+        if not len(seqs):
+            return 0.0
+        previous = (self.last_latitude, self.last_longitude) if self.last_latitude is not None else None
+        distances = _batch_distances(previous, latitudes, longitudes)
+        self.latitudes.frombytes(latitudes.astype(np.float64).tobytes())
+        self.longitudes.frombytes(longitudes.astype(np.float64).tobytes())
+        self.timestamps.frombytes(timestamps.astype(np.int64).tobytes())
+        self.last_latitude, self.last_longitude = float(latitudes[-1]), float(longitudes[-1])
+        self.total_distance += float(distances.sum())
+        self.steps += int(np.floor(distances / STEP_LENGTH_M).sum())
+        self.last_seq = int(seqs[-1])
+        return float(distances.sum())
+
+    def summary(self):
+        return {
+            "user_id": self.user_id,
+            "start_time": self.start_time,
+            "total_distance": self.total_distance,
+            "steps": self.steps,
+            "last_seq": self.last_seq,
+            "flushed": self.flushed,
+            "persisted": self.persisted,
+            "points": self.flushed + len(self.timestamps),
+            "checkpointed_at": self.checkpointed_at,
+            "last_latitude": self.last_latitude,
+            "last_longitude": self.last_longitude,
+            "active_at": self.active_at,
+        }
+
+    def pending(self):
+        return (
+            self.flushed,
+            np.array(self.latitudes, dtype=np.float64),
+            np.array(self.longitudes, dtype=np.float64),
+            np.array(self.timestamps, dtype=np.int64),
+        )
+
+    def mark_checkpointed(self, drop, persisted, now_ms):
+        del self.latitudes[:drop]
+        del self.longitudes[:drop]
+        del self.timestamps[:drop]
+        self.flushed += drop
+        self.persisted = persisted
+        self.checkpointed_at = now_ms
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, latitudes=(), longitudes=(), timestamps=()):
+        session = cls(checkpoint["user_id"], checkpoint["start_time"])
+        session.total_distance = checkpoint["total_distance"]
+        session.steps = checkpoint["steps"]
+        session.last_seq = checkpoint["last_seq"]
+        session.flushed = checkpoint["flushed"]
+        session.persisted = checkpoint["persisted"]
+        session.checkpointed_at = checkpoint["checkpointed_at"]
+        session.last_latitude = checkpoint.get("last_latitude")
+        session.last_longitude = checkpoint.get("last_longitude")
+        session.latitudes.extend(latitudes)
+        session.longitudes.extend(longitudes)
+        session.timestamps.extend(timestamps)
+        return session
+
+
+def serialize_route(latitudes, longitudes, timestamps):
+    """
+    Convert route columns into the stored route: a list of points with
+    local-time ISO timestamps (millisecond precision).
+
+    The timestamps are converted in one numpy pass, using the UTC offset at
+    the first fix for the whole route.
+    """
+    if len(timestamps) == 0:
+        return []
+    first = datetime.fromtimestamp(int(timestamps[0]) / 1000).astimezone()
+    offset_ms = int(first.utcoffset().total_seconds() * 1000)
+    iso = np.datetime_as_string((np.asarray(timestamps, dtype=np.int64) + offset_ms).astype("datetime64[ms]"))
+    return [
+        {"latitude": latitude, "longitude": longitude, "timestamp": timestamp}
+        for latitude, longitude, timestamp in zip(
+            np.asarray(latitudes).tolist(), np.asarray(longitudes).tolist(), iso.tolist()
+        )
+    ]
+
+
+class InMemorySessionStore:
+    """Live tracking sessions of a single ws-server process, as TrackingSession objects."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._claims = {}
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def create(self, session_id, user_id, start_time):
+        self._sessions[session_id] = TrackingSession(user_id, start_time)
+        self._claims.pop(session_id, None)
+
+    def restore(self, session_id, checkpoint, latitudes=(), longitudes=(), timestamps=()):
+        """
+        Recreate a session from its last checkpoint (see route_chunks.checkpoint_document)
+        and the fixes of its last, incomplete route chunk.
+        """
+        self._sessions[session_id] = TrackingSession.from_checkpoint(checkpoint, latitudes, longitudes, timestamps)
+        self._claims.pop(session_id, None)
+
+    def touch(self, session_id):
+        """Record activity of the session's client that stored no fix, e.g. a reconnect."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.active_at = _now_ms()
+
+    def claim(self, session_id, ttl=CLAIM_SECONDS):
+        """
+        Claim the right to finish a session; only the first caller within
+        `ttl` seconds gets True.
+        """
+        now = time.monotonic()
+        if self._claims.get(session_id, 0) > now:
+            return False
+        self._claims[session_id] = now + ttl
+        return True
+
+    def release(self, session_id):
+        """Give up a claim, e.g. because finishing the session failed."""
+        self._claims.pop(session_id, None)
+
+    def get(self, session_id):
+        """Return the session without its route, or None."""
+        session = self._sessions.get(session_id)
+        return session.summary() if session is not None else None
+
+    def add_point(self, session_id, latitude, longitude, timestamp):
+        """
+        Append a fix to the route and add the distance from the previous fix.
+
+        Returns:
+            float: Metres added to the session, or None if the session does not exist
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return session.add_point(latitude, longitude, timestamp)
+
+    def add_batch(self, session_id, seqs, latitudes, longitudes, timestamps):
+        """
+        Append a parsed location batch, skipping already accepted sequence numbers.
+
+        Returns:
+            tuple: (metres added, last accepted sequence number), or None if
+            the session does not exist
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        distance = session.add_batch(seqs, latitudes, longitudes, timestamps)
+        return distance, session.last_seq
+
+    def pending(self, session_id):
+        """
+        Return the fixes not yet checkpointed as (index of the first fix,
+        latitudes, longitudes, timestamps), the columns as numpy arrays.
+        """
+        session = self._sessions.get(session_id)
+        return (session or TrackingSession(None, 0)).pending()
+
+    def mark_checkpointed(self, session_id, drop, persisted, now_ms):
+        """
+        Record a checkpoint: the first `drop` buffered fixes (complete chunks)
+        are released and the first `persisted` fixes of the route are stored.
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.mark_checkpointed(drop, persisted, now_ms)
+
+    def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore:
+    """
+    Live tracking sessions shared by several ws-server processes through Redis.
+
+    Each session is a hash (user, start time, totals, last fix, checkpoint
+    state, time of last activity) plus a string to which every fix not yet
+    checkpointed is appended as 24 packed bytes (see FIX).
+    Any client with the redis-py API works, e.g. fakeredis.FakeRedis.
+    """
+
+    def __init__(self, client, prefix="ploggo:session:", ttl=SESSION_TTL_SECONDS):
+        self.redis = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _keys(self, session_id):
+        key = f"{self.prefix}{session_id}"
+        return key, f"{key}:route"
+
+    def _claim_key(self, session_id):
+        return f"{self.prefix}{session_id}:claim"
+
+    def __contains__(self, session_id):
+        return bool(self.redis.exists(self._keys(session_id)[0]))
+
+    def create(self, session_id, user_id, start_time):
+        key, route_key = self._keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(key, route_key, self._claim_key(session_id))
+        pipe.hset(key, mapping={
+            "user_id": user_id,
+            "start_time": start_time,
+            "total_distance": 0,
+            "steps": 0,
+            "flushed": 0,
+            "persisted": 0,
+            "checkpointed_at": start_time,
+            "active_at": _now_ms(),
+        })
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def restore(self, session_id, checkpoint, latitudes=(), longitudes=(), timestamps=()):
+        """
+        Recreate a session from its last checkpoint (see route_chunks.checkpoint_document)
+        and the fixes of its last, incomplete route chunk.
+        """
+        key, route_key = self._keys(session_id)
+        mapping = {
+            "user_id": checkpoint["user_id"],
+            "start_time": checkpoint["start_time"],
+            "total_distance": checkpoint["total_distance"],
+            "steps": checkpoint["steps"],
+            "last_seq": checkpoint["last_seq"],
+            "flushed": checkpoint["flushed"],
+            "persisted": checkpoint["persisted"],
+            "checkpointed_at": checkpoint["checkpointed_at"],
+            "active_at": _now_ms(),
+        }
+        if checkpoint.get("last_latitude") is not None:
+            mapping["last_latitude"] = repr(checkpoint["last_latitude"])
+            mapping["last_longitude"] = repr(checkpoint["last_longitude"])
+        fixes = np.empty(len(timestamps), dtype=FIX_DTYPE)
+        fixes["latitude"], fixes["longitude"], fixes["timestamp"] = latitudes, longitudes, timestamps
+        pipe = self.redis.pipeline()
+        pipe.delete(key, route_key, self._claim_key(session_id))
+        pipe.hset(key, mapping=mapping)
+        if len(fixes):
+            pipe.set(route_key, fixes.tobytes(), ex=self.ttl)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def touch(self, session_id):
+        """Record activity of the session's client that stored no fix, e.g. a reconnect."""
+        from redis.exceptions import WatchError
+
+        key = self._keys(session_id)[0]
+        with self.redis.pipeline() as pipe:
+            try:
+                # a finished (deleted) session must not be recreated as a partial hash
+                pipe.watch(key)
+                if not pipe.exists(key):
+                    return
+                pipe.multi()
+                pipe.hset(key, "active_at", _now_ms())
+                pipe.execute()
+            except WatchError:
+                pass  # the session was updated or deleted meanwhile, either way it need not be touched
+
+    def claim(self, session_id, ttl=CLAIM_SECONDS):
+        """
+        Claim the right to finish a session; only the first caller within
+        `ttl` seconds, in any process, gets True.
+        """
+        return bool(self.redis.set(self._claim_key(session_id), os.getpid(), nx=True, ex=ttl))
+
+    def release(self, session_id):
+        """Give up a claim, e.g. because finishing the session failed."""
+        self.redis.delete(self._claim_key(session_id))
+
+    def get(self, session_id):
+        """Return the session without its route, or None."""
+        key, route_key = self._keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.hgetall(key)
+        pipe.strlen(route_key)
+        data, route_bytes = pipe.execute()
+        if not data:
+            return None
+        data = {_text(key): _text(value) for key, value in data.items()}
+        flushed = int(data.get("flushed", 0))
+        return {
+            "user_id": data["user_id"],
+            "start_time": int(data["start_time"]),
+            "total_distance": float(data["total_distance"]),
+            "steps": int(data["steps"]),
+            "last_seq": int(data.get("last_seq", -1)),
+            "flushed": flushed,
+            "persisted": int(data.get("persisted", 0)),
+            "points": flushed + route_bytes // FIX.size,
+            "checkpointed_at": int(data.get("checkpointed_at", data["start_time"])),
+            "last_latitude": float(data["last_latitude"]) if "last_latitude" in data else None,
+            "last_longitude": float(data["last_longitude"]) if "last_longitude" in data else None,
+            "active_at": int(data.get("active_at", data.get("checkpointed_at", data["start_time"]))),
+        }
+
+    def add_point(self, session_id, latitude, longitude, timestamp):
+        """
+        Append a fix to the route and add the distance from the previous fix.
+
+        A session is only updated by its own client, so reading the last fix
+        and writing the new one need not be a single transaction.
+
+        Returns:
+            float: Metres added to the session, or None if the session does not exist
+        """
+        key, route_key = self._keys(session_id)
+        user_id, last_latitude, last_longitude = self.redis.hmget(key, "user_id", "last_latitude", "last_longitude")
+        if user_id is None:
+            return None
+        distance = 0.0
+        if last_latitude is not None:
+            distance = haversine_distance(latitude, longitude, float(last_latitude), float(last_longitude))
+
+        pipe = self.redis.pipeline()
+        pipe.append(route_key, FIX.pack(latitude, longitude, int(timestamp)))
+        pipe.hset(key, mapping={"last_latitude": repr(latitude), "last_longitude": repr(longitude),
+                                "active_at": _now_ms()})
+        pipe.hincrbyfloat(key, "total_distance", distance)
+        pipe.hincrby(key, "steps", int(distance / STEP_LENGTH_M))
+        pipe.expire(key, self.ttl)
+        pipe.expire(route_key, self.ttl)
+        pipe.execute()
+        return distance
+
+    def add_batch(self, session_id, seqs, latitudes, longitudes, timestamps):
+        """
+        Append a parsed location batch, skipping already accepted sequence numbers.
+
+        The session hash is watched, so a batch resent to another worker while
+        the first is being written is retried against the updated last_seq
+        instead of being counted twice.
+
+        Returns:
+            tuple: (metres added, last accepted sequence number), or None if
+            the session does not exist
+        """
+        from redis.exceptions import WatchError
+
+        key, route_key = self._keys(session_id)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    user_id, last_latitude, last_longitude, last_seq = pipe.hmget(
+                        key, "user_id", "last_latitude", "last_longitude", "last_seq"
+                    )
+                    if user_id is None:
+                        return None
+                    last_seq = int(last_seq) if last_seq is not None else -1
+                    new_seqs, new_latitudes, new_longitudes, new_timestamps = _batch_after(
+                        last_seq, seqs, latitudes, longitudes, timestamps
+                    )
+                    if not len(new_seqs):
+                        pipe.unwatch()
+                        self.touch(session_id)
+                        return 0.0, last_seq
+                    previous = None
+                    if last_latitude is not None:
+                        previous = (float(last_latitude), float(last_longitude))
+                    distances = _batch_distances(previous, new_latitudes, new_longitudes)
+
+                    fixes = np.empty(len(new_seqs), dtype=FIX_DTYPE)
+                    fixes["latitude"], fixes["longitude"], fixes["timestamp"] = new_latitudes, new_longitudes, new_timestamps
+                    pipe.multi()
+                    pipe.append(route_key, fixes.tobytes())
+                    pipe.hset(key, mapping={
+                        "last_latitude": repr(float(new_latitudes[-1])),
+                        "last_longitude": repr(float(new_longitudes[-1])),
+                        "last_seq": int(new_seqs[-1]),
+                        "active_at": _now_ms(),
+                    })
+                    pipe.hincrbyfloat(key, "total_distance", float(distances.sum()))
+                    pipe.hincrby(key, "steps", int(np.floor(distances / STEP_LENGTH_M).sum()))
+                    pipe.expire(key, self.ttl)
+                    pipe.expire(route_key, self.ttl)
+                    pipe.execute()
+                    return float(distances.sum()), int(new_seqs[-1])
+                except WatchError:
+                    continue
+
+    def pending(self, session_id):
+        """
+        Return the fixes not yet checkpointed as (index of the first fix,
+        latitudes, longitudes, timestamps), the columns as numpy arrays.
+        """
+        key, route_key = self._keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.hget(key, "flushed")
+        pipe.get(route_key)
+        flushed, data = pipe.execute()
+        fixes = np.frombuffer(data or b"", dtype=FIX_DTYPE)
+        return int(flushed or 0), fixes["latitude"], fixes["longitude"], fixes["timestamp"]
+
+    def mark_checkpointed(self, session_id, drop, persisted, now_ms):
+        """
+        Record a checkpoint: the first `drop` buffered fixes (complete chunks)
+        are released and the first `persisted` fixes of the route are stored.
+        """
+        from redis.exceptions import WatchError
+
+        key, route_key = self._keys(session_id)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    # a session finished (deleted) meanwhile must not be recreated as a partial hash
+                    pipe.watch(key, route_key)
+                    if pipe.hget(key, "user_id") is None:
+                        pipe.unwatch()
+                        return
+                    remaining = (pipe.get(route_key) or b"")[drop * FIX.size:]
+                    pipe.multi()
+                    pipe.set(route_key, remaining, ex=self.ttl)
+                    pipe.hincrby(key, "flushed", drop)
+                    pipe.hset(key, mapping={"persisted": persisted, "checkpointed_at": now_ms})
+                    pipe.expire(key, self.ttl)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def delete(self, session_id):
+        self.redis.delete(*self._keys(session_id))
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def make_session_store(url=None):
+    """
+    Create the session store configured by SESSION_STORE_URL.
+
+    "memory" (default) keeps sessions in this process; a redis:// URL shares
+    them between processes; "fakeredis" uses an in-process fake Redis.
+    """
+    url = url or os.getenv("SESSION_STORE_URL", "memory")
+    if url == "memory":
+        return InMemorySessionStore()
+    if url == "fakeredis":
+        import fakeredis
+        return RedisSessionStore(fakeredis.FakeRedis())
+    import redis
+    return RedisSessionStore(redis.Redis.from_url(url))
@@ -0,0 +1,207 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+
+
+def _parse_map(value, convert):
+    # "location_update=0.01,login=1" -> {"location_update": 0.01, "login": 1.0}
+    result = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            result[name.strip()] = convert(setting.strip())
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "service": record.name,
+            "event": getattr(record, "event", None) or record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # records never leave the process, so they are formatted on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventLogger:
+    """
+    Structured event logger of one service.
+
+    Every record is an event name plus keyword fields. Per event name,
+    LOG_EVENT_LEVELS sets the minimum level that is emitted and LOG_SAMPLE
+    the fraction of records kept (sampled records carry `sample_rate`).
+    High-frequency events can instead be counted with `aggregate()` and are
+    then emitted as one `<event>.summary` record every LOG_AGGREGATE_SECONDS.
+    """
+
+    def __init__(self, logger, level, event_levels, sample_rates, aggregate_interval):
+        self.logger = logger
+        self.level = level
+        self.event_levels = event_levels
+        self.sample_rates = sample_rates
+        self.aggregate_interval = aggregate_interval
+        self._aggregates = defaultdict(lambda: defaultdict(float))
+        self._counts = defaultdict(int)
+        self._aggregate_lock = threading.Lock()
+        self._last_summary = time.monotonic()
+
+    def enabled(self, event, level=logging.INFO):
+        return level >= self.event_levels.get(event, self.level)
+
+    def log(self, level, event, exc_info=None, **fields):
+        if not self.enabled(event, level):
+            return
+        rate = self.sample_rates.get(event, 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        self.logger.log(level, event, exc_info=exc_info, extra={"event": event, "fields": fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        """Log an error with the traceback of the exception being handled."""
+        self.log(logging.ERROR, event, exc_info=sys.exc_info(), **fields)
+
+    def aggregate(self, event, **values):
+        """
+        Count an occurrence of a high-frequency event and sum its numeric values.
+
+        A summary with the count and sums since the previous summary is
+        logged at most once per LOG_AGGREGATE_SECONDS, from whichever call
+        finds the interval elapsed.
+        """
+        with self._aggregate_lock:
+            self._counts[event] += 1
+            sums = self._aggregates[event]
+            for name, value in values.items():
+                sums[name] += value
+            due = time.monotonic() - self._last_summary >= self.aggregate_interval
+        if due:
+            self.flush_aggregates()
+
+    def flush_aggregates(self):
+        """Log and reset the summaries of all aggregated events."""
+        with self._aggregate_lock:
+            counts, aggregates = self._counts, self._aggregates
+            self._counts = defaultdict(int)
+            self._aggregates = defaultdict(lambda: defaultdict(float))
+            elapsed = time.monotonic() - self._last_summary
+            self._last_summary = time.monotonic()
+        for event, count in counts.items():
+            self.info(f"{event}.summary", count=count, interval_s=round(elapsed, 1),
+                      per_second=round(count / elapsed, 2) if elapsed else None, **aggregates[event])
+
+
+_listener = None
+_listener_pid = None
+_handler = None
+_lock = threading.Lock()
+
+
+def _start_listener():
+    # one queue and writer thread per process; the thread does the blocking stdout writes
+    global _listener, _listener_pid, _handler
+    log_queue = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    if _handler is None:
+        _handler = DroppingQueueHandler(log_queue)
+    else:
+        _handler.queue = log_queue  # loggers created before a fork keep their handler
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
+
+
+def _restart_after_fork():
+    # the parent's writer thread does not exist in the child
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _start_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_logger(service):
+    """
+    Return the EventLogger of a service, configured from the environment:
+
+    LOG_LEVEL: minimum level (default INFO)
+    LOG_EVENT_LEVELS: per event minimum levels, e.g. "location_update=DEBUG,login=WARNING"
+    LOG_SAMPLE: per event sample rates, e.g. "location_update=0.01"
+    LOG_AGGREGATE_SECONDS: interval of aggregated event summaries (default 10)
+    LOG_QUEUE_SIZE: records buffered before new ones are dropped (default 10000)
+    """
+    with _lock:
+        if _listener_pid != os.getpid():
+            _start_listener()
+        logger = logging.getLogger(service)
+        if _handler not in logger.handlers:
+            logger.handlers = [_handler]
+            logger.propagate = False
+            logger.setLevel(logging.DEBUG)
+    event_logger = EventLogger(
+        logger,
+        level=LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        event_levels=_parse_map(os.getenv("LOG_EVENT_LEVELS"), lambda value: LEVELS[value.upper()]),
+        sample_rates=_parse_map(os.getenv("LOG_SAMPLE"), float),
+        aggregate_interval=float(os.getenv("LOG_AGGREGATE_SECONDS", "10")),
+    )
+    atexit.register(event_logger.flush_aggregates)
+    return event_logger
+
+
+def dropped_records():
+    """Number of records dropped in this process because the log queue was full."""
+    return _handler.dropped if _handler is not None and _listener_pid == os.getpid() else 0
@@ -1,11 +1,122 @@
+import json
+from itertools import islice
+
+from bson import json_util
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# documents per bulk_write; one round trip each, far below the 48 MB batch limit for typical documents
+BATCH_SIZE = 1000
+READ_CHUNK = 1 << 20
+
+
 def insert_data_to_mongo(db, json_data, collection):
-    return db[collection].insert_many(json_data).inserted_ids
-  
+    """Insert documents from any iterable, in batches of BATCH_SIZE. Returns the inserted ids."""
+    ids = []
+    for batch in batches(json_data, BATCH_SIZE):
+        ids.extend(db[collection].insert_many(batch).inserted_ids)
+    return ids
+
 def delete_all(db, collection):
     db[collection].delete_many({})
 
-def update(db, json_data, collection):
-    for item in json_data:
-        filter_query = {"_id": item["_id"]}
-        update_query = {"$set": item}
-        db[collection].update_one(filter_query, update_query, upsert=True)
\ No newline at end of file
+def update(db, json_data, collection, batch_size=BATCH_SIZE):
+    """Upsert documents by `_id` (`$set` of their fields), in unordered bulk writes."""
+    for batch in batches(json_data, batch_size):
+        write_batch(db[collection], batch, mode="merge")
+
+
+def batches(documents, size):
+    """Yield lists of up to `size` documents from an iterable, without reading it all."""
+    iterator = iter(documents)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_requests(batch, mode="merge", key="_id"):
+    """
+    Bulk write requests for a batch of documents.
+
+    Args:
+        mode (str): "insert" (new documents only), "replace" (upsert whole
+            documents) or "merge" (upsert with `$set` of the given fields)
+        key (str): Field that identifies a document for replace and merge
+    """
+    if mode == "insert":
+        return [InsertOne(doc) for doc in batch]
+    if mode == "replace":
+        return [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in batch]
+    if mode == "merge":
+        return [UpdateOne({key: doc[key]}, {"$set": doc}, upsert=True) for doc in batch]
+    raise ValueError(f"Unknown write mode: {mode}")
+
+
+def write_batch(collection, batch, mode="merge", key="_id"):
+    """
+    Write a batch with one unordered bulk_write; a failing document does not
+    stop the others.
+
+    Returns:
+        tuple: (documents written, documents that failed, e.g. duplicate keys
+            in insert mode or documents without `key` in replace and merge mode)
+    """
+    missing = 0
+    if mode != "insert":
+        complete = [doc for doc in batch if key in doc]
+        missing, batch = len(batch) - len(complete), complete
+    if not batch:
+        return 0, missing
+    try:
+        collection.bulk_write(write_requests(batch, mode, key), ordered=False)
+        return len(batch), missing
+    except BulkWriteError as e:
+        failed = len(e.details.get("writeErrors", []))
+        return len(batch) - failed, failed + missing
+
+
+def iter_json_file(path):
+    """
+    Stream the documents of a JSON file: a JSON array of objects, or one
+    object per line (NDJSON). Extended JSON such as {"$oid": ...} and
+    {"$date": ...} is converted to BSON types. Only one read chunk and the
+    current document are held in memory.
+    """
+    with open(path, encoding="utf-8") as f:
+        head = f.read(READ_CHUNK)
+        if head.lstrip().startswith("["):
+            yield from _iter_array(f, head)
+            return
+        lines = (head + f.readline()).splitlines()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line, object_hook=json_util.object_hook)
+        for line in f:
+            if line.strip():
+                yield json.loads(line, object_hook=json_util.object_hook)
+
+
+def _iter_array(f, buffer):
+    decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+    position = buffer.index("[") + 1
+    while True:
+        # skip separators; read more when the buffer ends before the next value
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            doc, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield doc
+        position = end
+        if position > READ_CHUNK:
+            buffer, position = buffer[position:], 0
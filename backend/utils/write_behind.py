@@ -0,0 +1,173 @@
+import atexit
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils.structured_log import get_logger
+
+log = get_logger("write-behind")
+
+
+class CounterAggregator:
+    """
+    Write-behind buffer for `$inc` updates on hot documents.
+
+    Increments for the same key are summed in memory and written with one
+    unordered `bulk_write` every `flush_interval` seconds, or as soon as
+    `max_pending` increments are buffered. Only increments are coalesced,
+    so the order in which they are applied does not matter.
+
+    Increments of a failed flush are put back and retried with the next
+    flush; after an ambiguous network error an increment may therefore be
+    applied twice, which is the price of not blocking requests on the write.
+    """
+
+    def __init__(self, get_collection, key_field="user_id", flush_interval=0.25,
+                 max_pending=500, on_flush=None):
+        self._get_collection = get_collection
+        self.key_field = key_field
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._thread_pid = None
+        # counters for the coalescing ratio
+        self.increments_received = 0
+        self.documents_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        # flushes that raised in the flusher thread, e.g. from on_flush
+        self.flush_errors = 0
+
+    def increment(self, key, inc):
+        """Buffer `{"$inc": inc}` for the document whose key field equals `key`."""
+        self._ensure_thread()
+        with self._lock:
+            counters = self._pending[key]
+            for field, value in inc.items():
+                counters[field] += value
+            self._pending_count += 1
+            self.increments_received += 1
+            full = self._pending_count >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered increments now. Returns the number of documents written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = defaultdict(lambda: defaultdict(int))
+                self._pending_count = 0
+
+            keys = list(batch)
+            requests = [UpdateOne({self.key_field: key}, {"$inc": dict(batch[key])}) for key in keys]
+            failed = []
+            try:
+                self._get_collection().bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                failed = [keys[error["index"]] for error in e.details.get("writeErrors", [])]
+            except Exception:
+                failed = keys
+            if failed:
+                self.failed_flushes += 1
+                self._requeue({key: batch[key] for key in failed})
+
+            failed = set(failed)
+            written = [key for key in keys if key not in failed]
+            self.flushes += 1
+            self.documents_written += len(written)
+            if self.on_flush and written:
+                self.on_flush(written)
+            return len(written)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for key, counters in batch.items():
+                pending = self._pending[key]
+                for field, value in counters.items():
+                    pending[field] += value
+                self._pending_count += 1
+
+    def _ensure_thread(self):
+        # the flusher thread is started lazily so it belongs to the process
+        # that uses the aggregator, not to a parent that later forks
+        if self._thread_pid == os.getpid() or self._stopped:
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.flush_errors += 1
+                log.exception("write_behind_flush_failed")
+
+    def stop(self, timeout=5):
+        """Stop the flusher thread and write everything still buffered."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            if not self.flush():
+                time.sleep(0.1)
+
+    def stats(self):
+        """Return the aggregator counters and the coalescing ratio."""
+        return {
+            "pending_keys": len(self._pending),
+            "pending_increments": self._pending_count,
+            "increments_received": self.increments_received,
+            "documents_written": self.documents_written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flush_errors": self.flush_errors,
+            # how many request level increments each document write absorbed
+            "coalescing_ratio": (self.increments_received / self.documents_written
+                                 if self.documents_written else None),
+        }
+
+
+def install_shutdown_hooks(aggregator):
+    """
+    Flush the aggregator at interpreter exit and on SIGTERM.
+
+    The SIGTERM handler wakes the flusher thread and hands over to the
+    previously installed handler (e.g. gunicorn's graceful worker shutdown),
+    or exits; the final flush then runs from atexit. Flushing inside the
+    handler itself could deadlock on a lock held by the interrupted thread.
+    """
+    atexit.register(aggregator.stop)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        aggregator._wakeup.set()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
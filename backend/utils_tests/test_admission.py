@@ -0,0 +1,87 @@
+import numpy as np
+from utils.admission import LocationAdmission
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_drops_duplicates_close_fixes_and_jitter():
+    admission = LocationAdmission(max_rate=0, min_distance=1, min_interval_ms=200, max_jitter=25)
+    assert admission.admit("s1", 43.6500, -79.38, 1000) is None
+    assert admission.admit("s1", 43.6500, -79.38, 1000) == "too_soon"
+    assert admission.admit("s1", 43.650001, -79.38, 2000) == "too_close"
+    # 11 and 17 m away, inside the 20 m accuracy radius, then 22 m away
+    assert admission.admit("s1", 43.6501, -79.38, 3000, accuracy=20) == "jitter"
+    assert admission.admit("s1", 43.65015, -79.38, 4000, accuracy=20) == "jitter"
+    assert admission.admit("s1", 43.6502, -79.38, 5000, accuracy=20) is None
+
+    assert admission.counters("s1") == {
+        "received": 6, "accepted": 2, "rate_limited": 0, "too_soon": 1, "too_close": 1, "jitter": 2,
+    }
+    assert admission.forget("s1")["received"] == 6
+    assert admission.counters("s1") is None
+    assert admission.stats()["totals"]["accepted"] == 2
+
+def test_token_bucket_bounds_accepted_rate():
+    clock = Clock()
+    admission = LocationAdmission(max_rate=2, burst=3, min_distance=0, min_interval_ms=0, clock=clock)
+    accepted = 0
+    # a client flooding 10 fixes per second for 5 seconds
+    for i in range(50):
+        clock.now = i / 10
+        if admission.admit("s1", 43.65 + i * 0.0001, -79.38, i * 100) is None:
+            accepted += 1
+
+    assert accepted == 3 + 9
+    assert admission.counters("s1")["rate_limited"] == 50 - accepted
+
+def batch(seqs, step=0.0001, interval=1000, accuracy=None):
+    seqs = np.array(seqs, dtype=np.int64)
+    accuracies = np.full(len(seqs), np.nan if accuracy is None else accuracy)
+    return seqs, 43.65 + seqs * step, np.full(len(seqs), -79.38), seqs * interval, accuracies
+
+def test_batched_fixes_pass_the_same_checks():
+    admission = LocationAdmission(max_rate=0, min_distance=1, min_interval_ms=200, max_jitter=25)
+    seqs, latitudes, longitudes, timestamps, accuracies = batch([0, 1, 2, 3])
+    # the second fix 100 ms after the first, the third 22 m away inside a 25 m accuracy radius
+    timestamps[1] = 100
+    accuracies[2] = 25
+
+    keep, dropped = admission.admit_batch("s1", seqs, latitudes, longitudes, timestamps, accuracies)
+    assert keep.tolist() == [True, False, False, True] and dropped == 2
+    assert admission.counters("s1") == {
+        "received": 4, "accepted": 2, "rate_limited": 0, "too_soon": 1, "too_close": 0, "jitter": 1,
+    }
+
+    # a resent batch is skipped without being counted
+    keep, dropped = admission.admit_batch("s1", seqs, latitudes, longitudes, timestamps, accuracies)
+    assert not keep.any() and dropped == 0
+    assert admission.counters("s1")["received"] == 4
+
+def test_batches_draw_from_the_token_bucket():
+    clock = Clock()
+    admission = LocationAdmission(max_rate=2, burst=3, batch_burst=20, min_distance=0, min_interval_ms=0,
+                                  clock=clock)
+    keep, dropped = admission.admit_batch("s1", *batch(range(100)))
+    assert keep.sum() == 3 and dropped == 97
+
+    # new sequence numbers as fast as possible get nothing more
+    keep, dropped = admission.admit_batch("s1", *batch(range(100, 200)))
+    assert keep.sum() == 0 and dropped == 100
+
+    # after a minute offline the buffered fixes are stored, up to the batch burst
+    clock.now = 60
+    keep, dropped = admission.admit_batch("s1", *batch(range(200, 300)))
+    assert keep.sum() == 20 and dropped == 80
+    # a live update right after gets no extra tokens
+    assert admission.admit("s1", 44.0, -79.38, 10**6) == "rate_limited"
+
+def test_batch_in_a_new_process_starts_with_the_tokens_earned_by_the_session():
+    admission = LocationAdmission(max_rate=2, burst=3, batch_burst=20, min_distance=0, min_interval_ms=0,
+                                  clock=Clock())
+    keep, _ = admission.admit_batch("s1", *batch(range(100)), age=5)
+    assert keep.sum() == 3 + 10
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+# app.py loads the YOLO classifier at import time
+pytest.importorskip("ultralytics")
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("a2wsgi")
+from starlette.testclient import TestClient
+
+os.environ.setdefault("JWT_SECRET_KEY", "asgi-test-secret-of-at-least-32-bytes")
+
+from utils.db import use_client
+
+use_client(mongomock.MongoClient())
+
+import asgi  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    # without the context manager the lifespan (inference pool) is not started
+    return TestClient(asgi.app)
+
+def auth(user_id="u1"):
+    return {"Authorization": f"Bearer {asgi.create_access_token(user_id)}"}
+
+def test_native_route_requires_a_token(client):
+    response = client.get("/api/user/data")
+    assert response.status_code == 401
+    assert response.json() == {"msg": "Missing Authorization Header"}
+
+    response = client.get("/api/user/data", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 422
+
+def test_native_route_accepts_an_access_token(client):
+    response = client.get("/api/user/data", headers=auth("u1"))
+
+    assert response.status_code == 200
+    assert response.json() == {"user_id": "u1"}
+
+def test_unknown_routes_fall_through_to_flask(client):
+    response = client.get("/health/db")
+
+    assert response.status_code == 200
+    assert response.json()["pid"] == os.getpid()
+
+def test_flask_accepts_tokens_issued_by_the_asgi_server(client):
+    response = client.get("/protected", headers=auth("u2"))
+    assert response.status_code == 200
+    assert response.json()["user_id"] == "u2"
+
+    assert client.get("/protected").status_code == 401
@@ -0,0 +1,29 @@
+import pytest
+from utils import codec
+
+msgpack = pytest.importorskip("msgpack")
+
+def test_round_trip_uses_short_field_codes():
+    payload = {"sessionId": "s1", "points": [{"seq": 1, "latitude": 43.65, "longitude": -79.38, "timestamp": 1000}],
+               "custom": {"totals": {"members": 2}}}
+    encoded = codec.encode(payload)
+
+    assert msgpack.unpackb(encoded) == {"s": "s1", "p": [{"q": 1, "a": 43.65, "o": -79.38, "t": 1000}],
+                                        "custom": {"z": {"M": 2}}}
+    assert codec.decode(encoded) == payload
+
+def test_codec_is_negotiated_per_connection():
+    codecs = codec.ConnectionCodecs()
+    codecs.connected("a", {"QUERY_STRING": "EIO=4&transport=websocket&codec=msgpack"})
+    codecs.connected("b", {}, auth={"token": "x"})
+    codecs.connected("c", {}, auth={"codec": "msgpack"})
+    assert [codecs.codec(sid) for sid in "abc"] == ["msgpack", "json", "msgpack"]
+
+    handler = codecs.event(lambda sid, data: {"lastSeq": data["points"][-1]["seq"]})
+    request = {"sessionId": "s1", "points": [{"seq": 7}]}
+    assert handler("b", request) == {"lastSeq": 7}
+    assert codec.decode(handler("a", codec.encode(request))) == {"lastSeq": 7}
+    assert codec.decode(handler("a", b"\xc1")) == {"error": "Invalid binary payload"}
+
+    codecs.disconnected("a")
+    assert codecs.encode_for("a", {"accepted": True}) == {"accepted": True}
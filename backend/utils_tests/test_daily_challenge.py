@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+
+import pytest
+from utils import daily_challenge, rollups
+
+mongomock = pytest.importorskip("mongomock")
+
+CHALLENGES = [
+    {"_id": f"c{i}", "name": f"Challenge {i}", "metric": "steps", "goal": 100, "points": 50}
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(daily_challenge, "_cached", (None, None))
+    db = mongomock.MongoClient().db
+    db.challenges.insert_many([dict(c) for c in CHALLENGES])
+    db.user.insert_one({"user_id": "u1", "total_points": 0})
+    return db
+
+def test_pick_index_is_deterministic_and_in_range():
+    days = [f"2025-04-{day:02d}" for day in range(1, 31)]
+    indexes = [daily_challenge.pick_index(day, 5) for day in days]
+
+    assert indexes == [daily_challenge.pick_index(day, 5) for day in days]
+    assert all(0 <= index < 5 for index in indexes)
+    assert len(set(indexes)) > 1
+
+def test_challenge_is_chosen_by_day(db):
+    challenge = daily_challenge.choose_challenge(db, "2025-04-12")
+
+    assert challenge["_id"] == f"c{daily_challenge.pick_index('2025-04-12', 5)}"
+    assert db.daily_challenge.count_documents({}) == 1
+
+def test_stored_challenge_stays_when_challenges_change(db):
+    first = daily_challenge.choose_challenge(db, "2025-04-12")
+    db.challenges.delete_many({})
+    db.challenges.insert_one({"_id": "other", "name": "Other"})
+
+    assert daily_challenge.choose_challenge(db, "2025-04-12") == first
+
+def test_first_writer_wins(db, monkeypatch):
+    # another worker stores its choice between our read and our insert
+    collection = db.daily_challenge
+    find_one = collection.find_one
+    reads = []
+
+    def racing_find_one(query, *args, **kwargs):
+        if not reads:
+            reads.append(query)
+            collection.insert_one({"_id": query["_id"], "challenge": {"_id": "winner"}})
+            return None
+        return find_one(query, *args, **kwargs)
+
+    monkeypatch.setattr(collection, "find_one", racing_find_one)
+
+    assert daily_challenge.choose_challenge(db, "2025-04-12") == {"_id": "winner"}
+
+def test_no_challenges(db):
+    db.challenges.delete_many({})
+
+    assert daily_challenge.get_daily_challenge(db) is None
+    # nothing is cached, so challenges added later are picked up the same day
+    db.challenges.insert_one(dict(CHALLENGES[0]))
+    assert daily_challenge.get_daily_challenge(db)["_id"] == "c0"
+
+def test_completion_is_awarded_once(db):
+    daily = rollups.record_activity(db, "u1", steps=60)
+    assert not daily_challenge.update_progress(db, "u1", daily)
+
+    daily = rollups.record_activity(db, "u1", steps=60)
+    assert daily_challenge.update_progress(db, "u1", daily)
+    # a concurrent update that read the same rollup before completion was recorded
+    assert not daily_challenge.update_progress(db, "u1", daily)
+
+    daily = rollups.record_activity(db, "u1", steps=60)
+    assert not daily_challenge.update_progress(db, "u1", daily)
+    assert db.user.find_one({"user_id": "u1"})["total_points"] == 50
+
+    challenge = daily_challenge.get_daily_challenge(db)
+    state = daily_challenge.progress(challenge, daily)
+    assert state == {"metric": "steps", "goal": 100, "value": 180, "completed": True}
+
+def test_completion_points_can_go_through_a_buffer(db):
+    buffered = []
+    daily = rollups.record_activity(db, "u1", steps=100)
+
+    assert daily_challenge.update_progress(db, "u1", daily, lambda user_id, inc: buffered.append((user_id, inc)))
+    assert buffered == [("u1", {"total_points": 50})]
+    assert db.user.find_one({"user_id": "u1"})["total_points"] == 0
+
+def test_activity_of_another_day_does_not_complete(db):
+    daily = rollups.record_activity(db, "u1", datetime(2020, 1, 1, tzinfo=timezone.utc), steps=500)
+
+    assert not daily_challenge.update_progress(db, "u1", daily)
+    assert db.user.find_one({"user_id": "u1"})["total_points"] == 0
+
+def test_progress_without_a_measurable_goal():
+    assert daily_challenge.progress({"_id": "c", "name": "Pick up litter"}, {"steps": 10}) is None
+    assert daily_challenge.progress(None, {}) is None
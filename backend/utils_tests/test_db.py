@@ -0,0 +1,110 @@
+import os
+
+import pytest
+from utils import db as db_module
+
+
+class FakeClient:
+    def __init__(self, uri=None, **options):
+        self.uri = uri
+        self.options = options
+
+    def __getitem__(self, name):
+        return FakeDatabase(name)
+
+
+class FakeDatabase:
+    def __init__(self, name):
+        self.name = name
+
+    def __getitem__(self, collection):
+        return f"{self.name}.{collection}"
+
+    def __getattr__(self, collection):
+        return f"{self.name}.{collection}"
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    monkeypatch.setattr(db_module, "MongoClient", FakeClient)
+    monkeypatch.setattr(db_module, "_client", None)
+    monkeypatch.setattr(db_module, "_client_pid", None)
+    monkeypatch.setattr(db_module, "_async_client", None)
+    monkeypatch.setattr(db_module, "_lock", db_module._lock)
+    for name in ("MONGO_URI", "MONGO_MAX_POOL_SIZE", "MONGO_COMPRESSORS", "MONGO_SOCKET_TIMEOUT_MS",
+                 "MONGO_TLS_CA_FILE", "MONGO_DB_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+def test_client_options_defaults_and_overrides(monkeypatch):
+    monkeypatch.delenv("MONGO_MAX_POOL_SIZE", raising=False)
+    monkeypatch.delenv("MONGO_SOCKET_TIMEOUT_MS", raising=False)
+    monkeypatch.delenv("MONGO_COMPRESSORS", raising=False)
+    options = db_module.client_options()
+    assert options["maxPoolSize"] == 50
+    assert options["event_listeners"] == [db_module.pool_listener]
+    # unset settings are left to pymongo's defaults
+    assert "socketTimeoutMS" not in options and "compressors" not in options
+
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "8")
+    monkeypatch.setenv("MONGO_SOCKET_TIMEOUT_MS", "10000")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "zstd,zlib")
+    options = db_module.client_options()
+    assert options["maxPoolSize"] == 8
+    assert options["socketTimeoutMS"] == 10000
+    assert options["compressors"] == "zstd,zlib"
+
+def test_srv_uri_defaults_to_certifi_ca(monkeypatch):
+    certifi = pytest.importorskip("certifi")
+    monkeypatch.delenv("MONGO_TLS_CA_FILE", raising=False)
+    monkeypatch.setenv("MONGO_URI", "mongodb+srv://cluster.example.net")
+
+    assert db_module.client_options()["tlsCAFile"] == certifi.where()
+
+def test_client_is_created_once_per_process(fake_client):
+    fake_client.setenv("MONGO_URI", "mongodb://db:27017")
+    fake_client.setenv("MONGO_MAX_POOL_SIZE", "5")
+
+    client = db_module.get_client()
+
+    assert db_module.get_client() is client
+    assert client.uri == "mongodb://db:27017"
+    assert client.options["maxPoolSize"] == 5
+
+def test_client_is_recreated_in_a_new_process(fake_client):
+    parent = db_module.get_client()
+    pid = os.getpid()
+    fake_client.setattr(db_module.os, "getpid", lambda: pid + 1)
+
+    child = db_module.get_client()
+
+    assert child is not parent
+    assert db_module.get_client() is child
+
+def test_reset_after_fork_drops_the_parent_client(fake_client):
+    db_module.get_client()
+    db_module.pool_listener._count("checkouts", in_use=1)
+    lock = db_module._lock
+
+    db_module._reset_after_fork()
+
+    assert db_module._client is None and db_module._async_client is None
+    assert db_module._lock is not lock
+    assert db_module.pool_listener.in_use == 0 and not db_module.pool_listener.counters
+
+def test_lazy_database_connects_on_first_use(fake_client):
+    lazy = db_module.LazyDatabase("Other")
+    assert db_module._client is None
+
+    assert lazy["user"] == "Other.user"
+    assert lazy.token_blacklist == "Other.token_blacklist"
+    assert db_module._client is not None
+    assert db_module.get_db().name == "PlogGo"
+    assert "Other" in repr(lazy)
+
+def test_use_client_replaces_the_connection(fake_client):
+    replacement = FakeClient("memory")
+    db_module.use_client(replacement)
+
+    assert db_module.get_client() is replacement
+    assert db_module.pool_stats()["connected"]
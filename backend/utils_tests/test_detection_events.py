@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+import pytest
+from pymongo import UpdateOne
+from utils import detection_events
+from utils.detection_events import DetectionEventBuffer, bucket_writes, make_events
+
+mongomock = pytest.importorskip("mongomock")
+
+class FakeModel:
+    version = "v2"
+    labels = ["Can", "Bottle"]
+
+AT = datetime(2025, 5, 1, 10, 30, tzinfo=timezone.utc)
+TORONTO = (43.65, -79.38)
+
+def test_events_are_compact_and_buckets_carry_class_totals():
+    events = make_events(FakeModel(), [(1.4, 2.6, 30, 40, 1, 0.87654)], TORONTO, at=AT)
+    assert events == [{"t": AT, "c": 1, "n": "Bottle", "p": 0.877, "b": [1, 3, 30, 40], "m": "v2",
+                       "l": [-79.38, 43.65]}]
+
+    writes = bucket_writes("u1", AT, (1, 2), events * 5, bucket_size=2)
+    assert len(writes) == 3
+    # a bucket only takes the chunk if all of it fits
+    assert writes[0] == UpdateOne(
+        {"user_id": "u1", "hour": AT, "x": 1, "y": 2, "count": {"$lte": 0}},
+        {"$push": {"events": {"$each": events * 2}},
+         "$inc": {"count": 2, "classes.Bottle.n": 2, "classes.Bottle.p": 0.877 * 2},
+         "$setOnInsert": {"z": detection_events.BUCKET_ZOOM}},
+        upsert=True,
+    )
+
+def test_buffered_events_are_aggregated_from_buckets():
+    db = mongomock.MongoClient().db
+    buffer = DetectionEventBuffer(lambda: db.detection_events, flush_interval=3600)
+    for _ in range(3):
+        buffer.record("u1", FakeModel(), [(0, 0, 10, 10, 0, 0.9), (0, 0, 10, 10, 1, 0.5)], TORONTO, at=AT)
+    buffer.record("u2", FakeModel(), [(0, 0, 10, 10, 0, 0.7)], at=AT.replace(day=2))
+    assert buffer.flush() == 7
+    # one bucket per user, hour and tile
+    assert db.detection_events.count_documents({}) == 2
+
+    start, end = detection_events.parse_range("2025-05-01", "2025-05-02", "day")
+    assert detection_events.class_counts_over_time(db, start, end) == [
+        {"period": "2025-05-01", "total": 6, "counts": {"Can": 3, "Bottle": 3}},
+        {"period": "2025-05-02", "total": 1, "counts": {"Can": 1}},
+    ]
+    [tile] = detection_events.class_counts_by_region(db, start, end, zoom=9)
+    assert tile["total"] == 6 and tile["confidence"] == {"Can": 0.9, "Bottle": 0.5}
+
+def test_regions_keep_the_busiest_tiles(monkeypatch):
+    db = mongomock.MongoClient().db
+    hour = AT.replace(minute=0)
+    db.detection_events.insert_many([
+        {"hour": hour, "user_id": "u1", "x": x, "y": 7, "classes": {"Can": {"n": x + 1, "p": 0.5 * (x + 1)}}}
+        for x in range(4)
+    ] + [{"hour": hour, "user_id": "u1", "x": None, "y": None, "classes": {"Can": {"n": 9, "p": 9}}}])
+    monkeypatch.setattr(detection_events, "MAX_TILES", 2)
+    start, end = detection_events.parse_range("2025-05-01", "2025-05-01", "day")
+
+    tiles = detection_events.class_counts_by_region(db, start, end)
+    assert [(tile["x"], tile["total"]) for tile in tiles] == [(3, 4), (2, 3)]
+    assert tiles[0]["counts"] == {"Can": 4} and tiles[0]["confidence"] == {"Can": 0.5}
+
+    with pytest.raises(ValueError):
+        detection_events.class_counts_by_region(db, start, end, zoom=-1)
+
+def test_parse_range_limits():
+    with pytest.raises(ValueError):
+        detection_events.parse_range("2025-01-01", "2025-03-01", "hour")
+    with pytest.raises(ValueError):
+        detection_events.parse_range("2025-01-01", "2025-01-01", "week")
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from utils.detection_metrics import DetectionMetrics, box_iou, match_predictions
+
+def test_box_iou():
+    iou = box_iou([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+    assert iou[0] == pytest.approx([1.0, 1 / 3, 0.0])
+
+def test_each_ground_truth_box_is_matched_once_per_class():
+    true_boxes, true_classes = [[0, 0, 10, 10]], [1]
+    pred_boxes = [[0, 0, 10, 10], [0, 0, 10, 9], [0, 0, 10, 10]]
+    correct = match_predictions(pred_boxes, [1, 1, 2], true_boxes, true_classes)
+    assert correct[:, 0].tolist() == [True, False, False]
+    # IoU 0.9 only counts up to the 0.90 threshold
+    assert match_predictions([[0, 0, 10, 9]], [1], true_boxes, true_classes)[0].tolist() == [True] * 9 + [False]
+
+def test_metrics_over_streamed_images():
+    metrics = DetectionMetrics(class_count=3)
+    for confidences, classes, boxes, true_classes, true_boxes in [
+        ([0.9, 0.3], [0, 0], [[0, 0, 10, 10], [50, 50, 60, 60]], [0], [[0, 0, 10, 10]]),
+        ([0.8], [1], [[0, 0, 10, 10]], [1, 0], [[0, 0, 10, 10], [40, 40, 50, 50]]),
+        ([], [], np.zeros((0, 4)), [2], [[0, 0, 5, 5]]),
+    ]:
+        correct = match_predictions(boxes, classes, true_boxes, true_classes)
+        metrics.add(confidences, classes, correct, true_classes)
+
+    results = metrics.results()
+    assert results["images"] == 3
+    assert results["classes"][0]["instances"] == 2 and results["classes"][0]["predictions"] == 2
+    assert results["classes"][0]["precision"] == 0.5 and results["classes"][0]["recall"] == 0.5
+    # a perfect class scores 0.995, as in ultralytics, so the numbers stay comparable
+    assert results["classes"][1]["ap50_95"] == pytest.approx(0.995)
+    assert results["classes"][2] == {"instances": 1, "predictions": 0, "precision": 0.0, "recall": 0.0,
+                                     "ap50": 0.0, "ap50_95": 0.0}
+    assert 0 < results["map50"] < 1
@@ -0,0 +1,40 @@
+from utils.group_rooms import GroupRooms
+
+def test_deltas_only_carry_changes():
+    groups = GroupRooms()
+    groups.join("g1", "sid1", "s1", "u1", "Ana")
+    snapshot = groups.join("g1", "sid2", "s2", "u2", None)
+    assert snapshot["members"] == [[0, "Ana", None, None, 0], [1, None, None, None, 0]]
+
+    groups.update("s1", 43.6500012, -79.3800049, 0.0)
+    groups.update("s1", 43.6501, -79.38, 11.1)
+    groups.update("s3", 43.0, -79.0, 5.0)  # not in a group
+    (group_id, delta), = groups.deltas()
+    assert group_id == "g1" and delta["tick"] == 1
+    assert delta["joined"] == [[0, "Ana"], [1, None]]
+    assert delta["positions"] == [[0, 43.6501, -79.38, 11]]
+    assert delta["totals"] == {"members": 2, "distance": 11}
+
+    assert groups.deltas() == []
+
+    groups.update("s2", 43.66, -79.39, 20.0)
+    groups.leave("sid1")
+    (_, delta), = groups.deltas()
+    assert delta == {"groupId": "g1", "tick": 2, "totals": {"members": 1, "distance": 20},
+                     "positions": [[1, 43.66, -79.39, 20]], "left": [0]}
+
+    groups.leave_session("s2")
+    groups.deltas()
+    assert groups.stats() == {"group_rooms": 0, "group_members": 0}
+
+
+def test_rejoin_from_a_new_connection_replaces_the_member():
+    groups = GroupRooms()
+    groups.join("g1", "sid1", "s1", "u1", "Ana")
+    assert groups.member_sid("g1", "u1") == "sid1"
+    assert groups.member_sid("g1", "u2") is None and groups.member_sid("g2", "u1") is None
+
+    groups.join("g1", "sid2", "s1", "u1", "Ana")
+    assert groups.member_sid("g1", "u1") == "sid2"
+    assert groups.leave("sid1") is None
+    assert groups.stats() == {"group_rooms": 1, "group_members": 1}
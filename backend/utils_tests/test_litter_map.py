@@ -0,0 +1,29 @@
+import pytest
+from utils import litter_map
+
+
+def test_tile_for_known_tile():
+    # Toronto city hall at zoom 12
+    assert litter_map.tile_for(43.6534, -79.3841, 12) == (1144, 1494)
+
+def test_tile_center_lies_in_tile():
+    x, y = litter_map.tile_for(43.6534, -79.3841, 15)
+    latitude, longitude = litter_map.tile_center(x, y, 15)
+
+    assert litter_map.tile_for(latitude, longitude, 15) == (x, y)
+
+def test_parse_location_is_optional():
+    assert litter_map.parse_location({}) is None
+    assert litter_map.parse_location({"latitude": "43.6", "longitude": -79.4}) == (43.6, -79.4)
+    with pytest.raises(ValueError):
+        litter_map.parse_location({"latitude": 43.6})
+    with pytest.raises(ValueError):
+        litter_map.parse_location({"latitude": 91, "longitude": 0})
+
+def test_bucket_zoom_stays_within_tile_budget():
+    world = litter_map.parse_bbox("-180,-85,180,85")
+    block = litter_map.parse_bbox("-79.40,43.65,-79.39,43.66")
+
+    assert litter_map.bucket_zoom(world, 18) == litter_map.TILE_ZOOMS[0]
+    assert litter_map.bucket_zoom(block, 16) == litter_map.TILE_ZOOMS[-1]
+    assert litter_map.bucket_zoom(block, 8) == 9
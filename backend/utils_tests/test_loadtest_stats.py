@@ -0,0 +1,19 @@
+from loadtest import stats
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+
+    assert stats.percentile(values, 50) == 50
+    assert stats.percentile(values, 99) == 99
+    assert stats.percentile([7], 95) == 7
+    assert stats.percentile([], 50) is None
+
+def test_compare_flags_regressions():
+    baseline = {"endpoints": {"a": {"p95_ms": 10.0}, "b": {"p95_ms": 10.0}}}
+    current = {"endpoints": {"a": {"p95_ms": 12.0}, "b": {"p95_ms": 10.5}, "c": {"p95_ms": 1.0}}}
+
+    rows = {row[0]: row for row in stats.compare(baseline, current, threshold=0.10)}
+
+    assert rows["a"][4] and not rows["b"][4]
+    assert rows["c"][3] is None and not rows["c"][4]
@@ -0,0 +1,26 @@
+import time
+from utils.loop_lag import LoopLagMonitor
+
+
+class Stop(Exception):
+    pass
+
+def test_records_how_late_the_loop_wakes_up():
+    delays = iter([0.0, 0.02, 0.005])
+
+    def sleep(seconds):
+        try:
+            time.sleep(seconds + next(delays))
+        except StopIteration:
+            raise Stop
+
+    monitor = LoopLagMonitor(sleep, interval=0.001)
+    assert monitor.stats()["samples"] == 0
+    try:
+        monitor.run()
+    except Stop:
+        pass
+
+    stats = monitor.stats()
+    assert stats["samples"] == 3
+    assert 20 <= stats["max_ms"] == stats["p99_ms"] < 100
@@ -0,0 +1,84 @@
+import itertools
+import os
+
+import pytest
+from utils import model_registry
+from utils.model_registry import ModelRegistry, read_manifest, rollout_bucket, write_manifest
+
+class FakeModel:
+    def __init__(self, version):
+        self.version = version
+
+def make_registry(tmp_path, loaded, fail=()):
+    def load(version, path):
+        if version in fail:
+            raise ValueError(f"cannot load {version}")
+        loaded.append(version)
+        return FakeModel(version)
+    return ModelRegistry(str(tmp_path), load=load, fallback=lambda: FakeModel("legacy"), poll_seconds=3600)
+
+MTIMES = itertools.count(10**18, 10**9)
+
+def bump(tmp_path, manifest):
+    write_manifest(str(tmp_path), manifest)
+    # a distinct mtime for every write, even on coarse filesystem clocks
+    mtime = next(MTIMES)
+    os.utime(tmp_path / model_registry.MANIFEST, ns=(mtime, mtime))
+
+def test_falls_back_without_a_manifest_then_swaps(tmp_path):
+    loaded = []
+    registry = make_registry(tmp_path, loaded)
+    assert registry.route("u1")[0].version == "legacy"
+
+    bump(tmp_path, {"active": "v1"})
+    registry.refresh()
+    served, result = registry.detect(lambda model: model.version, key="u1")
+    assert (served.version, result) == ("v1", "v1")
+
+    registry.refresh()  # unchanged manifest, nothing reloaded
+    assert loaded == ["v1"] and registry.stats()["swaps"] == 1
+
+def test_percent_rollout_is_stable_per_user_and_failed_loads_keep_serving(tmp_path):
+    loaded = []
+    bump(tmp_path, {"active": "v1", "candidate": {"version": "v2", "mode": "percent", "percent": 30}})
+    registry = make_registry(tmp_path, loaded, fail={"v3"})
+    users = [f"user-{n}" for n in range(200)]
+    versions = {user: registry.route(user)[0].version for user in users}
+    assert {user for user, version in versions.items() if version == "v2"} == \
+        {user for user in users if rollout_bucket(user) < 30}
+    assert versions == {user: registry.route(user)[0].version for user in users}
+
+    bump(tmp_path, {"active": "v3"})
+    registry.refresh()
+    assert registry.route("user-1")[0].version == versions["user-1"]
+    assert registry.stats()["load_failures"] == 1 and "v3" in registry.stats()["last_error"]
+
+def test_failed_load_is_retried_on_the_next_poll(tmp_path):
+    loaded, fail = [], {"v2"}
+    bump(tmp_path, {"active": "v1", "candidate": {"version": "v2", "mode": "percent", "percent": 100}})
+    registry = make_registry(tmp_path, loaded, fail=fail)
+    assert registry.route("u1")[0].version == "v1"
+
+    # the bundle becomes loadable without another manifest change
+    fail.clear()
+    registry.refresh()
+    assert registry.route("u1")[0].version == "v2"
+    assert loaded == ["v1", "v2"]
+
+    registry.refresh()
+    assert loaded == ["v1", "v2"] and registry.stats()["load_failures"] == 1
+
+def test_shadow_serves_the_active_version(tmp_path):
+    bump(tmp_path, {"active": "v1", "candidate": {"version": "v2", "mode": "shadow"}})
+    registry = make_registry(tmp_path, [])
+    model, result = registry.detect(lambda m: [m.version] * (1 if m.version == "v1" else 2),
+                                    summarize=lambda m, versions: len(versions))
+    assert model.version == "v1" and result == ["v1"]
+    registry._shadow_pool.shutdown(wait=True)
+    assert registry.stats()["shadow_runs"] == 1 and registry.stats()["shadow_disagreements"] == 1
+
+def test_manifest_validation(tmp_path):
+    assert read_manifest(str(tmp_path)) is None
+    write_manifest(str(tmp_path), {"active": "v1", "candidate": {"version": "v2", "mode": "percent", "percent": 101}})
+    with pytest.raises(ValueError):
+        read_manifest(str(tmp_path))
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from utils import profile_pictures
+
+
+def _jpeg(width, height):
+    out = BytesIO()
+    Image.new("RGB", (width, height), "green").save(out, "JPEG")
+    return out.getvalue()
+
+def test_thumbnails_are_square_at_every_size_and_format():
+    thumbnails = profile_pictures.make_thumbnails(_jpeg(1200, 800))
+
+    assert set(thumbnails) == {
+        (size, extension)
+        for size in profile_pictures.THUMBNAIL_SIZES
+        for extension, _, _ in profile_pictures.THUMBNAIL_FORMATS
+    }
+    body, content_type = thumbnails[(64, "webp")]
+    assert content_type == "image/webp"
+    assert Image.open(BytesIO(body)).size == (64, 64)
+
+def test_small_images_are_not_upscaled():
+    thumbnails = profile_pictures.make_thumbnails(_jpeg(100, 150))
+
+    body, _ = thumbnails[(512, "jpg")]
+    assert Image.open(BytesIO(body)).size == (100, 100)
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name in ("AWS_S3_ENDPOINT_URL", "AWS_S3_BUCKET_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_S3_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = profile_pictures.make_s3_client()
+        client.create_bucket(Bucket="pfp")
+        yield client
+
+@pytest.fixture
+def db():
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient().db
+    db.user.insert_one({"user_id": "u1"})
+    return db
+
+def test_upload_is_thumbnailed_and_set_as_pfp(s3, db):
+    requests = pytest.importorskip("requests")
+    upload = profile_pictures.create_upload(s3, "pfp", "u1")
+    response = requests.post(upload["url"], data=upload["fields"],
+                             files={"file": ("me.jpg", _jpeg(600, 400), "image/jpeg")})
+    assert response.status_code in (200, 204)
+
+    with pytest.raises(ValueError):
+        profile_pictures.enqueue_thumbnail_job(db, "u1", "uploads/profile_pics/u2/x")
+    profile_pictures.enqueue_thumbnail_job(db, "u1", upload["key"])
+    job = profile_pictures.claim_job(db)
+    assert job["status"] == "processing" and job["attempts"] == 1
+    assert profile_pictures.claim_job(db) is None
+
+    profile_pictures.process_job(db, s3, "pfp", job)
+
+    user = db.user.find_one({"user_id": "u1"})
+    pfp_key = user["pfp"].split(".amazonaws.com/", 1)[1]
+    assert pfp_key.endswith("/256.jpg")
+    body = s3.get_object(Bucket="pfp", Key=pfp_key)["Body"].read()
+    assert Image.open(BytesIO(body)).size == (256, 256)
+    assert set(user["pfp_sizes"]) == {"64", "256", "512"}
+    # the original upload is deleted
+    assert s3.list_objects_v2(Bucket="pfp", Prefix="uploads/")["KeyCount"] == 0
+    assert db.pfp_jobs.find_one({"_id": job["_id"]})["status"] == "done"
+
+def test_job_of_a_dead_worker_fails_after_the_last_attempt(db, monkeypatch):
+    profile_pictures.enqueue_thumbnail_job(db, "u1", "uploads/profile_pics/u1/x")
+    monkeypatch.setattr(profile_pictures, "JOB_LEASE", timedelta(0))
+
+    # every worker dies while holding the job, so its lease just expires
+    for attempt in range(1, profile_pictures.MAX_ATTEMPTS + 1):
+        assert profile_pictures.claim_job(db)["attempts"] == attempt
+    assert profile_pictures.claim_job(db) is None
+
+    job = db.pfp_jobs.find_one()
+    assert job["status"] == "failed" and job["attempts"] == profile_pictures.MAX_ATTEMPTS
@@ -0,0 +1,33 @@
+import cProfile
+import os
+import pstats
+from utils import profiling
+
+
+def _leaf():
+    return sum(i * i for i in range(20000))
+
+def _parent():
+    return _leaf() + _leaf()
+
+def test_collapsed_stacks_follow_call_paths():
+    profiler = cProfile.Profile()
+    profiler.runcall(_parent)
+    folded = profiling.collapsed_stacks(pstats.Stats(profiler))
+
+    leaf_stacks = [stack for stack in folded if stack.split(";")[-1].startswith("_leaf")]
+    assert leaf_stacks
+    assert all("_parent" in stack.split(";")[-2] for stack in leaf_stacks)
+    assert all(" " not in stack for stack in folded)
+
+def test_disk_limits_delete_oldest(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "MAX_FILES", 2)
+    for i in range(4):
+        path = tmp_path / f"{i}.prof"
+        path.write_text("x")
+        os.utime(path, (i, i))
+
+    profiling.enforce_disk_limits()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2.prof", "3.prof"]
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from flask import Flask
+from utils import response_cache
+from utils.response_cache import SHARED, ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put(("u1", "profile"), b"1")
+    cache.put(("u2", "profile"), b"2")
+    cache.get(("u1", "profile"))
+    cache.put(("u3", "profile"), b"3")
+
+    assert cache.get(("u2", "profile")) is None
+    assert cache.get(("u1", "profile"))[1] == b"1"
+    assert cache.get(("u3", "profile"))[1] == b"3"
+    # the evicted key is gone from its scope too
+    assert "u2" not in cache._scopes
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=30)
+    cache.put(("u1", "metrics"), b"{}")
+
+    clock[0] += 29
+    assert cache.get(("u1", "metrics")) is not None
+    clock[0] += 2
+    assert cache.get(("u1", "metrics")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not cache._entries and not cache._scopes
+
+def test_invalidate_drops_only_that_scope():
+    cache = ResponseCache()
+    cache.put(("u1", "profile"), b"a")
+    cache.put(("u1", "metrics"), b"b")
+    cache.put(("u2", "profile"), b"c")
+    cache.put((SHARED, "leaderboard"), b"d")
+
+    cache.invalidate("u1")
+
+    assert cache.get(("u1", "profile")) is None
+    assert cache.get(("u1", "metrics")) is None
+    assert cache.get(("u2", "profile")) is not None
+    assert cache.get((SHARED, "leaderboard")) is not None
+
+def test_invalidate_user_drops_shared_responses(monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(response_cache, "cache", cache)
+    cache.put(("u1", "profile"), b"a")
+    cache.put((SHARED, "leaderboard"), b"b")
+
+    response_cache.invalidate_user("u1", shared=False)
+    assert cache.get((SHARED, "leaderboard")) is not None
+
+    response_cache.invalidate_user("u1")
+    assert cache.get((SHARED, "leaderboard")) is None
+
+def test_same_body_has_the_same_etag():
+    cache = ResponseCache()
+    assert cache.put(("u1", "a"), b"x") == cache.put(("u2", "b"), b"x")
+    assert cache.put(("u1", "a"), b"x") != cache.put(("u1", "a"), b"y")
+
+def test_cached_json_serves_304_for_a_matching_etag(monkeypatch):
+    monkeypatch.setattr(response_cache, "cache", ResponseCache())
+    app = Flask(__name__)
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"points": 5}, 200
+
+    with app.test_request_context():
+        first = response_cache.cached_json(("u1", "metrics"), build)
+    etag = first.get_etag()[0]
+    assert first.status_code == 200 and json.loads(first.get_data()) == {"points": 5}
+
+    with app.test_request_context(headers={"If-None-Match": f'"{etag}"'}):
+        second = response_cache.cached_json(("u1", "metrics"), build)
+    assert second.status_code == 304 and second.get_data() == b""
+    assert second.get_etag()[0] == etag
+
+    with app.test_request_context(headers={"If-None-Match": '"stale"'}):
+        third = response_cache.cached_json(("u1", "metrics"), build)
+    assert third.status_code == 200 and third.get_etag()[0] == etag
+    assert len(calls) == 1
+
+def test_cached_json_does_not_cache_errors(monkeypatch):
+    monkeypatch.setattr(response_cache, "cache", ResponseCache())
+    app = Flask(__name__)
+    results = [({"error": "User not found"}, 404), ({"points": 1}, 200)]
+
+    with app.test_request_context():
+        missing = response_cache.cached_json(("u1", "profile"), lambda: results.pop(0))
+        found = response_cache.cached_json(("u1", "profile"), lambda: results.pop(0))
+
+    assert missing.status_code == 404 and missing.get_etag() == (None, None)
+    assert found.status_code == 200 and not results
@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+
+import pytest
+from utils import rollups
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def make_db():
+    db = mongomock.MongoClient().db
+    db.user.insert_one({"user_id": "u1"})
+    return db
+
+def streak_of(db):
+    return db.user.find_one({"user_id": "u1"}, {"_id": 0, "streak": 1, "highest_streak": 1})
+
+def test_consecutive_days_extend_the_streak():
+    db = make_db()
+    for day in (1, 2, 3):
+        rollups.record_activity(db, "u1", datetime(2025, 4, day, 12), steps=10)
+    # a second session on the same day keeps it
+    rollups.record_activity(db, "u1", datetime(2025, 4, 3, 18), steps=10)
+
+    assert streak_of(db) == {"streak": 3, "highest_streak": 3}
+
+def test_gap_restarts_the_streak_and_keeps_the_highest():
+    db = make_db()
+    for day in (1, 2, 3, 5):
+        rollups.record_activity(db, "u1", datetime(2025, 4, day, 12), steps=10)
+    assert streak_of(db) == {"streak": 1, "highest_streak": 3}
+
+    # late activity for a day already passed is ignored
+    rollups.record_activity(db, "u1", datetime(2025, 4, 4, 12), steps=10)
+    assert streak_of(db) == {"streak": 1, "highest_streak": 3}
+
+    rollups.record_activity(db, "u1", datetime(2025, 4, 6, 12), steps=10)
+    assert streak_of(db) == {"streak": 2, "highest_streak": 3}
+
+def test_user_is_written_once_per_day(monkeypatch):
+    db = make_db()
+    writes = []
+    update_one = db.user.update_one
+
+    def counting_update_one(*args, **kwargs):
+        writes.append(args)
+        return update_one(*args, **kwargs)
+
+    monkeypatch.setattr(db.user, "update_one", counting_update_one)
+
+    for hour in (8, 12, 18):
+        daily = rollups.record_activity(db, "u1", datetime(2025, 4, 1, hour), steps=10)
+    rollups.record_activity(db, "u1", datetime(2025, 4, 2, 8), steps=10)
+
+    assert daily["records"] == 3 and daily["steps"] == 30
+    assert len(writes) == 2
+    assert streak_of(db) == {"streak": 2, "highest_streak": 2}
+
+def test_current_streak_lapses_after_a_missed_day():
+    user = {"streak": 4, "last_active_day": datetime(2025, 4, 6)}
+
+    assert rollups.current_streak(user, today=datetime(2025, 4, 7, 9)) == 4
+    assert rollups.current_streak(user, today=datetime(2025, 4, 8, 9)) == 0
+    assert rollups.current_streak({}) == 0
+
+def test_week_boundary_splits_weekly_rollups():
+    db = make_db()
+    # Sunday 2025-04-06 and Monday 2025-04-07 fall in different weeks
+    rollups.record_activity(db, "u1", datetime(2025, 4, 6, 23, tzinfo=timezone.utc), steps=100, points=2)
+    rollups.record_activity(db, "u1", datetime(2025, 4, 7, 1, tzinfo=timezone.utc), steps=50, points=1)
+    rollups.record_activity(db, "u1", datetime(2025, 4, 13, 12), steps=5)
+
+    weeks = rollups.fetch_series(db, "u1", datetime(2025, 3, 31), datetime(2025, 4, 13), "week")
+
+    assert [(w["week"], w["steps"], w["points"]) for w in weeks] == [
+        ("2025-03-31", 100, 2),
+        ("2025-04-07", 55, 1),
+    ]
+    assert streak_of(db) == {"streak": 1, "highest_streak": 2}
+
+def test_daily_series_is_oldest_first_with_zero_defaults():
+    db = make_db()
+    rollups.record_activity(db, "u1", datetime(2025, 4, 2, 8), steps=10, points=1)
+    rollups.record_activity(db, "u1", datetime(2025, 4, 1, 8), distance=1.5)
+    rollups.record_activity(db, "u1", datetime(2025, 4, 1, 9), distance=0.5, sessions=1)
+
+    days = rollups.fetch_series(db, "u1", datetime(2025, 4, 1), datetime(2025, 4, 2))
+
+    assert [d["day"] for d in days] == ["2025-04-01", "2025-04-02"]
+    assert days[0]["distance"] == 2.0 and days[0]["sessions"] == 1 and days[0]["steps"] == 0
+    assert days[1]["steps"] == 10
+
+def test_week_start_is_monday():
+    assert rollups.week_start(datetime(2025, 4, 6, 23)) == datetime(2025, 3, 31)
+    assert rollups.week_start(datetime(2025, 4, 7)) == datetime(2025, 4, 7)
+
+def test_parse_range():
+    assert rollups.parse_range("2025-04-01", "2025-04-30", "day") == (datetime(2025, 4, 1), datetime(2025, 4, 30))
+    # weekly ranges start on the Monday of the first week
+    assert rollups.parse_range("2025-04-03", "2025-04-30", "week")[0] == datetime(2025, 3, 31)
+
+    start, end = rollups.parse_range(None, "2025-04-30", "day")
+    assert (end - start).days == 29
+
+    for args in (("2025-04-30", "2025-04-01", "day"),
+                 ("2025/04/01", None, "day"),
+                 ("2024-01-01", "2025-04-30", "day"),
+                 ("2020-01-01", "2025-04-30", "week"),
+                 (None, None, "month")):
+        with pytest.raises(ValueError):
+            rollups.parse_range(*args)
@@ -0,0 +1,47 @@
+import pytest
+from datetime import datetime, timezone
+from bson import ObjectId
+from utils import session_history
+
+
+def test_cursor_round_trip():
+    session = {"_id": ObjectId(), "startTime": datetime(2025, 4, 12, 8, 30, tzinfo=timezone.utc)}
+
+    start_time, session_id = session_history.decode_cursor(session_history.encode_cursor(session))
+
+    assert start_time == session["startTime"]
+    assert session_id == session["_id"]
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        session_history.build_page_query("user", cursor="not-a-cursor")
+
+def test_page_query_starts_after_cursor():
+    session = {"_id": ObjectId(), "startTime": datetime(2025, 4, 12, tzinfo=timezone.utc)}
+
+    query = session_history.build_page_query("user", session_history.encode_cursor(session))
+
+    assert query["user_id"] == "user"
+    assert query["$or"][0] == {"startTime": {"$lt": session["startTime"]}}
+    assert query["$or"][1]["_id"] == {"$lt": session["_id"]}
+
+def test_page_size_is_clamped():
+    assert session_history.parse_page_size(None) == session_history.DEFAULT_PAGE_SIZE
+    assert session_history.parse_page_size("1000") == session_history.MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        session_history.parse_page_size("0")
+
+def test_sessions_without_start_time_are_skipped():
+    mongomock = pytest.importorskip("mongomock")
+
+    db = mongomock.MongoClient().db
+    db.plogging_session.insert_many(
+        [{"user_id": "user", "startTime": datetime(2025, 4, day)} for day in (1, 2, 3)]
+        + [{"user_id": "user"}, {"user_id": "user", "startTime": None}]
+    )
+
+    first, cursor = session_history.fetch_page(db, "user", limit=2)
+    second, last = session_history.fetch_page(db, "user", cursor, limit=2)
+
+    assert [s["startTime"][:10] for s in first + second] == ["2025-04-03", "2025-04-02", "2025-04-01"]
+    assert last is None
@@ -0,0 +1,112 @@
+from utils.session_reaper import SessionReaper, TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_timer_wheel_reschedules_and_expires():
+    clock = Clock()
+    wheel = TimerWheel(tick=1.0, slots=8, clock=clock)
+    wheel.schedule("a", 5)
+    wheel.schedule("b", 20)  # more than one revolution ahead
+    wheel.schedule("c", 3)
+    wheel.schedule("c", 30)  # pushed back without moving slots
+    wheel.cancel("a")
+
+    clock.now += 10
+    assert wheel.advance() == []
+    clock.now += 10
+    assert wheel.advance() == ["b"]
+    wheel.schedule("d", 50)
+    wheel.schedule("d", 2)  # brought forward
+    clock.now += 2
+    assert wheel.advance() == ["d"]
+    clock.now += 100
+    assert wheel.advance() == ["c"]
+    assert len(wheel) == 0
+
+def test_reaper_grace_period_and_reconnect():
+    clock = Clock()
+    reaped = []
+    reaper = SessionReaper(lambda session_id, sid: reaped.append((session_id, sid)),
+                           idle_seconds=60, grace_seconds=10, wheel=TimerWheel(clock=clock))
+    reaper.touch("sid1", "s1")
+    reaper.touch("sid2", "s2")
+    reaper.touch("sid3", "s3")
+    reaper.detach("sid1")
+    reaper.detach("sid2")
+    reaper.touch("sid4", "s2")  # reconnected within the grace period
+    reaper.finished("s3")
+    assert reaper.stats() == {"live": 2, "connected": 1, "disconnected": 1, "reaped": 0, "reap_failures": 0,
+                               "reap_retrying": 0}
+
+    clock.now += 11
+    assert reaper.run_once() == 1
+    assert reaped == [("s1", None)]
+    clock.now += 50
+    reaper.run_once()
+    assert reaped[-1] == ("s2", "sid4")
+    assert reaper.stats() == {"live": 0, "connected": 0, "disconnected": 0, "reaped": 2, "reap_failures": 0,
+                               "reap_retrying": 0}
+    assert reaper.sid_sessions == {}
+
+def test_deferred_session_is_rescheduled_with_its_connection():
+    clock = Clock()
+    calls = []
+
+    def reap(session_id, sid):
+        calls.append((session_id, sid))
+        if len(calls) == 1:
+            # active in another process since the deadline was set
+            reaper.reschedule(session_id, sid, 30)
+            return False
+
+    reaper = SessionReaper(reap, idle_seconds=60, grace_seconds=10, wheel=TimerWheel(clock=clock))
+    reaper.touch("sid1", "s1")
+    assert reaper.delay_for("sid1") == 60 and reaper.delay_for(None) == 10
+
+    clock.now += 61
+    assert reaper.run_once() == 0
+    assert reaper.stats()["connected"] == 1
+    clock.now += 31
+    assert reaper.run_once() == 1
+    assert calls == [("s1", "sid1"), ("s1", "sid1")]
+    assert reaper.stats()["reaped"] == 1
+
+def test_failed_reap_is_retried_with_backoff():
+    clock = Clock()
+    calls = []
+
+    def reap(session_id, sid):
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise RuntimeError("mongo unavailable")
+
+    reaper = SessionReaper(reap, idle_seconds=60, grace_seconds=10, wheel=TimerWheel(clock=clock),
+                           retry_seconds=5, retry_max_seconds=60)
+    reaper.touch("sid1", "s1")
+
+    for _ in range(80):
+        clock.now += 1
+        reaper.run_once()
+    assert calls == [1060, 1065, 1075]
+    assert reaper.stats()["reaped"] == 1 and reaper.stats()["reap_failures"] == 2
+    assert reaper.stats()["reap_retrying"] == 0 and len(reaper.wheel) == 0
+
+def test_failed_reap_keeps_the_connection():
+    clock = Clock()
+    reaper = SessionReaper(lambda session_id, sid: 1 / 0, idle_seconds=60, wheel=TimerWheel(clock=clock),
+                           retry_seconds=5, retry_max_seconds=20)
+    reaper.touch("sid1", "s1")
+    clock.now += 61
+    reaper.run_once()
+
+    assert reaper.session_sids == {"s1": "sid1"} and "s1" in reaper.wheel
+    assert [reaper.retry_delay(n) for n in range(4)] == [5, 10, 20, 20]
+    # the client came back: the backoff starts over
+    reaper.touch("sid1", "s1")
+    assert reaper.stats()["reap_retrying"] == 0
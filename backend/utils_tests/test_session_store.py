@@ -0,0 +1,127 @@
+import pytest
+from datetime import datetime
+from utils import route_chunks, session_store
+
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def store(request):
+    if request.param == "fakeredis":
+        pytest.importorskip("fakeredis")
+    return session_store.make_session_store(request.param)
+
+def test_store_accumulates_route_and_totals(store):
+    store.create("s1", "u1", 1000)
+    assert store.add_point("s1", 43.6500, -79.38, 1000) == 0.0
+    assert store.add_point("s1", 43.6510, -79.38, 2000) == pytest.approx(111.2, abs=0.1)
+
+    session = store.get("s1")
+    assert session["user_id"] == "u1" and session["start_time"] == 1000
+    assert session["steps"] == 138
+    offset, latitudes, longitudes, timestamps = store.pending("s1")
+    assert offset == 0
+    assert latitudes.tolist() == [43.65, 43.651]
+    assert longitudes.tolist() == [-79.38, -79.38]
+    assert timestamps.tolist() == [1000, 2000]
+
+    store.delete("s1")
+    assert "s1" not in store and store.get("s1") is None
+    assert store.add_point("s1", 43.65, -79.38, 3000) is None
+
+def test_serialize_route_matches_datetime_isoformat():
+    timestamps = [1760000000123, 1760000001000]
+    route = session_store.serialize_route([43.65, 43.651], [-79.38, -79.38], timestamps)
+
+    assert [point["timestamp"] for point in route] == [
+        datetime.fromtimestamp(ts / 1000).isoformat(timespec="milliseconds") for ts in timestamps
+    ]
+    assert route[1]["latitude"] == 43.651
+
+def test_location_batch_is_idempotent(store):
+    store.create("s1", "u1", 1000)
+    points = [{"seq": seq, "latitude": 43.65 + seq * 0.001, "longitude": -79.38, "timestamp": 1000 + seq}
+              for seq in (2, 0, 1, 1)]
+    batch = session_store.parse_location_batch(points, now_ms=0)
+    assert batch[0].tolist() == [0, 1, 2]
+
+    distance, last_seq = store.add_batch("s1", *batch[:4])
+    assert last_seq == 2 and distance == pytest.approx(222.4, abs=0.1)
+    assert store.add_batch("s1", *batch[:4]) == (0.0, 2)
+
+    more = session_store.parse_location_batch(points[:1] + [{"seq": 3, "latitude": 43.653, "longitude": -79.38}], now_ms=5)
+    distance, last_seq = store.add_batch("s1", *more[:4])
+    assert last_seq == 3 and distance == pytest.approx(111.2, abs=0.1)
+    session = store.get("s1")
+    assert session["steps"] == 3 * 138 and session["last_seq"] == 3
+    assert store.pending("s1")[3].tolist() == [1000, 1001, 1002, 5]
+
+def test_checkpoint_releases_complete_chunks(store, monkeypatch):
+    monkeypatch.setattr(route_chunks, "CHUNK_POINTS", 2)
+    store.create("s1", "u1", 0)
+    for i in range(5):
+        store.add_point("s1", 43.65 + i * 0.001, -79.38, i)
+    assert route_chunks.checkpoint_due(store.get("s1"), now_ms=1)
+
+    offset, latitudes, longitudes, timestamps = store.pending("s1")
+    docs = route_chunks.chunk_documents("s1", "u1", offset, latitudes, longitudes, timestamps)
+    assert [(doc["_id"], doc["timestamps"]) for doc in docs] == [
+        ("s1:000000", [0, 1]), ("s1:000001", [2, 3]), ("s1:000002", [4]),
+    ]
+
+    store.mark_checkpointed("s1", 4, 5, now_ms=10)
+    session = store.get("s1")
+    assert (session["flushed"], session["persisted"], session["points"]) == (4, 5, 5)
+    assert not route_chunks.checkpoint_due(session, now_ms=11)
+    assert store.pending("s1")[0] == 4 and store.pending("s1")[3].tolist() == [4]
+    # the distance continues from the last fix even though it was released
+    assert store.add_point("s1", 43.655, -79.38, 5) == pytest.approx(111.2, abs=0.1)
+
+def test_activity_is_recorded_for_other_processes(store, monkeypatch):
+    now = [1_000_000]
+    monkeypatch.setattr(session_store, "_now_ms", lambda: now[0])
+    store.create("s1", "u1", 1000)
+    assert store.get("s1")["active_at"] == 1_000_000
+
+    now[0] += 5000
+    store.add_point("s1", 43.65, -79.38, 2000)
+    assert store.get("s1")["active_at"] == 1_005_000
+
+    now[0] += 5000
+    store.touch("s1")
+    assert store.get("s1")["active_at"] == 1_010_000
+
+    now[0] += 5000
+    seqs, latitudes, longitudes, timestamps, _ = session_store.parse_location_batch(
+        [{"seq": 1, "latitude": 43.651, "longitude": -79.38}], 3000)
+    store.add_batch("s1", seqs, latitudes, longitudes, timestamps)
+    assert store.get("s1")["active_at"] == 1_015_000
+    # a resent batch adds nothing but is still activity
+    now[0] += 5000
+    store.add_batch("s1", seqs, latitudes, longitudes, timestamps)
+    assert store.get("s1")["active_at"] == 1_020_000
+
+    # touching a finished session does not bring it back
+    store.delete("s1")
+    store.touch("s1")
+    assert "s1" not in store
+
+def test_checkpoint_of_a_finished_session_does_not_recreate_it(store):
+    store.create("s1", "u1", 1000)
+    store.add_point("s1", 43.65, -79.38, 2000)
+    store.delete("s1")
+
+    store.mark_checkpointed("s1", 1, 1, now_ms=10)
+    assert "s1" not in store
+    assert store.get("s1") is None
+    if isinstance(store, session_store.RedisSessionStore):
+        assert store.redis.keys() == []
+
+def test_only_one_claim_finishes_a_session(store):
+    store.create("s1", "u1", 1000)
+
+    assert store.claim("s1")
+    assert not store.claim("s1")
+    store.release("s1")
+    assert store.claim("s1")
+    # a new or resumed session starts unclaimed
+    store.create("s1", "u1", 2000)
+    assert store.claim("s1")
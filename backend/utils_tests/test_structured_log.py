@@ -0,0 +1,65 @@
+import json
+import logging
+import queue
+from utils.structured_log import DroppingQueueHandler, EventLogger, JsonFormatter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(JsonFormatter().format(record)))
+
+
+def make_logger(**settings):
+    logger = logging.getLogger("test-structured-log")
+    handler = ListHandler()
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    options = {"level": logging.INFO, "event_levels": {}, "sample_rates": {}, "aggregate_interval": 3600}
+    options.update(settings)
+    return EventLogger(logger, **options), handler.lines
+
+def test_event_levels_and_sampling():
+    log, lines = make_logger(event_levels={"token_check": logging.DEBUG}, sample_rates={"noisy": 0.0, "half": 0.5})
+    log.debug("ignored")
+    log.debug("token_check", user_id="u1")
+    log.info("noisy")
+    for _ in range(200):
+        log.info("half")
+
+    assert lines[0]["event"] == "token_check" and lines[0]["user_id"] == "u1" and lines[0]["level"] == "debug"
+    sampled = [line for line in lines if line["event"] == "half"]
+    assert 50 < len(sampled) < 150
+    assert all(line["sample_rate"] == 0.5 for line in sampled)
+    assert not any(line["event"] in ("ignored", "noisy") for line in lines)
+
+def test_aggregate_emits_summaries():
+    log, lines = make_logger()
+    for distance in (1.5, 2.5, 4.0):
+        log.aggregate("location_update", distance=distance)
+    assert lines == []
+
+    log.flush_aggregates()
+    assert len(lines) == 1
+    assert lines[0]["event"] == "location_update.summary"
+    assert lines[0]["count"] == 3 and lines[0]["distance"] == 8.0
+
+    log.flush_aggregates()
+    assert len(lines) == 1
+
+def test_full_queue_drops_and_counts_records():
+    log_queue = queue.Queue(2)
+    handler = DroppingQueueHandler(log_queue)
+    logger = logging.getLogger("test-structured-log-dropping")
+    logger.handlers = [handler]
+    logger.propagate = False
+
+    for i in range(5):
+        logger.warning("record %d", i)
+
+    assert log_queue.qsize() == 2
+    assert handler.dropped == 3
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from seed import synthetic
+from utils import to_mongo
+
+DOCS = [{"_id": {"$oid": "5f2b" + "0" * 20}, "name": "a", "at": {"$date": "2025-01-01T00:00:00Z"}},
+        {"_id": "b", "nested": {"list": [1, 2, {"x": "]"}]}}]
+
+def test_iter_json_file_streams_arrays_and_ndjson(tmp_path, monkeypatch):
+    monkeypatch.setattr(to_mongo, "READ_CHUNK", 8)
+    array = tmp_path / "docs.json"
+    array.write_text(" [\n" + ",\n ".join(json.dumps(d) for d in DOCS) + "\n]\n")
+    ndjson = tmp_path / "docs.ndjson"
+    ndjson.write_text("\n".join(json.dumps(d) for d in DOCS) + "\n\n")
+
+    for path in (array, ndjson):
+        docs = list(to_mongo.iter_json_file(path))
+        assert docs[0]["_id"] == ObjectId("5f2b" + "0" * 20)
+        assert docs[0]["at"] == datetime(2025, 1, 1)
+        assert docs[1] == DOCS[1]
+
+def test_batches_and_write_requests():
+    assert [len(b) for b in to_mongo.batches(iter(range(7)), 3)] == [3, 3, 1]
+    doc = {"user_id": "u1", "name": "x"}
+    assert to_mongo.write_requests([doc], "replace", "user_id") == [ReplaceOne({"user_id": "u1"}, doc, upsert=True)]
+    assert to_mongo.write_requests([doc], "merge", "user_id") == [UpdateOne({"user_id": "u1"}, {"$set": doc}, upsert=True)]
+
+def test_documents_without_the_key_are_counted_as_failed():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.user
+    batch = [{"user_id": "u1"}, {"name": "no key"}, {"user_id": "u2"}]
+
+    assert to_mongo.write_batch(collection, batch, "replace", "user_id") == (2, 1)
+    assert to_mongo.write_batch(collection, batch[1:2], "merge", "_id") == (0, 1)
+    assert collection.count_documents({}) == 2
+
+def test_synthetic_data_is_deterministic():
+    first = list(synthetic.sessions(3, 5, per_user=2, seed=1, route_points=3))
+    again = list(synthetic.sessions(4, 5, per_user=2, seed=1, route_points=3))
+    assert first[2:] == again
+    assert first[0]["user_id"] == next(synthetic.users(3, 4, seed=1, password_hash="h"))["user_id"]
+    assert len({s["_id"] for s in first}) == 4
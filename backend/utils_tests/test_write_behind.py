@@ -0,0 +1,142 @@
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+from utils.write_behind import CounterAggregator
+
+
+class FakeCollection:
+    def __init__(self):
+        self.batches = []
+        self.fail_with = None
+
+    def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        if self.fail_with is not None:
+            error, self.fail_with = self.fail_with, None
+            raise error
+        self.batches.append([(r._filter, r._doc) for r in requests])
+
+
+def make_aggregator(collection, **kwargs):
+    # a long interval keeps the flusher thread out of the way, the tests flush themselves
+    return CounterAggregator(lambda: collection, flush_interval=3600, **kwargs)
+
+def test_increments_of_a_key_are_coalesced():
+    collection = FakeCollection()
+    flushed = []
+    aggregator = make_aggregator(collection, on_flush=flushed.append)
+    for _ in range(3):
+        aggregator.increment("u1", {"total_points": 5, "total_litters": 1})
+    aggregator.increment("u2", {"total_steps": 100})
+
+    assert aggregator.flush() == 2
+    assert collection.batches == [[
+        ({"user_id": "u1"}, {"$inc": {"total_points": 15, "total_litters": 3}}),
+        ({"user_id": "u2"}, {"$inc": {"total_steps": 100}}),
+    ]]
+    assert flushed == [["u1", "u2"]]
+    assert aggregator.flush() == 0
+
+def test_stats_report_the_coalescing_ratio():
+    aggregator = make_aggregator(FakeCollection())
+    assert aggregator.stats()["coalescing_ratio"] is None
+
+    for _ in range(6):
+        aggregator.increment("u1", {"total_points": 1})
+    aggregator.increment("u2", {"total_points": 1})
+    aggregator.increment("u2", {"total_points": 1})
+    assert aggregator.stats()["pending_keys"] == 2
+    assert aggregator.stats()["pending_increments"] == 8
+    aggregator.flush()
+
+    stats = aggregator.stats()
+    assert stats["increments_received"] == 8
+    assert stats["documents_written"] == 2
+    assert stats["coalescing_ratio"] == 4
+    assert stats["pending_increments"] == 0
+
+def test_failed_writes_of_a_bulk_write_are_requeued_once():
+    collection = FakeCollection()
+    flushed = []
+    aggregator = make_aggregator(collection, on_flush=flushed.append)
+    aggregator.increment("u1", {"total_points": 5})
+    aggregator.increment("u2", {"total_points": 7})
+    collection.fail_with = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "x"}]})
+
+    assert aggregator.flush() == 1
+    assert flushed == [["u1"]]
+    assert aggregator.failed_flushes == 1
+
+    # the failed increment is retried together with newer ones, u1 is not written again
+    aggregator.increment("u2", {"total_points": 1})
+    assert aggregator.flush() == 1
+    assert collection.batches == [[({"user_id": "u2"}, {"$inc": {"total_points": 8}})]]
+    assert aggregator.stats()["documents_written"] == 2
+
+def test_whole_batch_is_requeued_after_a_network_error():
+    collection = FakeCollection()
+    aggregator = make_aggregator(collection)
+    aggregator.increment("u1", {"total_points": 5})
+    aggregator.increment("u2", {"total_points": 7})
+    collection.fail_with = AutoReconnect("connection reset")
+
+    assert aggregator.flush() == 0
+    assert aggregator.stats()["pending_keys"] == 2
+
+    assert aggregator.flush() == 2
+    assert collection.batches[0] == [
+        ({"user_id": "u1"}, {"$inc": {"total_points": 5}}),
+        ({"user_id": "u2"}, {"$inc": {"total_points": 7}}),
+    ]
+
+def test_full_buffer_wakes_the_flusher():
+    collection = FakeCollection()
+    aggregator = make_aggregator(collection, max_pending=3)
+    aggregator.increment("u1", {"total_points": 1})
+    aggregator.increment("u2", {"total_points": 1})
+    assert not aggregator._wakeup.is_set()
+
+    aggregator.increment("u1", {"total_points": 1})
+    deadline = time.monotonic() + 2
+    while not collection.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert collection.batches == [[({"user_id": "u1"}, {"$inc": {"total_points": 2}}),
+                                   ({"user_id": "u2"}, {"$inc": {"total_points": 1}})]]
+
+def test_flusher_errors_are_counted():
+    collection = FakeCollection()
+
+    def fail(user_ids):
+        raise RuntimeError("cache unavailable")
+
+    aggregator = make_aggregator(collection, max_pending=1, on_flush=fail)
+    aggregator.increment("u1", {"total_points": 1})
+    deadline = time.monotonic() + 2
+    while not aggregator.stats()["flush_errors"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert aggregator.stats()["flush_errors"] == 1
+    assert collection.batches == [[({"user_id": "u1"}, {"$inc": {"total_points": 1}})]]
+
+def test_stop_writes_what_is_buffered():
+    collection = FakeCollection()
+    aggregator = make_aggregator(collection)
+    aggregator.increment("u1", {"total_points": 3})
+
+    aggregator.stop(timeout=1)
+
+    assert collection.batches == [[({"user_id": "u1"}, {"$inc": {"total_points": 3}})]]
+    assert aggregator.stats()["pending_keys"] == 0
+
+def test_counters_add_up_on_mongo():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.user
+    collection.insert_many([{"user_id": "u1", "total_points": 10}, {"user_id": "u2", "total_points": 0}])
+    aggregator = make_aggregator(collection)
+    for points in (1, 2, 3):
+        aggregator.increment("u1", {"total_points": points})
+    aggregator.increment("u2", {"total_points": 4})
+
+    aggregator.flush()
+
+    assert {u["user_id"]: u["total_points"] for u in collection.find()} == {"u1": 16, "u2": 4}
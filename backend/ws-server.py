@@ -3,62 +3,128 @@ import eventlet
 import os
 import uuid
 import jwt
-from pymongo import MongoClient
 from dotenv import load_dotenv
-from datetime import datetime
-from utils.helper import haversine_distance
+from datetime import datetime, timezone
+from utils import rollups, daily_challenge, route_chunks
+from utils.admission import LocationAdmission
+from utils.codec import ConnectionCodecs, MSGPACK, encode
+from utils.group_rooms import GroupRooms, group_room, TICK_SECONDS as GROUP_TICK_SECONDS
+from utils.loop_lag import LoopLagMonitor
+from utils.profiling import SocketIOProfiler
+from utils.session_reaper import SessionReaper, REAP_MODE
+from utils.structured_log import dropped_records, get_logger
+from utils.session_store import make_session_store, parse_location_batch
+from utils.db import db, pool_stats
+import json
 # Load environment variables
 load_dotenv()
 
-# Initialize MongoDB connection
-uri = os.getenv("MONGO_URI")
-client = MongoClient(uri)
-db = client["PlogGo"]
+# MongoDB connection (utils.db) is created lazily on first use
 
 # JWT secret key - should match your auth server
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "default_secret_key")
 
-# Initialize SocketIO standalone server
-sio = socketio.Server(cors_allowed_origins="*")
-app = socketio.WSGIApp(sio)
+# JSON event logs, written to stdout by a background thread (LOG_* env variables)
+log = get_logger("ws-server")
 
-# In-memory session tracking
-sessions = {}
+# Initialize SocketIO standalone server. With SOCKETIO_MESSAGE_QUEUE (a redis:// URL)
+# several ws-server processes share rooms and emits; the load balancer must keep
+# each client on one process (sticky sessions) for the polling transport.
+message_queue = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+client_manager = socketio.RedisManager(message_queue) if message_queue else None
+sio = socketio.Server(cors_allowed_origins="*", client_manager=client_manager)
+
+def health_app(environ, start_response):
+    """
+    Serve connection pool utilization on /health/db, location admission counters
+    on /health/admission, live/reaped session gauges on /health/sessions,
+    event loop lag on /health/loop and log records dropped on /health/logging.
+    """
+    if environ.get("PATH_INFO") == "/health/db":
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps(pool_stats()).encode()]
+    if environ.get("PATH_INFO") == "/health/admission":
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps(admission.stats()).encode()]
+    if environ.get("PATH_INFO") == "/health/sessions":
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps({**reaper.stats(), **groups.stats()}).encode()]
+    if environ.get("PATH_INFO") == "/health/loop":
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps(loop_lag.stats()).encode()]
+    if environ.get("PATH_INFO") == "/health/logging":
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps({"dropped_records": dropped_records()}).encode()]
+    start_response("404 Not Found", [("Content-Type", "text/plain")])
+    return [b"Not Found"]
+
+app = socketio.WSGIApp(sio, health_app)
+
+# Live tracking sessions, in this process or shared through Redis (SESSION_STORE_URL)
+sessions = make_session_store()
+
+# Rate limiting and coalescing of location_update fixes per session (LOCATION_* env variables)
+admission = LocationAdmission()
+
+# JSON or MessagePack payloads, chosen by each client when it connects
+codecs = ConnectionCodecs()
+
+def emit(event, data, sid):
+    """Send an event to one connection in the payload codec it negotiated."""
+    sio.emit(event, codecs.encode_for(sid, data), room=sid)
+
+# Live maps of group plogging events, broadcast once per GROUP_TICK_SECONDS
+groups = GroupRooms()
+
+# How late the event loop runs background tasks, i.e. how long handlers block it
+loop_lag = LoopLagMonitor(sio.sleep)
+
+# sampled cProfile/tracemalloc capture of events (PROFILE_* env variables)
+profiler = SocketIOProfiler()
 
 @sio.event
-def connect(sid, environ):
-    """Handle new WebSocket connection."""
-    print(f"Client {sid} connected.")
+def connect(sid, environ, auth=None):
+    """
+    Handle new WebSocket connection. Clients opt in to MessagePack payloads
+    with `{"codec": "msgpack"}` auth data or a `codec=msgpack` query parameter.
+    """
+    profiler.connected(sid, environ)
+    codecs.connected(sid, environ, auth)
+    log.debug("connect", sid=sid, codec=codecs.codec(sid))
 
 @sio.event
 def disconnect(sid):
     """Handle WebSocket disconnection."""
-    print(f"Client {sid} disconnected.")
+    profiler.disconnected(sid)
+    # the session stays live for SESSION_DISCONNECT_GRACE_SECONDS so the client can reconnect
+    session_id = reaper.detach(sid)
+    groups.leave(sid)
+    codecs.disconnected(sid)
+    log.debug("disconnect", sid=sid, session_id=session_id)
 
 @sio.event
+@profiler.event
+@codecs.event
 def start_tracking(sid, data):
     """
     Start a tracking session, authenticate with JWT token.
     If user has an existing session ID, use it; otherwise generate a new one.
     """
-    print("Received start_tracking event")
-    
     # Get JWT token
     token = data.get("token")
     if not token:
-        sio.emit("error", {"message": "Missing authentication token"}, room=sid)
+        emit("error", {"message": "Missing authentication token"}, sid)
         return
     
     try:
         # Verify JWT token
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        print("payload", payload)
-        user_id = payload.get("jti")
-        # Find user in database
-        user = db.user.find_one({"_id": user_id})
+        # Find user in database; tokens issued by the API carry the user's uuid as subject
+        user = db.user.find_one({"user_id": payload.get("sub")}) or db.user.find_one({"_id": payload.get("jti")})
         if not user:
-            sio.emit("error", {"message": "User not found"}, room=sid)
+            emit("error", {"message": "User not found"}, sid)
             return
+        user_id = user["_id"]
         
         # Get existing session ID or generate a new one
         session_id = user.get("session_id")
@@ -68,84 +134,273 @@ def start_tracking(sid, data):
             session_id = str(uuid.uuid4())
             # Save session ID to user record
             db.user.update_one({"_id": user_id}, {"$set": {"session_id": session_id}})
-            print(f"Generated new session ID: {session_id}")
-        else:
-            print(f"Using existing session ID: {session_id}")
         
-        # Initialize session data
-        sessions[session_id] = {
-            "user_id": user_id,
-            "route": [],
-            "start_time": datetime.now(),
-            "end_time": None,
-            "total_distance": 0,
-            "steps": 0
-        }
+        # Initialize session data, unless the client reconnects to a session that is still live
+        # or was checkpointed before a restart
+        if session_id in sessions:
+            mode = "live"
+            # the last activity is shared with other processes' reapers (see reap_session)
+            sessions.touch(session_id)
+        elif route_chunks.resume(db, sessions, session_id):
+            mode = "checkpoint"
+        else:
+            sessions.create(session_id, user.get("user_id", str(user_id)), int(datetime.now().timestamp() * 1000))
+            mode = "new"
         
-        print(f"User {user_id} started tracking. Session: {session_id}")
+        reaper.touch(sid, session_id)
+        log.info("start_tracking", session_id=session_id, user_id=user.get("user_id", str(user_id)), mode=mode)
         
         # Send session ID back to client
-        sio.emit("session_id", {"sessionId": session_id}, room=sid)
+        emit("session_id", {"sessionId": session_id}, sid)
         
     except jwt.InvalidTokenError:
-        sio.emit("error", {"message": "Invalid authentication token"}, room=sid)
-    except Exception as e:
-        print(f"Error starting tracking: {str(e)}")
-        sio.emit("error", {"message": "Failed to start tracking"}, room=sid)
+        emit("error", {"message": "Invalid authentication token"}, sid)
+    except Exception:
+        log.exception("start_tracking_failed")
+        emit("error", {"message": "Failed to start tracking"}, sid)
+
+def checkpoint_if_due(session_id):
+    """Write buffered route fixes to Mongo once a chunk is full or the checkpoint interval passed."""
+    now_ms = int(datetime.now().timestamp() * 1000)
+    try:
+        session = sessions.get(session_id)
+        if session and route_chunks.checkpoint_due(session, now_ms):
+            route_chunks.checkpoint(db, sessions, session_id, now_ms)
+    except Exception:
+        # the fixes stay buffered and are written by the next checkpoint
+        log.exception("checkpoint_failed", session_id=session_id)
 
 @sio.event
+@profiler.event
+@codecs.event
 def location_update(sid, data):
-    """Handle real-time location updates."""
+    """
+    Handle real-time location updates.
+
+    Fixes pass per-session admission control before they are stored. The
+    acknowledgement says whether the fix was accepted, or why it was dropped.
+    """
     session_id = data.get("sessionId")
     latitude = data.get("latitude")
     longitude = data.get("longitude")
     timestamp = data.get("timestamp")
     
     if not session_id:
-        sio.emit("error", {"message": "Session ID is required"}, room=sid)
-        return
-    
-    if session_id not in sessions:
-        sio.emit("error", {"message": "Invalid session ID"}, room=sid)
+        emit("error", {"message": "Session ID is required"}, sid)
         return
     
     if latitude is None or longitude is None:
-        sio.emit("error", {"message": "Latitude and longitude are required"}, room=sid)
+        emit("error", {"message": "Latitude and longitude are required"}, sid)
         return
     
     try:
-        session = sessions[session_id]
+        latitude, longitude = float(latitude), float(longitude)
+        timestamp = int(timestamp) if timestamp else int(datetime.now().timestamp() * 1000)
+        reason = admission.admit(session_id, latitude, longitude, timestamp, data.get("accuracy"))
+        if reason is not None:
+            log.aggregate("location_dropped", **{reason: 1})
+            return {"accepted": False, "reason": reason}
         
-        # Add location to route
-        location_point = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "timestamp": datetime.fromtimestamp(timestamp / 1000) if timestamp else datetime.now()
-        }
+        # Add location to route; the store updates total distance and estimated steps
+        distance = sessions.add_point(session_id, latitude, longitude, timestamp)
+        if distance is None:
+            admission.forget(session_id)
+            emit("error", {"message": "Invalid session ID"}, sid)
+            return
         
-        session["route"].append(location_point)
+        reaper.touch(sid, session_id)
+        groups.update(session_id, latitude, longitude, distance)
+        log.aggregate("location_update", distance=distance)
+        checkpoint_if_due(session_id)
+        return {"accepted": True}
         
-        # Update total distance
-        if len(session["route"]) > 1:
-            prev_location = session["route"][-2]
-            distance = haversine_distance(
-                latitude, longitude,
-                prev_location["latitude"], prev_location["longitude"]
-            )
-            session["total_distance"] += distance
-            
-            # Estimate steps based on distance (approximately 0.8m per step)
-            session["steps"] += int(distance / 0.8)
-            
-            print(f"Location update for session {session_id}: {latitude}, {longitude}. Distance: +{distance:.2f}m, Total: {session['total_distance']:.2f}m")
-        else:
-            print(f"First location recorded for session {session_id}: {latitude}, {longitude}")
+    except Exception as e:
+        log.exception("location_update_failed", session_id=session_id)
+        emit("error", {"message": f"Failed to update location: {str(e)}"}, sid)
+
+@sio.event
+@profiler.event
+@codecs.event
+def location_batch(sid, data):
+    """
+    Handle a batch of buffered location updates.
+
+    Points carry a client sequence number; points at or below the last
+    accepted one are ignored, so a resent batch is only counted once. The
+    other points pass the same admission control as location_update, one by
+    one. The acknowledgement returns the last sequence number handled, so
+    the client can discard the batch, and how many points were dropped.
+    """
+    session_id = data.get("sessionId")
+    
+    if not session_id:
+        emit("error", {"message": "Session ID is required"}, sid)
+        return {"error": "Session ID is required"}
+    
+    now_ms = int(datetime.now().timestamp() * 1000)
+    try:
+        seqs, latitudes, longitudes, timestamps, accuracies = parse_location_batch(data.get("points"), now_ms)
+    except ValueError as e:
+        emit("error", {"message": str(e)}, sid)
+        return {"error": str(e)}
+    
+    try:
+        age = 0.0
+        if admission.counters(session_id) is None:
+            # first fixes of the session in this process: it may have been running elsewhere
+            session = sessions.get(session_id)
+            if session is None:
+                emit("error", {"message": "Invalid session ID"}, sid)
+                return {"error": "Invalid session ID"}
+            age = (now_ms - session["start_time"]) / 1000
+        keep, dropped = admission.admit_batch(session_id, seqs, latitudes, longitudes, timestamps, accuracies, age)
+        if dropped:
+            log.aggregate("location_batch_dropped", points=dropped)
+        
+        result = sessions.add_batch(session_id, seqs[keep], latitudes[keep], longitudes[keep], timestamps[keep])
+        if result is None:
+            admission.forget(session_id)
+            emit("error", {"message": "Invalid session ID"}, sid)
+            return {"error": "Invalid session ID"}
+        
+        distance, last_seq = result
+        reaper.touch(sid, session_id)
+        if keep.any():
+            groups.update(session_id, float(latitudes[keep][-1]), float(longitudes[keep][-1]), distance)
+        log.aggregate("location_batch", points=int(keep.sum()), distance=distance)
+        checkpoint_if_due(session_id)
+        return {"lastSeq": max(last_seq, int(seqs[-1])), "dropped": dropped}
         
     except Exception as e:
-        print(f"Error processing location update: {str(e)}")
-        sio.emit("error", {"message": f"Failed to update location: {str(e)}"}, room=sid)
+        log.exception("location_batch_failed", session_id=session_id)
+        emit("error", {"message": f"Failed to update location: {str(e)}"}, sid)
+        return {"error": "Failed to update location"}
+
+@sio.event
+@profiler.event
+@codecs.event
+def join_group(sid, data):
+    """
+    Join the live map of a group plogging event with a tracking session.
+    Only the connection tracking the session may join with it.
+
+    The acknowledgement is a full snapshot of the group; after that the
+    member receives `group_snapshot` events with the changes of each tick.
+    """
+    session_id = data.get("sessionId")
+    group_id = data.get("groupId")
+    
+    if not session_id or not group_id:
+        return {"error": "Session ID and group ID are required"}
+    
+    # only the connection tracking a session can put it on a group's live map
+    if reaper.session_sids.get(session_id) != sid:
+        return {"error": "Session is not tracked by this connection"}
+    session = sessions.get(session_id)
+    if session is None:
+        return {"error": "Invalid session ID"}
+    
+    group_id = str(group_id)
+    leave_group(sid)
+    try:
+        user = db.user.find_one({"user_id": session["user_id"]}, {"name": 1}) or {}
+        previous_sid = groups.member_sid(group_id, session["user_id"])
+        snapshot = groups.join(group_id, sid, session_id, session["user_id"], user.get("name"))
+    except ValueError as e:
+        return {"error": str(e)}
+    if previous_sid is not None and previous_sid != sid:
+        # the user rejoined from a new connection; the old one stops receiving snapshots
+        sio.leave_room(previous_sid, group_room(group_id, codecs.codec(previous_sid)))
+    sio.enter_room(sid, group_room(group_id, codecs.codec(sid)))
+    log.info("join_group", group_id=group_id, session_id=session_id, members=snapshot["totals"]["members"])
+    return snapshot
 
 @sio.event
+@profiler.event
+@codecs.event
+def leave_group(sid, data=None):
+    """Leave the group the connection joined."""
+    group_id = groups.leave(sid)
+    if group_id is not None:
+        sio.leave_room(sid, group_room(group_id, codecs.codec(sid)))
+    return {"groupId": group_id}
+
+def run_group_ticks():
+    """Background task broadcasting the changes of every group once per tick."""
+    while True:
+        sio.sleep(GROUP_TICK_SECONDS)
+        for group_id, payload in groups.deltas():
+            # members are split by codec so each snapshot is encoded once per room
+            sio.emit("group_snapshot", payload, room=group_room(group_id))
+            if codecs.binary_sids:
+                sio.emit("group_snapshot", encode(payload), room=group_room(group_id, MSGPACK))
+
+def complete_session(session_id, session, end_time):
+    """
+    Store the summary of a live session, add it to the user's rollups and
+    drop it from the live sessions.
+
+    Returns:
+        dict: Metrics of the stored session, as sent in tracking_completed
+    """
+    start_time = datetime.fromtimestamp(session["start_time"] / 1000)
+    
+    # Write the rest of the route to route_chunks, then a summary that references them,
+    # in the same shape as sessions stored through /api/end_session
+    points, chunks = route_chunks.finish(db, sessions, session_id, int(end_time.timestamp() * 1000))
+    session_data = {
+        "user_id": session["user_id"],
+        "session_key": session_id,
+        "startTime": datetime.fromtimestamp(session["start_time"] / 1000, tz=timezone.utc),
+        "endTime": datetime.fromtimestamp(end_time.timestamp(), tz=timezone.utc),
+        "elapsedTime": (end_time - start_time).total_seconds(),
+        "distancesTravelled": session["total_distance"],
+        "steps": session["steps"],
+        "point_count": points,
+        "route_chunks": chunks
+    }
+    
+    # Save to MongoDB
+    result = db['plogging_session'].insert_one(session_data)
+    
+    # Remove session ID from user document
+    db.user.update_one({"user_id": session["user_id"]}, {"$unset": {"session_id": ""}})
+    
+    # Calculate metrics
+    duration_seconds = (end_time - start_time).total_seconds()
+    steps = session["steps"]
+    
+    # Add the session to the user's daily and weekly rollups
+    daily = rollups.record_activity(
+        db, session["user_id"], end_time,
+        steps=steps,
+        distance=session["total_distance"],
+        time=duration_seconds,
+        sessions=1
+    )
+    daily_challenge.update_progress(db, session["user_id"], daily)
+    
+    # Clean up session
+    sessions.delete(session_id)
+    reaper.finished(session_id)
+    left = groups.leave_session(session_id)
+    if left is not None:
+        sio.leave_room(left[1], group_room(left[0], codecs.codec(left[1])))
+    
+    log.info("finish_tracking", session_id=session_id, user_id=session["user_id"], stored_id=str(result.inserted_id),
+             points=points, distance=session["total_distance"], duration=duration_seconds,
+             admission=admission.forget(session_id))
+    
+    return {
+        "duration": duration_seconds,
+        "distance": session["total_distance"] / 1000,
+        "steps": steps,
+        "session_id": str(result.inserted_id)
+    }
+
+@sio.event
+@profiler.event
+@codecs.event
 def finish_tracking(sid, data):
     """
     End a tracking session and save the collected data.
@@ -154,87 +409,136 @@ def finish_tracking(sid, data):
     session_id = data.get("sessionId")
     
     if not session_id:
-        sio.emit("error", {"message": "Session ID is required"}, room=sid)
+        emit("error", {"message": "Session ID is required"}, sid)
         return
     
-    if session_id not in sessions:
-        sio.emit("error", {"message": "Invalid session ID"}, room=sid)
+    session = sessions.get(session_id)
+    if session is None:
+        emit("error", {"message": "Invalid session ID"}, sid)
+        return
+    # with a shared session store another process may be reaping it right now
+    if not sessions.claim(session_id):
+        emit("error", {"message": "Session is already being completed"}, sid)
         return
     
     try:
-        # Set end time
-        sessions[session_id]["end_time"] = datetime.now()
-        
-        # Save session to database
-        session_data = sessions[session_id].copy()
-        
-        # Convert datetime objects to strings for MongoDB
-        if session_data["start_time"]:
-            session_data["start_time"] = session_data["start_time"].isoformat()
-        if session_data["end_time"]:
-            session_data["end_time"] = session_data["end_time"].isoformat()
-        
-        # Convert route timestamps to strings
-        for point in session_data["route"]:
-            if "timestamp" in point and isinstance(point["timestamp"], datetime):
-                point["timestamp"] = point["timestamp"].isoformat()
-        
-        # Save to MongoDB
-        result = db['plogging_session'].insert_one(session_data)
-        
-        # Remove session ID from user document
-        db.user.update_one({"_id": session_data["user_id"]}, {"$unset": {"session_id": ""}})
-        
-        # Calculate metrics
-        duration_seconds = (sessions[session_id]["end_time"] - sessions[session_id]["start_time"]).total_seconds()
-        distance_km = sessions[session_id]["total_distance"] / 1000
-        steps = sessions[session_id]["steps"]
-        
-        # Clean up session
-        del sessions[session_id]
-        
-        print(f"Session {session_id} completed and saved to database. ID: {result.inserted_id}")
+        metrics = complete_session(session_id, session, datetime.now())
         
         # Send completion response with metrics
-        sio.emit("tracking_completed", {
+        emit("tracking_completed", {
             "message": "Tracking session completed successfully",
-            "duration": duration_seconds,
-            "distance": distance_km,
-            "steps": steps,
-            "session_id": str(result.inserted_id)
-        }, room=sid)
+            **metrics
+        }, sid)
         
-    except Exception as e:
-        print(f"Error finishing tracking: {str(e)}")
-        sio.emit("error", {"message": "Failed to complete tracking session"}, room=sid)
+    except Exception:
+        sessions.release(session_id)
+        log.exception("finish_tracking_failed", session_id=session_id)
+        emit("error", {"message": "Failed to complete tracking session"}, sid)
+
+def reap_session(session_id, sid):
+    """
+    End a session that went idle or whose client did not come back
+    (SESSION_REAP_MODE): store it as if the client had finished it, or only
+    checkpoint it and free its memory so start_tracking can resume it later.
+
+    With a shared session store (SESSION_STORE_URL) the client may have moved
+    to another ws-server process, which this process's deadline knows nothing
+    about. A session active in the store since the deadline was set is put
+    back on the wheel instead, and a claim in the store lets only one process
+    end it.
+
+    Returns:
+        bool: False if this call did not end the session
+    """
+    claimed = False
+    try:
+        session = sessions.get(session_id)
+        if session is None:
+            # finished by its client or by another process
+            admission.forget(session_id)
+            return False
+        inactive = datetime.now().timestamp() - session["active_at"] / 1000
+        if inactive < reaper.delay_for(sid) - reaper.wheel.tick:
+            # a client tracking it elsewhere keeps it for the idle limit, as that process would
+            reaper.reschedule(session_id, sid, reaper.idle_seconds - inactive)
+            log.info("session_reap_deferred", session_id=session_id, inactive_s=round(inactive))
+            return False
+        if not sessions.claim(session_id):
+            return False
+        claimed = True
+        if REAP_MODE == "checkpoint":
+            route_chunks.checkpoint(db, sessions, session_id, int(datetime.now().timestamp() * 1000))
+            sessions.delete(session_id)
+            admission.forget(session_id)
+            left = groups.leave_session(session_id)
+            if left is not None:
+                sio.leave_room(left[1], group_room(left[0], codecs.codec(left[1])))
+            log.info("session_reaped", session_id=session_id, user_id=session["user_id"], mode=REAP_MODE)
+            return True
+        metrics = complete_session(session_id, session, datetime.now())
+        log.info("session_reaped", session_id=session_id, user_id=session["user_id"], mode=REAP_MODE)
+        if sid is not None:
+            emit("tracking_completed", {
+                "message": "Tracking session ended after inactivity",
+                **metrics
+            }, sid)
+        return True
+    except Exception:
+        if claimed:
+            sessions.release(session_id)
+        log.exception("session_reap_failed", session_id=session_id)
+        raise
+
+# Finalizes idle and abandoned sessions (SESSION_IDLE_SECONDS, SESSION_DISCONNECT_GRACE_SECONDS)
+reaper = SessionReaper(reap_session)
+
+def run_reaper():
+    """Background task advancing the reaper's timer wheel once per second."""
+    while True:
+        sio.sleep(reaper.wheel.tick)
+        reaper.run_once()
 
 # For backward compatibility with the current implementation
 @sio.event
+@profiler.event
+@codecs.event
 def authenticate(sid, data):
     """Legacy authentication method, redirects to start_tracking."""
-    print("Received legacy authenticate event, redirecting to start_tracking")
+    log.info("legacy_event", event_name="authenticate")
     start_tracking(sid, data)
 
 @sio.event
+@profiler.event
+@codecs.event
 def start_time(sid, data):
     """Legacy start_time event, now just acknowledges."""
-    session_id = data.get("sessionId")
-    if session_id in sessions:
-        print(f"Received legacy start_time event for session {session_id}")
-        sio.emit("time_started", {"startTime": int(sessions[session_id]["start_time"].timestamp() * 1000)}, room=sid)
+    session = sessions.get(data.get("sessionId"))
+    if session is not None:
+        log.info("legacy_event", event_name="start_time", session_id=data.get("sessionId"))
+        emit("time_started", {"startTime": session["start_time"]}, sid)
     else:
-        sio.emit("error", {"message": "Session not found"}, room=sid)
+        emit("error", {"message": "Session not found"}, sid)
 
 @sio.event
+@profiler.event
+@codecs.event
 def end_time(sid, data):
     """Legacy end_time event, redirects to finish_tracking."""
-    print("Received legacy end_time event, redirecting to finish_tracking")
+    log.info("legacy_event", event_name="end_time")
     finish_tracking(sid, data)
 
+def start_background_tasks():
+    """Start the session reaper, the group ticks and the loop lag monitor."""
+    sio.start_background_task(run_reaper)
+    sio.start_background_task(run_group_ticks)
+    sio.start_background_task(loop_lag.run)
+
 # Run WebSocket server
 if __name__ == "__main__":
     port = int(os.getenv("WS_PORT", 5001))
     host = os.getenv("WS_HOST", "0.0.0.0")
     
-    print(f"Starting Socket.IO server on {host}:{port}")
+    route_chunks.ensure_indexes(db)
+    start_background_tasks()
+    log.info("server_start", host=host, port=port)
     eventlet.wsgi.server(eventlet.listen((host, port)), app)